@@ -2,9 +2,12 @@
 # A bash script to run the Dedalus python code
 # Optionally takes in arguments:
 #	$ sh _run_exp.sh -n <name of experiment> <- not optional
-#				-c <cores>
+#				-c <cores, or auto to choose from the resolution>
 #				-l <local(1) or Niagara(0)>
 #				-v <version: what scripts to run>
+#				-e <periods to extend a finished run by, from its last checkpoint>
+#				-r <1 to resume a killed run from its newest checkpoint>
+#				-p <1 to encode the gif and mp4 while plotting, 0 to write pngs first>
 
 # Current datetime
 DATETIME=`date +"%Y-%m-%d_%Hh%M"`
@@ -23,7 +26,7 @@ DATETIME=`date +"%Y-%m-%d_%Hh%M"`
 # VER = 5
 #	-> run the script, merge
 
-while getopts n:c:l:v:k:x:z: option
+while getopts n:c:l:v:e:r:p:k:x:z: option
 do
 	case "${option}"
 		in
@@ -31,6 +34,9 @@ do
 		c) CORES=${OPTARG};;
 		l) LOC=${OPTARG};;
 		v) VER=${OPTARG};;
+		e) EXTEND=${OPTARG};;
+		r) RESUME=${OPTARG};;
+		p) STREAM=${OPTARG};;
 	esac
 done
 
@@ -59,6 +65,11 @@ then
 	VER=1
 	echo "-v, No version specified, using VER=$VER"
 fi
+if [ -z "$STREAM" ]
+then
+	STREAM=1
+	echo "-p, No frame streaming specified, using STREAM=$STREAM"
+fi
 
 # The directory in which this code is being run
 Project_directory="$(pwd)"
@@ -75,6 +86,8 @@ modules_p_dir='_modules_physics'
 snapshot_path="snapshots"
 # Name of merging file
 merge_file="${modules_o_dir}/merge.py"
+# Name of snapshot index file
+index_file="${modules_o_dir}/snapshot_index.py"
 # Name of plotting file
 plot_file="${modules_o_dir}/plot_slices.py"
 # Path to frames
@@ -85,6 +98,13 @@ gif_cre_file="${modules_o_dir}/create_gif.py"
 output_dir='outputs'
 # Name of write out params to log file script
 write_out_script='write_out_params.py'
+# Names of the gif and mp4
+gif_name="${output_dir}/${DATETIME}_${NAME}.gif"
+mp4_name="${DATETIME}_${NAME}.mp4"
+# Encode the gif (and the mp4 for VER=0) while plotting the frames, without
+#	writing pngs (-p 1), or write pngs and encode them afterwards (-p 0). The
+#	pngs are still written when extending a run, to only plot the new writes
+stream_frames=$STREAM
 
 ###############################################################################
 echo ''
@@ -128,12 +148,28 @@ echo ''
 echo '--Selecting physics modules--'
 if [ -e select_modules.py ]
 then
-	mpiexec -n $CORES python3 select_modules.py
+	if [ "$CORES" = "auto" ]
+	then
+		python3 select_modules.py
+	else
+		mpiexec -n $CORES python3 select_modules.py
+	fi
 	echo 'Modules selected'
 else
 	echo 'Module selection file not found'
 fi
 ###############################################################################
+# Choose the number of cores from the resolution, if asked to
+if [ "$CORES" = "auto" ]
+then
+	echo ''
+	echo '--Choosing number of cores--'
+	# Cores available: from the scheduler on Niagara, or on this machine
+	MAX_CORES=${SLURM_NTASKS:-$(nproc)}
+	CORES=$(python3 ${modules_o_dir}/mesh_planner.py --cores=$MAX_CORES --print-cores | tail -n 1)
+	echo "Using CORES=$CORES of $MAX_CORES available"
+fi
+###############################################################################
 # Create (or prepend) log file if running code
 #	if (VER = 0, 1, 2)
 LOG_FILE=LOG_${NAME}.txt
@@ -157,6 +193,13 @@ then
 	fi
 	LINE8="-v, Version of run = ${VER}"
 	LINE9=""
+	if [ ! -z "$EXTEND" ]
+	then
+		LINE9="-e, Extending the run by ${EXTEND} periods"
+	elif [ "$RESUME" = "1" ]
+	then
+		LINE9="-r, Resuming the run from its newest checkpoint"
+	fi
 	# This pre-pends the information to the log file
 	#	This way, the most recent run's information is at the top
 	echo -e "${LINE0}\n${LINE1}\n${LINE2}\n${LINE3}\n${LINE4}\n${LINE5}\n${LINE6}\n${LINE7}\n${LINE8}\n${LINE9}\n$(cat ${LOG_FILE})" > $LOG_FILE
@@ -179,18 +222,27 @@ if [ $VER -eq 0 ] || [ $VER -eq 1 ] || [ $VER -eq 2 ] || [ $VER -eq 5 ]
 then
 	echo ''
 	echo '--Running script--'
-	# Check if snapshots already exist. If so, remove them
-	if [ -e snapshots ]
+	# Check if snapshots or checkpoints already exist. If so, remove them,
+	#	unless resuming (-r 1) or extending (-e) the run from its checkpoints
+	if [ "$RESUME" != "1" ] && [ -z "$EXTEND" ]
 	then
-		echo "Removing old snapshots"
-		rm -rf snapshots
+		if [ -e snapshots ]
+		then
+			echo "Removing old snapshots"
+			rm -rf snapshots
+		fi
+		if [ -e checkpoints ]
+		then
+			echo "Removing old checkpoints"
+			rm -rf checkpoints
+		fi
 	fi
     # If running on local pc
     if [ $LOC -eq 1 ]
     then
         echo "Running Dedalus script for local pc"
         # mpiexec uses -n flag for number of processes to use
-        mpiexec -n $CORES python3 $code_file $switch_file
+        mpiexec -n $CORES python3 $code_file $switch_file $EXTEND
         echo ""
     fi
     # If running on Niagara
@@ -198,7 +250,7 @@ then
     then
         echo "Running Dedalus script for Niagara"
         # mpiexec uses -n flag for number of processes to use
-        mpiexec -n $CORES python3.6 $code_file $switch_file
+        mpiexec -n $CORES python3.6 $code_file $switch_file $EXTEND
         echo ""
     fi
 	echo 'Done running script'
@@ -220,33 +272,27 @@ then
 		echo "Cannot find snapshots. Aborting script"
 		exit 1
 	fi
-	# Check if snapshots have already been merged
-	if [ -e $snapshot_path/snapshots_s1.h5 ]
-	then
-		echo "Snapshots already merged"
-	else
-		echo "Merging snapshots"
-		mpiexec -n $CORES python3 $merge_file $snapshot_path
-	fi
+	# Only merge the sets which are not merged yet, such as the sets added by
+	#	extending the run. Sets written in parallel need no merging
+	echo "Merging snapshots"
+	mpiexec -n $CORES python3 $merge_file $snapshot_path --virtual --new
 	# Check if there are auxiliary snapshots to merge
 	for f in ${snapshot_path}/*; do
 		# Check if this file is a directory
 		if [ -d "$f" ]
 		then
-			# Build relevant file strings
-			aux_snap=${f#"${snapshot_path}/"}
-			merged_h5_file="${f}/${aux_snap}_s1.h5"
-			# Check to see if aux snapshots have already been merged
-			if [ -e $merged_h5_file ] || [ $f == "${snapshot_path}/snapshots_s1" ]
+			# Sets of the snapshots were merged above
+			if [[ $f != ${snapshot_path}/snapshots_s* ]]
 			then
-				echo "Already merged $f"
-			else
 				echo "Merging $f"
-				mpiexec -n $CORES python3 $merge_file $f
+				mpiexec -n $CORES python3 $merge_file $f --virtual --new
 			fi
 		fi
 	done
 	echo 'Done merging snapshots'
+	# Index the writes by write number and time, only reading new sets
+	echo "Indexing snapshots"
+	python3 $index_file $snapshot_path
 fi
 
 ###############################################################################
@@ -256,13 +302,39 @@ if [ $VER -eq 0 ] || [ $VER -eq 2 ] || [ $VER -eq 3 ]
 then
 	echo ''
 	echo '--Plotting frames--'
-	if [ -e frames ]
+	# When extending a run, keep the frames of the earlier writes
+	STREAMED=0
+	if [ -z "$EXTEND" ]
 	then
-		echo "Removing old frames"
-		rm -rf frames
+		if [ -e frames ]
+		then
+			echo "Removing old frames"
+			rm -rf frames
+		fi
+		if [ $stream_frames -eq 1 ]
+		then
+			# Encode the gif, and the mp4 for VER=0, as the frames are plotted
+			if [ ! -e $output_dir ]
+			then
+				echo "Creating $output_dir directory"
+				mkdir $output_dir
+			fi
+			STREAM_ARGS="--gif=$gif_name"
+			if [ $VER -eq 0 ]
+			then
+				STREAM_ARGS="$STREAM_ARGS --mp4=${output_dir}/${mp4_name}"
+			fi
+			echo "Plotting 2d slices into $STREAM_ARGS"
+			mpiexec -n $CORES python3 $plot_file $NAME $snapshot_path/snapshots_s*.h5 $STREAM_ARGS
+			STREAMED=1
+		else
+			echo "Plotting 2d slices"
+			mpiexec -n $CORES python3 $plot_file $NAME $snapshot_path/snapshots_s*.h5
+		fi
+	else
+		echo "Plotting 2d slices of the new writes"
+		mpiexec -n $CORES python3 $plot_file $NAME $snapshot_path/snapshots_s*.h5 --skip-existing
 	fi
-	echo "Plotting 2d slices"
-	mpiexec -n $CORES python3 $plot_file $NAME $snapshot_path/*.h5
 	echo 'Done plotting frames'
 fi
 
@@ -273,22 +345,24 @@ if [ $VER -eq 0 ] || [ $VER -eq 2 ] || [ $VER -eq 3 ]
 then
 	echo ''
 	echo '--Creating gif--'
-	gif_name="${output_dir}/${DATETIME}_${NAME}.gif"
 	# Check if output directory exists
 	if [ ! -e $output_dir ]
 	then
 		echo "Creating $output_dir directory"
 		mkdir $output_dir
 	fi
-	# Check if gis already exists
-	if [ -e $gif_name ]
+	# Check if gif already exists
+	if [ -e $gif_name ] && [ "$STREAMED" != "1" ]
 	then
 		echo "Overwriting $gif_name"
 		rm $gif_name
 	fi
 	#echo "${output_dir}/${DATETIME}_${NAME}.gif"
 	files=/$frames_path/*
-	if [ -e $frames_path ] && [ ${#files[@]} -gt 0 ]
+	if [ "$STREAMED" = "1" ]
+	then
+		echo "Gif encoded while plotting"
+	elif [ -e $frames_path ] && [ ${#files[@]} -gt 0 ]
 	then
 		echo "Executing gif script"
 		python3 $gif_cre_file $gif_name $frames_path
@@ -305,11 +379,13 @@ if [ $VER -eq 0 ] || [ $VER -eq 4 ]
 then
 	echo ''
 	echo '--Creating mp4--'
-	mp4_name="${DATETIME}_${NAME}.mp4"
 	# Check if frames exist
 	echo "Checking frames in ${frames_path}"
 	files=/$frames_path/*
-	if [ -e $frames_path ] && [ ${#files[@]} -gt 0 ]
+	if [ "$STREAMED" = "1" ]
+	then
+		echo "Mp4 encoded while plotting"
+	elif [ -e $frames_path ] && [ ${#files[@]} -gt 0 ]
 	then
 		echo "Executing mp4 command"
 		cd $frames_path/
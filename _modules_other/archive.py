@@ -0,0 +1,151 @@
+"""
+Error-bounded lossy archives of merged snapshot sets
+
+Each task is quantized to integer multiples of twice the error bound, so no
+value changes by more than the bound (up to rounding in the stored type).
+The integers are differenced along the last axis (z), which leaves small
+numbers for smooth fields, and stored in the smallest integer type that
+fits, with the shuffle and gzip filters. The archived files keep the layout
+of merged files (scales, dimension scales, and attributes), and open_task
+reads a task the same way from an archived or an ordinary file.
+
+Usage:
+    archive.py <files>... [--abs=<err>] [--rel=<err>] [--output=<dir>] [--level=<n>]
+
+Options:
+    --abs=<err>     # Absolute error bound, e.g. 1e-4 times the forcing amplitude
+    --rel=<err>     # Error bound relative to the largest absolute value of each task [default: 1e-4]
+    --output=<dir>  # Output directory [default: ./archive]
+    --level=<n>     # gzip level [default: 6]
+
+"""
+
+import pathlib
+import h5py
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+###############################################################################
+
+def integer_type(values):
+    # Smallest signed integer type holding all the values
+    lo, hi = (values.min(), values.max()) if values.size else (0, 0)
+    for dtype in [np.int8, np.int16, np.int32, np.int64]:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    raise ValueError("Quantized values do not fit in 64 bit integers")
+
+def encode(data, err):
+    """
+    Returns the quantized, differenced integers of an array and the
+    quantization step, for a maximum absolute error of err
+    """
+    step = 2.0 * err
+    q = np.rint(data / step).astype(np.int64)
+    d = np.diff(q, axis=-1, prepend=0)
+    return d.astype(integer_type(d)), step
+
+def decode(d, step, dtype):
+    # Inverse of encode, along the full last axis
+    return (np.cumsum(d, axis=-1, dtype=np.int64) * step).astype(dtype)
+
+class ArchivedDataset:
+    """
+    Reads an archived task like an h5py dataset, decoding the selection
+
+    dset    = archived h5py dataset
+    """
+
+    def __init__(self, dset):
+        self.dset = dset
+        self.step = dset.attrs['archive_step']
+        self.dtype = np.dtype(dset.attrs['archive_dtype'])
+        self.shape = dset.shape
+        self.ndim = dset.ndim
+        self.dims = dset.dims
+        self.attrs = dset.attrs
+        self.name = dset.name
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        # The differences are decoded along the whole last axis, then the
+        #   selection along the last axis is applied
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),)*(self.ndim - len(key) + 1) + key[i+1:]
+        key = key + (slice(None),)*(self.ndim - len(key))
+        data = decode(self.dset[key[:-1] + (slice(None),)], self.step, self.dtype)
+        return data[..., key[-1]]
+
+def open_task(file, name):
+    # A task of a snapshot file, decoded if the file is archived
+    dset = file['tasks'][name]
+    if 'archive_step' in dset.attrs:
+        return ArchivedDataset(dset)
+    return dset
+
+def attach_dims(dset, source):
+    # Label the dimensions and attach the same scales as the source dataset
+    for i, dim in enumerate(source.dims):
+        dset.dims[i].label = dim.label
+        for name, source_scale in dim.items():
+            scale = dset.file[source_scale.name]
+            scale.make_scale(name)
+            dset.dims[i].attach_scale(scale)
+
+def archive_file(path, out_path, abs_err=None, rel_err=None, level=6):
+    """
+    Writes an archived copy of a merged snapshot file
+
+    path        = merged snapshot file
+    out_path    = archived file to write
+    abs_err     = absolute error bound, used if given
+    rel_err     = error bound relative to the largest absolute value of each task
+    level       = gzip level
+    """
+    with h5py.File(str(path), mode='r') as file, h5py.File(str(out_path), mode='w') as out:
+        for key, val in file.attrs.items():
+            out.attrs[key] = val
+        file.copy('scales', out)
+        tasks = out.create_group('tasks')
+        for name, dset in file['tasks'].items():
+            data = dset[()]
+            if not np.all(np.isfinite(data)) or np.iscomplexobj(data):
+                # Cannot be quantized, keep it losslessly
+                logger.warning('Keeping task {} of {} without quantizing'.format(name, path))
+                archived = tasks.create_dataset(name, data=data, shuffle=True, compression='gzip', compression_opts=level)
+            else:
+                err = abs_err if abs_err is not None else rel_err * np.max(np.abs(data), initial=0)
+                if err <= 0:
+                    err = np.finfo(np.float32).tiny
+                d, step = encode(data, err)
+                chunks = (1,) + d.shape[1:] if d.ndim > 1 else True
+                archived = tasks.create_dataset(name, data=d, chunks=chunks, shuffle=True, compression='gzip', compression_opts=level)
+                archived.attrs['archive_step'] = step
+                archived.attrs['archive_error'] = err
+                archived.attrs['archive_dtype'] = str(data.dtype)
+            for key, val in dset.attrs.items():
+                if key not in ['DIMENSION_LIST', 'DIMENSION_LABELS']:
+                    archived.attrs[key] = val
+            attach_dims(archived, dset)
+
+if __name__ == "__main__":
+
+    from docopt import docopt
+    args = docopt(__doc__)
+    abs_err = float(args['--abs']) if args['--abs'] else None
+    rel_err = float(args['--rel'])
+    output = pathlib.Path(args['--output'])
+    output.mkdir(parents=True, exist_ok=True)
+    for path in map(pathlib.Path, args['<files>']):
+        out_path = output.joinpath(path.name)
+        archive_file(path, out_path, abs_err, rel_err, int(args['--level']))
+        size, out_size = path.stat().st_size, out_path.stat().st_size
+        print('{}: {:.1f} MB -> {:.1f} MB ({:.1f}x)'.format(path, size/1e6, out_size/1e6, size/out_size))
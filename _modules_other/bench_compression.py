@@ -0,0 +1,106 @@
+"""
+Benchmark the write cost and size of the snapshot compression options
+
+Writes the same snapshots with each chunking and compression option, the way
+the file handlers do (one write at a time, growing the time axis), and reports
+the write time, the file size, and the time to read back one write. The data
+is read from an existing snapshot file, or else is a synthetic wave field
+with small noise.
+    $ python3 _modules_other/bench_compression.py --file=snapshots/snapshots_s1.h5
+
+Usage:
+    bench_compression.py [--file=<file>] [--writes=<n>] [--nx=<n>] [--nz=<n>] [--vars=<n>] [--dir=<dir>]
+
+Options:
+    --file=<file>   # Snapshot file to take the data from
+    --writes=<n>    # Number of writes of each variable [default: 20]
+    --nx=<n>        # Grid points in x of the synthetic data [default: 256]
+    --nz=<n>        # Grid points in z of the synthetic data [default: 512]
+    --vars=<n>      # Number of variables of the synthetic data [default: 7]
+    --dir=<dir>     # Directory for the temporary files [default: .]
+
+"""
+
+import os
+import time
+import pathlib
+import h5py
+import numpy as np
+from docopt import docopt
+
+###############################################################################
+
+# Name: (chunk one write per chunk, dataset keywords)
+options = {'default':           (False, {}),
+           'chunked':           (True,  {}),
+           'gzip 1':            (True,  {'compression': 'gzip', 'compression_opts': 1}),
+           'shuffle + gzip 1':  (True,  {'compression': 'gzip', 'compression_opts': 1, 'shuffle': True}),
+           'shuffle + gzip 4':  (True,  {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}),
+           'lzf':               (True,  {'compression': 'lzf'}),
+           'shuffle + lzf':     (True,  {'compression': 'lzf', 'shuffle': True})}
+
+def synthetic_data(n_writes, nx, nz, n_vars):
+    # Plane waves with small noise, one array of writes per variable
+    x = np.linspace(0, 1, nx, endpoint=False)[:, None]
+    z = np.linspace(0, 1, nz)[None, :]
+    rand = np.random.RandomState(42)
+    data = {}
+    for v in range(n_vars):
+        writes = np.zeros((n_writes, nx, nz))
+        for i in range(n_writes):
+            writes[i] = np.sin(2*np.pi*(3*x + 2*z) - 0.3*i + v) * np.exp(-(z - 0.8)**2 / 0.02)
+        data['var{:d}'.format(v)] = writes + 1e-6*rand.standard_normal(writes.shape)
+    return data
+
+def file_data(filename, n_writes):
+    # Tasks of an existing snapshot file
+    with h5py.File(filename, mode='r') as file:
+        return {name: dset[:n_writes] for name, dset in file['tasks'].items() if dset.ndim > 1}
+
+def write_snapshots(filename, data, chunk_writes, kw):
+    # Writes one write of every variable at a time, growing the time axis
+    start_time = time.time()
+    with h5py.File(filename, mode='w') as file:
+        tasks = file.create_group('tasks')
+        dsets = {}
+        for name, writes in data.items():
+            shape = writes.shape[1:]
+            chunks = (1,) + shape if chunk_writes else True
+            # Starting with one write, as in the Dedalus file handler
+            dsets[name] = tasks.create_dataset(name, shape=(1,) + shape, maxshape=(None,) + shape,
+                                               dtype=writes.dtype, chunks=chunks, **kw)
+        n_writes = len(next(iter(data.values())))
+        for i in range(n_writes):
+            for name, writes in data.items():
+                if i > 0:
+                    dsets[name].resize(i + 1, axis=0)
+                dsets[name][i] = writes[i]
+    return time.time() - start_time
+
+def read_one_write(filename, index):
+    # Reads one time index of every variable, as when plotting a frame
+    start_time = time.time()
+    with h5py.File(filename, mode='r') as file:
+        for dset in file['tasks'].values():
+            dset[index]
+    return time.time() - start_time
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    n_writes = int(args['--writes'])
+    if args['--file']:
+        data = file_data(args['--file'], n_writes)
+    else:
+        data = synthetic_data(n_writes, int(args['--nx']), int(args['--nz']), int(args['--vars']))
+    raw_bytes = sum(writes.nbytes for writes in data.values())
+    n_writes = len(next(iter(data.values())))
+    filename = pathlib.Path(args['--dir']).joinpath('bench_compression_tmp.h5')
+
+    print('{:d} variables, {:d} writes, {:.1f} MB uncompressed'.format(len(data), n_writes, raw_bytes/1e6))
+    print('{:<18} {:>12} {:>10} {:>8} {:>14}'.format('Option', 'Write [s]', 'Size [MB]', 'Ratio', 'Read 1 [ms]'))
+    for name, (chunk_writes, kw) in options.items():
+        write_time = write_snapshots(str(filename), data, chunk_writes, kw)
+        size = os.path.getsize(str(filename))
+        read_time = read_one_write(str(filename), n_writes // 2)
+        print('{:<18} {:>12.3f} {:>10.1f} {:>8.2f} {:>14.2f}'.format(name, write_time, size/1e6, raw_bytes/size, 1e3*read_time))
+    os.remove(str(filename))
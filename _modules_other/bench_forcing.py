@@ -0,0 +1,69 @@
+"""
+Benchmark the per-step cost of the boundary forcing
+
+Builds the experiment's problem twice, once with the string substitutions of
+the boundary forcing file and once with the separable forcing (forcing.py),
+times the same number of steps with each, and compares the final states.
+Run from the experiment directory, for example:
+    $ mpiexec -n 2 python3 _modules_other/bench_forcing.py --steps=200
+
+Usage:
+    bench_forcing.py [--steps=<n>] [--warmup=<n>]
+
+Options:
+    --steps=<n>     # Number of timed steps [default: 100]
+    --warmup=<n>    # Untimed steps before timing, includes factorization [default: 10]
+
+"""
+
+import sys
+import time
+import numpy as np
+from mpi4py import MPI
+from docopt import docopt
+
+###############################################################################
+
+def time_forcing(core, sbp, separable, n_warmup, n_steps):
+    # Build a solver with the chosen forcing and time its steps
+    params = core.sweep.switchboard_namespace(sbp)
+    params.use_separable_forcing = separable
+    domain = core.build_domain(params)
+    solver = core.build_solver(core.build_problem(domain, params), params)
+    dt = params.dt
+    for i in range(n_warmup):
+        solver.step(dt)
+    comm = domain.dist.comm_cart
+    comm.Barrier()
+    start_time = time.time()
+    for i in range(n_steps):
+        solver.step(dt)
+    comm.Barrier()
+    step_time = (time.time() - start_time) / n_steps
+    w = solver.state['w']
+    w.set_scales(1)
+    return step_time, np.copy(w['g']), comm
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    n_steps = int(args['--steps'])
+    n_warmup = int(args['--warmup'])
+    # Run from the experiment directory, so the core code can find its modules
+    sys.path.insert(0, '.')
+    import core_code as core
+    sbp = core.sbp
+    if sbp.forcing_phases is None:
+        raise ValueError("Boundary forcing file has no separable form")
+
+    t_str, w_str, comm = time_forcing(core, sbp, False, n_warmup, n_steps)
+    t_sep, w_sep, comm = time_forcing(core, sbp, True, n_warmup, n_steps)
+
+    # Difference in the final states, relative to the forced response
+    max_diff = comm.allreduce(np.max(np.abs(w_sep - w_str)), op=MPI.MAX)
+    max_w    = comm.allreduce(np.max(np.abs(w_str)), op=MPI.MAX)
+    if comm.rank == 0:
+        print('Steps timed:                 {:d}'.format(n_steps))
+        print('String substitutions:        {:.3e} s/step'.format(t_str))
+        print('Separable forcing:           {:.3e} s/step'.format(t_sep))
+        print('Speedup:                     {:.2f}'.format(t_str/t_sep))
+        print('Max |w| difference:          {:.3e} (relative {:.3e})'.format(max_diff, max_diff/max_w))
@@ -0,0 +1,77 @@
+"""
+Benchmark of the two ways of drawing frames in plot_slices.py
+
+Draws writes of a task of a snapshot file with pcolormesh on the grid, then
+with imshow after resampling onto a uniform grid (plot_uniform = True in the
+switchboard), in the same figure. Reports the frames per second of each (the
+figure is drawn to memory, not saved), and how much the pixels of the two
+images differ, out of 255 for each color channel.
+
+Usage:
+    bench_render.py <file> [--task=<name>] [--frames=<n>] [--points=<n>] [--dpi=<dpi>]
+
+Options:
+    --task=<name>   # Task to draw [default: w]
+    --frames=<n>    # Number of writes to draw [default: 20]
+    --points=<n>    # Points of the uniform grid in z, n_z if not given
+    --dpi=<dpi>     # Resolution of the figure [default: 100]
+
+"""
+
+import time
+import h5py
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from docopt import docopt
+
+from plot_tools_mod import plot_bot_3d_mod, update_bot_3d_mod
+import archive
+import spectral_reader
+
+###############################################################################
+
+def render(dset, writes, dpi, **kw):
+    """
+    Draws the writes into one figure, returns the frames per second and the
+    pixels of the image of each write
+
+    dset    = dataset of the task
+    writes  = indices of the writes to draw
+    dpi     = resolution of the figure
+    Other keywords are passed to plot_bot_3d_mod
+    """
+    fig = plt.figure(figsize=(8, 4), dpi=dpi)
+    axes = fig.add_subplot(1, 1, 1)
+    paxes, caxes, plot = plot_bot_3d_mod(dset, 0, writes[0], axes=axes, title='', even_scale=True, **kw)
+    frames = []
+    start_time = time.time()
+    for index in writes:
+        update_bot_3d_mod(plot, dset, 0, index, even_scale=True)
+        fig.canvas.draw()
+        frames.append(np.asarray(fig.canvas.buffer_rgba())[..., :3].copy())
+    fps = len(writes) / (time.time() - start_time)
+    # Only the pixels inside the image axes
+    x0, y0, x1, y1 = np.round(paxes.get_window_extent().extents).astype(int)
+    height = frames[0].shape[0]
+    frames = [frame[height-y1:height-y0, x0:x1].astype(float) for frame in frames]
+    plt.close(fig)
+    return fps, frames
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    points = int(args['--points']) if args['--points'] else None
+    dpi = int(args['--dpi'])
+    with h5py.File(args['<file>'], mode='r') as file:
+        dset = archive.open_task(file, args['--task'])
+        if spectral_reader.is_coefficient(dset):
+            dset = spectral_reader.GridTask(file, dset)
+        writes = list(range(min(int(args['--frames']), dset.shape[0])))
+        mesh_fps, mesh_frames = render(dset, writes, dpi)
+        image_fps, image_frames = render(dset, writes, dpi, uniform=True, uniform_points=points)
+    diff = np.abs(np.array(mesh_frames) - np.array(image_frames))
+    print('{:d} writes of {} on a {} grid'.format(len(writes), args['--task'], 'x'.join(map(str, dset.shape[1:]))))
+    print('pcolormesh:       {:7.2f} frames/s'.format(mesh_fps))
+    print('imshow, uniform:  {:7.2f} frames/s ({:.1f}x)'.format(image_fps, image_fps / mesh_fps))
+    print('Pixel difference: mean {:.2f}, 99th percentile {:.1f}, max {:.0f} (of 255)'.format(diff.mean(), np.percentile(diff, 99), diff.max()))
@@ -0,0 +1,174 @@
+"""
+Benchmark the cost per forcing period of the Dedalus timesteppers
+
+For each timestepper, finds the largest stable timestep (as a whole number of
+steps per forcing period T) for the experiment's switchboard, then reports the
+wall time per period at that timestep and the error in the final state
+against a reference run with a small timestep. Run from the experiment
+directory, for example:
+    $ mpiexec -n 2 python3 _modules_other/bench_timesteppers.py --periods=2
+
+Usage:
+    bench_timesteppers.py [--steppers=<list>] [--periods=<n>] [--bisect=<n>] [--reference=<name>] [--ref-factor=<n>] [--output=<file>]
+
+Options:
+    --steppers=<list>   # Comma separated timesteppers to compare [default: RK111,RK222,RK443,SBDF2,SBDF3,CNAB2,MCNAB2]
+    --periods=<n>       # Forcing periods to integrate for each run [default: 2]
+    --bisect=<n>        # Maximum bisection steps on the steps per period [default: 6]
+    --reference=<name>  # Timestepper of the reference run [default: RK443]
+    --ref-factor=<n>    # Steps per period of the reference, relative to the switchboard dt [default: 4]
+    --output=<file>     # Optional JSON file for the results
+
+"""
+
+import sys
+import json
+import time
+import numpy as np
+from mpi4py import MPI
+from docopt import docopt
+
+###############################################################################
+
+def build(core, sbp, domain, name):
+    # Solver for the experiment's problem with the given timestepper
+    params = core.sweep.switchboard_namespace(sbp)
+    params.timestepper = name
+    return core.build_solver(core.build_problem(domain, params), params), params
+
+def integrate(core, solver, params, steps_per_period, n_periods):
+    """
+    Integrates from rest for n_periods forcing periods. Returns the wall time
+    per period and the final w, or (None, None) if the run blew up.
+    """
+    core.sweep.reset_solver(solver, core.get_timestepper(params))
+    comm = solver.domain.dist.comm_cart
+    dt = params.T / steps_per_period
+    w = solver.state['w']
+    comm.Barrier()
+    start_time = time.time()
+    for period in range(n_periods):
+        for i in range(steps_per_period):
+            solver.step(dt)
+        # Check once per period, a blown up run is stopped early
+        w.set_scales(1)
+        if not comm.allreduce(np.all(np.isfinite(w['g'])), op=MPI.LAND):
+            return None, None
+    comm.Barrier()
+    wall_per_period = (time.time() - start_time) / n_periods
+    w.set_scales(1)
+    return wall_per_period, np.copy(w['g'])
+
+def relative_error(w, w_ref, comm):
+    # Relative L2 difference over the whole grid
+    diff = comm.allreduce(np.sum((w - w_ref)**2), op=MPI.SUM)
+    norm = comm.allreduce(np.sum(w_ref**2), op=MPI.SUM)
+    return np.sqrt(diff / norm)
+
+def stability_test(core, solver, params, n_periods, w_ref, comm):
+    """
+    Returns a function of the steps per period, which integrates and returns
+    (wall time per period, final w), or None if the run is unstable: it blew
+    up, or its final w is further from the reference than the reference's
+    own size.
+    """
+    def stable(n):
+        wall, w = integrate(core, solver, params, n, n_periods)
+        if wall is None or relative_error(w, w_ref, comm) > 1.0:
+            return None
+        return wall, w
+    return stable
+
+def largest_stable(stable, n_start, n_max, n_bisect):
+    """
+    Finds the fewest steps per period for which the run is stable, starting
+    from n_start. Returns the steps per period and the result of stable for
+    it, or None if no run up to n_max steps per period is stable.
+
+    stable      = function of the steps per period, returning None if unstable
+    n_start     = steps per period to try first
+    n_max       = largest steps per period to try
+    n_bisect    = maximum bisection steps once the limit is bracketed
+    """
+    results = {}
+    n_stable, n_unstable = None, None
+    n = n_start
+    # Halve or double the steps per period to bracket the stability limit
+    while n_stable is None or n_unstable is None:
+        results[n] = stable(n)
+        if results[n] is not None:
+            n_stable = n
+            if n == 1:
+                break
+            n = max(1, n // 2)
+        else:
+            n_unstable = n
+            if n >= n_max:
+                break
+            n = min(n_max, 2*n)
+        if n in results:
+            break
+    if n_stable is None:
+        return None
+    # Bisect between the two
+    for i in range(n_bisect):
+        if n_unstable is None or n_stable - n_unstable <= 1:
+            break
+        n = (n_stable + n_unstable) // 2
+        results[n] = stable(n)
+        if results[n] is not None:
+            n_stable = n
+        else:
+            n_unstable = n
+    return n_stable, results[n_stable]
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    steppers = args['--steppers'].split(',')
+    n_periods = int(args['--periods'])
+    n_bisect = int(args['--bisect'])
+    # Run from the experiment directory, so the core code can find its modules
+    sys.path.insert(0, '.')
+    import core_code as core
+    sbp = core.sbp
+    domain = core.build_domain(sbp)
+    comm = domain.dist.comm_cart
+
+    # Reference run, with a small timestep
+    n_default = int(np.ceil(sbp.T / sbp.dt))
+    n_ref = int(args['--ref-factor']) * n_default
+    solver, params = build(core, sbp, domain, args['--reference'])
+    wall_ref, w_ref = integrate(core, solver, params, n_ref, n_periods)
+    if wall_ref is None:
+        raise ValueError("Reference run blew up, increase --ref-factor")
+
+    results = []
+    for name in steppers:
+        solver, params = build(core, sbp, domain, name)
+        stable = stability_test(core, solver, params, n_periods, w_ref, comm)
+        found = largest_stable(stable, n_default, n_ref, n_bisect)
+        result = {'timestepper': name}
+        if found is not None:
+            n, (wall, w) = found
+            result.update({'steps_per_period': n,
+                           'dt': sbp.T / n,
+                           'wall_per_period': wall,
+                           'error': float(relative_error(w, w_ref, comm))})
+        results.append(result)
+        del solver
+
+    if comm.rank == 0:
+        print('Reference: {} with {:d} steps/period, {:.3e} s/period'.format(args['--reference'], n_ref, wall_ref))
+        print('{:<10} {:>12} {:>12} {:>14} {:>12}'.format('Stepper', 'Steps/T', 'dt [s]', 'Wall/T [s]', 'Rel. error'))
+        for result in results:
+            if 'dt' in result:
+                print('{timestepper:<10} {steps_per_period:>12d} {dt:>12.4e} {wall_per_period:>14.4e} {error:>12.3e}'.format(**result))
+            else:
+                print('{:<10} {:>12}'.format(result['timestepper'], 'unstable'))
+        if args['--output']:
+            with open(args['--output'], 'w') as file:
+                json.dump({'periods': n_periods,
+                           'reference': {'timestepper': args['--reference'],
+                                         'steps_per_period': n_ref,
+                                         'wall_per_period': wall_ref},
+                           'results': results}, file, indent=4)
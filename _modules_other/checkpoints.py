@@ -0,0 +1,195 @@
+"""
+Periodic rotating checkpoints of the solver state
+
+A checkpoint is a directory holding one file per process with the local
+coefficient data of each state variable, plus a `meta.json` file written by
+the root process once every process has finished writing. A checkpoint
+without `meta.json` is incomplete (for example, the job was killed while
+writing it) and is ignored. Only the newest `keep` checkpoints are kept.
+
+Checkpoints can be loaded on any number of processes: each process reads the
+parts of the saved blocks that overlap with its own part of the domain. They
+are only loaded under the same physics: `meta.json` holds a hash of the
+switchboard and physics parameters, which must match that of the run.
+
+"""
+
+import json
+import time
+import shutil
+import pathlib
+
+import h5py
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+###############################################################################
+
+meta_name = 'meta.json'
+name_format = 'checkpoint_i{:09d}'
+
+def process_file(path, rank):
+    return path.joinpath('p{:d}.h5'.format(rank))
+
+def list_checkpoints(checkpoint_dir):
+    # Complete checkpoints, from oldest to newest
+    checkpoint_dir = pathlib.Path(checkpoint_dir)
+    if not checkpoint_dir.exists():
+        return []
+    paths = checkpoint_dir.glob(name_format.split('{')[0] + '*')
+    return sorted(path for path in paths if path.joinpath(meta_name).exists())
+
+def read_meta(path):
+    with open(str(pathlib.Path(path).joinpath(meta_name)), 'r') as file:
+        return json.load(file)
+
+def find_latest(checkpoint_dir, comm):
+    """
+    Returns the path and metadata of the newest complete checkpoint, or
+    (None, None) if there is none. Decided on the root process so that all
+    processes agree.
+    """
+    latest = (None, None)
+    if comm.rank == 0:
+        for path in reversed(list_checkpoints(checkpoint_dir)):
+            try:
+                latest = (str(path), read_meta(path))
+                break
+            except (OSError, ValueError):
+                logger.warning('Skipping unreadable checkpoint {}'.format(path))
+    return comm.bcast(latest, root=0)
+
+def clear(checkpoint_dir, comm):
+    # Remove old checkpoints before starting a new run
+    if comm.rank == 0:
+        shutil.rmtree(str(checkpoint_dir), ignore_errors=True)
+    comm.Barrier()
+
+def load_state(solver, path, meta, physics=None):
+    """
+    Loads the solver state from a checkpoint, returns the timestep
+
+    solver  = Dedalus initial value solver
+    path    = path of the checkpoint directory
+    meta    = metadata of the checkpoint, from find_latest
+    physics = hash of the parameters of the run, which must match the
+              checkpoint's, or None to skip the check
+    """
+    path = pathlib.Path(path)
+    layout = solver.domain.dist.coeff_layout
+    if list(layout.global_shape(scales=1)) != meta['global_shape']:
+        raise ValueError("Checkpoint {} does not match the grid resolution".format(path))
+    if physics is not None and meta.get('physics') != physics:
+        raise ValueError("Checkpoint {} was written with other switchboard or physics parameters, "
+                         "remove {} to start the run over".format(path, path.parent))
+    local_slices = layout.slices(scales=1)
+    local_start = np.array([sl.start for sl in local_slices])
+    local_stop = np.array([sl.stop for sl in local_slices])
+    for field in solver.state.fields:
+        field['c'] = 0
+    # Copy the overlap of each saved block with the local block
+    for rank, (start, count) in enumerate(meta['blocks']):
+        lo = np.maximum(local_start, start)
+        hi = np.minimum(local_stop, np.array(start) + np.array(count))
+        if np.any(hi <= lo):
+            continue
+        file_slices = tuple(slice(l-s, h-s) for l, h, s in zip(lo, hi, start))
+        field_slices = tuple(slice(l-s, h-s) for l, h, s in zip(lo, hi, local_start))
+        with h5py.File(str(process_file(path, rank)), mode='r') as file:
+            for field in solver.state.fields:
+                field['c'][field_slices] = file['tasks'][field.name][file_slices]
+    solver.sim_time = solver.initial_sim_time = meta['sim_time']
+    solver.iteration = solver.initial_iteration = meta['iteration']
+    logger.info('Loaded checkpoint {} at iteration {}, sim time {}'.format(path, meta['iteration'], meta['sim_time']))
+    return meta['dt']
+
+class Checkpointer:
+    """
+    Writes checkpoints every `iter` iterations and/or every `wall_dt` minutes
+    of wall time, keeping the newest `keep` checkpoints
+
+    solver          = Dedalus initial value solver
+    checkpoint_dir  = directory in which to write the checkpoints
+    iter            = iteration cadence (None to disable)
+    wall_dt         = wall time cadence in minutes (None to disable)
+    keep            = number of checkpoints to keep
+    check_cadence   = iterations between checks of the wall time, which
+                      need a broadcast from the root process
+    physics         = hash of the parameters of the run, stored in meta.json
+    """
+
+    def __init__(self, solver, checkpoint_dir, iter=None, wall_dt=None, keep=2, check_cadence=10, physics=None):
+        self.solver = solver
+        self.physics = physics
+        self.comm = solver.domain.dist.comm_cart
+        self.checkpoint_dir = pathlib.Path(checkpoint_dir)
+        self.iter = iter
+        self.wall_dt = None if wall_dt is None else wall_dt * 60.0
+        self.keep = max(1, keep)
+        self.check_cadence = check_cadence
+        self.last_write_time = time.time()
+        self.last_iteration = solver.iteration
+
+    def due(self):
+        iteration = self.solver.iteration
+        if self.iter and (iteration % self.iter == 0):
+            return True
+        if self.wall_dt and (iteration % self.check_cadence == 0):
+            # Root process decides, so all processes write together
+            elapsed = time.time() - self.last_write_time
+            return self.comm.bcast(elapsed >= self.wall_dt, root=0)
+        return False
+
+    def check(self, dt):
+        # Call once per iteration, writes a checkpoint when one is due
+        if self.due():
+            self.write(dt)
+
+    def write(self, dt):
+        solver = self.solver
+        comm = self.comm
+        if solver.iteration == self.last_iteration:
+            # Nothing has changed since the last checkpoint
+            return
+        path = self.checkpoint_dir.joinpath(name_format.format(solver.iteration))
+        if comm.rank == 0:
+            path.mkdir(parents=True, exist_ok=True)
+        comm.Barrier()
+        layout = solver.domain.dist.coeff_layout
+        slices = layout.slices(scales=1)
+        start = [sl.start for sl in slices]
+        count = [sl.stop - sl.start for sl in slices]
+        with h5py.File(str(process_file(path, comm.rank)), mode='w') as file:
+            tasks = file.create_group('tasks')
+            for field in solver.state.fields:
+                tasks.create_dataset(field.name, data=field['c'])
+        # All processes have written, the root process marks it complete
+        blocks = comm.gather((start, count), root=0)
+        if comm.rank == 0:
+            meta = {'iteration': int(solver.iteration),
+                    'sim_time': float(solver.sim_time),
+                    'dt': float(dt),
+                    'physics': self.physics,
+                    'size': comm.size,
+                    'global_shape': list(map(int, layout.global_shape(scales=1))),
+                    'blocks': [[list(map(int, s)), list(map(int, c))] for s, c in blocks]}
+            with open(str(path.joinpath(meta_name)), 'w') as file:
+                json.dump(meta, file)
+            self.rotate()
+        comm.Barrier()
+        self.last_write_time = time.time()
+        self.last_iteration = solver.iteration
+        logger.info('Wrote checkpoint {}'.format(path))
+
+    def rotate(self):
+        # Remove all but the newest complete checkpoints, and any incomplete
+        #   checkpoints older than those
+        complete = list_checkpoints(self.checkpoint_dir)
+        for path in complete[:-self.keep]:
+            shutil.rmtree(str(path), ignore_errors=True)
+        oldest_kept = complete[-self.keep:][0]
+        for path in self.checkpoint_dir.glob(name_format.split('{')[0] + '*'):
+            if path < oldest_kept and path not in complete:
+                shutil.rmtree(str(path), ignore_errors=True)
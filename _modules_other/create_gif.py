@@ -2,35 +2,139 @@
 Creates a gif of a set of png images in the stated directory.
 
 Usage:
-    create_gif.py FILENAME FRAMES_PATH
+    create_gif.py FILENAME FRAMES_PATH [--fps=<fps>] [--skip=<n>] [--downscale=<n>]
 
 Arguments:
     FILENAME        name for gif file
     FRAMES_PATH     path to frames of animation
 
+Options:
+    --fps=<fps>         # Frames per second [default: 10]
+    --skip=<n>          # Keep every n-th frame, for a smaller preview [default: 1]
+    --downscale=<n>     # Shrink the frames by this integer factor [default: 1]
+
 Script created: 2019/03/19, Mikhail Schee
 
 Last updated: 2019/07/31, Mikhail Schee
 """
 
 """
-Using imageio
-https://imageio.readthedocs.io/en/latest/installation.html
-install using:
-    conda install -c conda-forge imageio
-OR
-    pip install imageio
-
-Skeleton script from
-https://stackoverflow.com/questions/41228209/making-gif-from-images-using-imageio-in-python
+The gif is written one frame at a time by StreamingGif, so memory use stays
+flat however many frames there are. All frames are quantized against one
+palette, taken from a frame in the middle of the run (the colorbars of the
+frames show the whole colormap), and share the global color table of the gif.
+Uses Pillow:
+    pip install pillow
+Streaming uses the legacy GIF helpers of Pillow (getheader and getdata),
+which are checked for. Without them, the frames are kept (one byte per pixel)
+and saved together with the public Image.save(save_all=True).
 """
 
 import os
-import imageio
+import numpy as np
+import PIL
+from PIL import Image, GifImagePlugin
 # For adding arguments when running
 from docopt import docopt
 
-gif_file = 'uh_oh.gif'
+###############################################################################
+
+# Pillow 9.1 moved these constants into enums, older versions only have the
+#   constants of the module
+MEDIANCUT = getattr(Image, 'Quantize', Image).MEDIANCUT
+NO_DITHER = getattr(Image, 'Dither', Image).NONE
+BOX = getattr(Image, 'Resampling', Image).BOX
+
+def pillow_version():
+    # (major, minor) version of Pillow
+    version = getattr(PIL, '__version__', None) or getattr(PIL, 'PILLOW_VERSION', '0.0')
+    return tuple(int(part) for part in version.split('.')[:2])
+
+def can_stream():
+    # True if this Pillow has the helpers which write a gif in pieces, with
+    #   getheader returning the header and the colors used (Pillow 6 and on)
+    helpers = hasattr(GifImagePlugin, 'getheader') and hasattr(GifImagePlugin, 'getdata')
+    return helpers and pillow_version() >= (6, 0)
+
+class StreamingGif:
+    """
+    Writes a gif frame by frame
+
+    path        = gif file to write
+    fps         = frames per second
+    skip        = keep every n-th frame
+    downscale   = integer factor by which to shrink the frames
+    """
+
+    def __init__(self, path, fps=10, skip=1, downscale=1):
+        self.path = str(path)
+        self.duration = 1000 / fps
+        self.skip = skip
+        self.downscale = downscale
+        self.palette = None
+        self.count = 0
+        self.stream = can_stream()
+        # Frames kept until closing, if they cannot be streamed
+        self.frames = []
+        self.file = open(self.path, 'wb') if self.stream else None
+        # Older versions write the loop with the first frame, not the header
+        self.frame_info = {}
+
+    def prepare(self, frame):
+        # RGB image of a frame, an array or an image, shrunk if asked for
+        if isinstance(frame, np.ndarray):
+            frame = Image.fromarray(np.ascontiguousarray(frame, dtype=np.uint8))
+        frame = frame.convert('RGB')
+        if self.downscale > 1:
+            size = (frame.width // self.downscale, frame.height // self.downscale)
+            frame = frame.resize(size, BOX)
+        return frame
+
+    def set_palette(self, frame):
+        # Palette of all frames, and the header of the gif
+        self.palette = self.prepare(frame).quantize(colors=256, method=MEDIANCUT)
+        if not self.stream:
+            return
+        header, used_colors = GifImagePlugin.getheader(self.palette, info={'loop': 0, 'optimize': False})
+        if not any(b'NETSCAPE2.0' in block for block in header):
+            self.frame_info = {'loop': 0}
+        for block in header:
+            self.file.write(block)
+
+    def quantize(self, frame):
+        # Frame in the colors of the palette
+        image = self.prepare(frame)
+        try:
+            return image.quantize(palette=self.palette, dither=NO_DITHER)
+        except TypeError:
+            # Older versions of Pillow always dither
+            return image.quantize(palette=self.palette)
+
+    def write(self, frame):
+        self.count += 1
+        if (self.count - 1) % self.skip != 0:
+            return
+        if self.palette is None:
+            # Only if no frame was chosen for the palette beforehand
+            self.set_palette(frame)
+        image = self.quantize(frame)
+        if not self.stream:
+            self.frames.append(image)
+            return
+        for block in GifImagePlugin.getdata(image, duration=self.duration, **self.frame_info):
+            self.file.write(block)
+        self.frame_info = {}
+
+    def close(self):
+        if not self.stream:
+            if self.frames:
+                self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:],
+                                    duration=self.duration, loop=0, optimize=False)
+            self.frames = []
+            return
+        # Trailer
+        self.file.write(b';')
+        self.file.close()
 
 if __name__ == '__main__':
     arguments = docopt(__doc__)
@@ -38,10 +142,14 @@ if __name__ == '__main__':
     png_dir = arguments.get('FRAMES_PATH')
     print('Gif saving to ', gif_file)
 
-images = []
-# need to sort because os.listdir returns a list of arbitrary order
-for file_name in sorted(os.listdir(png_dir)):
-    if file_name.endswith('.png'):
-        file_path = os.path.join(png_dir, file_name)
-        images.append(imageio.imread(file_path))
-imageio.mimsave(gif_file, images)
+    # need to sort because os.listdir returns a list of arbitrary order
+    file_paths = [os.path.join(png_dir, file_name) for file_name in sorted(os.listdir(png_dir)) if file_name.endswith('.png')]
+    if file_paths:
+        gif = StreamingGif(gif_file, float(arguments['--fps']), int(arguments['--skip']), int(arguments['--downscale']))
+        # Palette from the middle of the run, when the waves have developed
+        with Image.open(file_paths[len(file_paths)//2]) as image:
+            gif.set_palette(image)
+        for file_path in file_paths:
+            with Image.open(file_path) as image:
+                gif.write(image)
+        gif.close()
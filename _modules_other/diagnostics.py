@@ -0,0 +1,152 @@
+"""
+Batched, non-blocking diagnostic reductions
+
+Replaces flow_tools.GlobalFlowProperty in the main loop. Every `cadence`
+iterations the local maximum, minimum, volume integral, and a flag for
+non-finite values of each property are packed into one buffer and reduced
+across all processes with a single non-blocking MPI reduction. The result is
+only collected at the next cadence, so the reduction overlaps with the steps
+in between instead of holding up every process, and the values available at
+any time are those of one cadence ago.
+
+"""
+
+import numpy as np
+from mpi4py import MPI
+
+###############################################################################
+
+def fejer_weights(n):
+    """
+    Quadrature weights on [-1, 1] of the n-point Chebyshev (Gauss) grid used
+    by Dedalus, from Fejer's first rule
+    """
+    theta = np.pi * (np.arange(n) + 0.5) / n
+    j = np.arange(1, n//2 + 1)
+    terms = np.cos(2*np.outer(theta, j)) / (4*j**2 - 1)
+    return (2.0/n) * (1.0 - 2.0*np.sum(terms, axis=1))
+
+class Diagnostics:
+    """
+    solver  = Dedalus initial value solver
+    cadence = iterations between evaluations of the properties
+    """
+
+    def __init__(self, solver, cadence=10):
+        self.solver = solver
+        self.cadence = cadence
+        self.comm = solver.domain.dist.comm_cart
+        self.properties = solver.evaluator.add_dictionary_handler(iter=cadence)
+        self.names = []
+        self.results = {}
+        # Iteration at which the available results were evaluated
+        self.iteration = None
+        self.request = None
+        self.pending_iteration = None
+        self.op = None
+
+    def add_property(self, property, name):
+        self.properties.add_task(property, layout='g', name=name)
+        self.names.append(name)
+
+    def weights(self, field):
+        # Local quadrature weights for the field's grid
+        domain = self.solver.domain
+        layout = domain.dist.grid_layout
+        scales = field.scales
+        gshape = layout.global_shape(scales=scales)
+        slices = layout.slices(scales=scales)
+        x_basis, z_basis = domain.bases
+        (x0, x1), (z0, z1) = x_basis.interval, z_basis.interval
+        x_weights = np.full(gshape[0], abs(x1 - x0) / gshape[0])
+        z_weights = fejer_weights(gshape[1]) * abs(z1 - z0) / 2
+        return np.outer(x_weights[slices[0]], z_weights[slices[1]])
+
+    def local_values(self):
+        # Packed as [max, -min, non-finite flag] of every property, then the
+        #   integral of every property, so maxima and sums can be reduced
+        #   together
+        n = len(self.names)
+        values = np.zeros(4*n)
+        for i, name in enumerate(self.names):
+            field = self.properties[name]
+            data = field['g']
+            finite = np.isfinite(data)
+            values[3*i]   = np.max(data[finite]) if np.any(finite) else -np.inf
+            values[3*i+1] = -np.min(data[finite]) if np.any(finite) else -np.inf
+            values[3*i+2] = float(not np.all(finite))
+            values[3*n+i] = np.sum(self.weights(field) * np.where(finite, data, 0))
+        return values
+
+    def combine_op(self):
+        # MPI reduction taking the maximum of the first 3n values and the
+        #   sum of the last n
+        n_max = 3*len(self.names)
+        def combine(inbuf, inoutbuf, datatype):
+            a = np.frombuffer(inbuf, dtype=np.float64)
+            b = np.frombuffer(inoutbuf, dtype=np.float64)
+            np.maximum(a[:n_max], b[:n_max], out=b[:n_max])
+            b[n_max:] += a[n_max:]
+        return MPI.Op.Create(combine, commute=True)
+
+    def collect(self):
+        # Wait for the pending reduction and unpack its results
+        self.request.Wait()
+        self.request = None
+        n = len(self.names)
+        domain = self.solver.domain
+        volume = np.prod([abs(b - a) for a, b in (basis.interval for basis in domain.bases)])
+        values = self.recvbuf
+        for i, name in enumerate(self.names):
+            self.results[name] = {'max': values[3*i],
+                                  'min': -values[3*i+1],
+                                  'nonfinite': bool(values[3*i+2]),
+                                  'mean': values[3*n+i] / volume}
+        self.iteration = self.pending_iteration
+
+    def update(self):
+        """
+        Call once per iteration, after the step. At each cadence, collects
+        the results started at the previous cadence and starts the next
+        reduction. Returns True when new results are available.
+        """
+        # The handler was evaluated at the start of the last step
+        evaluated = self.solver.iteration - 1
+        if evaluated % self.cadence != 0:
+            return False
+        new_results = self.request is not None
+        if new_results:
+            self.collect()
+        if self.op is None:
+            self.op = self.combine_op()
+        self.sendbuf = self.local_values()
+        self.recvbuf = np.zeros_like(self.sendbuf)
+        self.request = self.comm.Iallreduce(self.sendbuf, self.recvbuf, op=self.op)
+        self.pending_iteration = evaluated
+        return new_results
+
+    def finish(self):
+        # Collect any pending reduction and free the reduction op. Call on
+        #   every process at the end, also when the main loop raised: every
+        #   process started the pending reduction, so waiting on it is safe
+        try:
+            if self.request is not None:
+                self.collect()
+        finally:
+            self.request = None
+            if self.op is not None:
+                self.op.Free()
+                self.op = None
+
+    def max(self, name):
+        return self.results[name]['max']
+
+    def min(self, name):
+        return self.results[name]['min']
+
+    def mean(self, name):
+        return self.results[name]['mean']
+
+    def blew_up(self):
+        # True if any property had a NaN or infinite value
+        return any(result['nonfinite'] for result in self.results.values())
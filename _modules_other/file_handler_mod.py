@@ -0,0 +1,265 @@
+"""
+Modified version of the Dedalus file handler
+
+Lets the switchboard control the HDF5 layout of the task datasets: chunks
+holding exactly one write of a task (so reading one time index reads one
+chunk), optional lossless compression with the shuffle filter, and the
+precision in which the data is stored.
+
+In append mode, the first write starts a new set after the existing ones, and
+write numbers carry on from the last write, so an extended run continues the
+numbering of the sets and frames of the original run. The cadence carries on
+from the time of the last write too, and truncate_sets drops the writes made
+after a checkpoint, before resuming from it.
+
+With `parallel=True`, all processes write into one file per set with
+parallel HDF5, in the same layout as merged files. Compression is then
+skipped, as it is not supported for the independent writes of the handler.
+
+"""
+
+import shutil
+import pathlib
+
+import h5py
+import numpy as np
+from dedalus.core.evaluator import FileHandler
+import spectral_reader
+
+import logging
+logger = logging.getLogger(__name__)
+
+###############################################################################
+
+def parallel_available():
+    # True if h5py was built with MPI, so files can be written in parallel
+    return h5py.get_config().mpi
+
+def list_sets(base_path):
+    """
+    Returns the sets of a handler, as a dictionary of the set number to the
+    directory of its distributed files and its joint file (None if absent)
+
+    base_path   = directory of the sets, merged or not
+    """
+    base_path = pathlib.Path(base_path)
+    sets = {}
+    for path in base_path.glob(base_path.stem + '_s*'):
+        number = path.stem.split('_s')[-1]
+        if not number.isdigit():
+            continue
+        folder, joint = sets.get(int(number), (None, None))
+        if path.is_dir():
+            folder = path
+        elif path.suffix == '.h5':
+            joint = path
+        sets[int(number)] = (folder, joint)
+    return sets
+
+def last_write(base_path):
+    """
+    Returns the number of the last set of a handler, the last write number
+    in it, and the simulation time of that write, or (0, 0, None) if there
+    are no sets
+
+    base_path   = directory of the sets, merged or not
+    """
+    sets = {}
+    for set_num, (folder, joint) in list_sets(base_path).items():
+        if joint is not None:
+            sets[set_num] = joint
+        elif folder.joinpath(folder.stem + '_p0.h5').exists():
+            # Distributed files, all with the same scales
+            sets[set_num] = folder.joinpath(folder.stem + '_p0.h5')
+    if not sets:
+        return 0, 0, None
+    set_num = max(sets)
+    with h5py.File(str(sets[set_num]), mode='r') as file:
+        writes = int(file.attrs.get('writes', file['scales/sim_time'].shape[0]))
+        numbers = file['scales/write_number'][:writes]
+        times = file['scales/sim_time'][:writes]
+    if not writes:
+        return set_num, 0, None
+    return set_num, int(numbers.max()), float(times.max())
+
+def truncate_file(path, sim_time):
+    """
+    Drops the writes after sim_time from a set file, returns the number of
+    writes kept and dropped
+
+    path        = set file, of one process or joint
+    sim_time    = simulation time of the last write to keep
+    """
+    with h5py.File(str(path), mode='r+') as file:
+        times = file['scales/sim_time'][()]
+        writes = int(file.attrs.get('writes', times.size))
+        # Writes are in order of time
+        kept = int(np.count_nonzero(times[:writes] <= sim_time))
+        if kept < writes:
+            file.attrs['writes'] = kept
+            # Datasets along the writes which can be shrunk, the others are
+            #   read up to the number of writes
+            for group in [file['scales'], file['tasks']]:
+                for dset in group.values():
+                    if isinstance(dset, h5py.Dataset) and dset.ndim and dset.maxshape[0] is None and dset.shape[0] > kept:
+                        dset.resize(kept, axis=0)
+    return kept, writes - kept
+
+def truncate_sets(base_path, sim_time):
+    """
+    Drops the writes after sim_time from the sets of a handler, so that a run
+    resumed from a checkpoint at sim_time does not write them a second time.
+    Sets left without writes are removed. Joint files of changed distributed
+    sets are removed, to be merged again. Returns the number of writes dropped
+
+    base_path   = directory of the sets, merged or not
+    sim_time    = simulation time of the checkpoint
+    """
+    dropped = 0
+    for set_num, (folder, joint) in sorted(list_sets(base_path).items()):
+        if folder is not None:
+            counts = [truncate_file(path, sim_time) for path in sorted(folder.glob('*.h5'))]
+            if not any(dropped_writes for kept, dropped_writes in counts):
+                continue
+            # Every process writes the same writes
+            dropped += max(dropped_writes for kept, dropped_writes in counts)
+            if joint is not None:
+                joint.unlink()
+            if not any(kept for kept, dropped_writes in counts):
+                shutil.rmtree(str(folder))
+        elif joint is not None:
+            kept, dropped_writes = truncate_file(joint, sim_time)
+            dropped += dropped_writes
+            if dropped_writes and not kept:
+                joint.unlink()
+    return dropped
+
+def continue_cadence(handler, last_time):
+    """
+    Sets the cadence of a handler appending to existing sets, so that it does
+    not write again in the interval of sim_dt of the last existing write
+
+    handler     = Dedalus handler with a sim_dt cadence
+    last_time   = simulation time of the last existing write, or None
+    """
+    sim_dt = getattr(handler, 'sim_dt', None)
+    if last_time is None or sim_dt is None or not np.isfinite(sim_dt):
+        return
+    handler.last_sim_div = last_time // sim_dt
+    # Unused cadences would otherwise schedule a write at the first step
+    for cadence, div in [('wall_dt', 'last_wall_div'), ('iter', 'last_iter_div')]:
+        value = getattr(handler, cadence, None)
+        if value is None or not np.isfinite(value):
+            setattr(handler, div, 0)
+
+def storage_dtype(dtype, precision):
+    """
+    Returns the type in which to store data of the given type
+
+    dtype       = type of the data
+    precision   = 'float32' or 'float64' (complex data is stored as the
+                  matching complex type), or None to keep the data's type
+    """
+    if precision is None:
+        return dtype
+    if np.dtype(dtype).kind == 'c':
+        return np.result_type(np.dtype(precision), np.complex64)
+    return np.dtype(precision)
+
+class TaskOptionsGroup:
+    """
+    Stands in for an HDF5 file or group while the base class sets up a file,
+    adding the options of the handler to the datasets of its tasks group
+
+    group   = h5py file or group
+    handler = FileHandlerMod whose options to apply
+    tasks   = True if group is the tasks group
+    """
+
+    def __init__(self, group, handler, tasks=False):
+        self.group = group
+        self.handler = handler
+        self.tasks = tasks
+        self.options_set = False
+        self.children = []
+
+    def __getattr__(self, name):
+        # Everything else is done by the group itself
+        return getattr(self.group, name)
+
+    def __getitem__(self, name):
+        return self.group[name]
+
+    def __contains__(self, name):
+        return name in self.group
+
+    def create_group(self, name, *args, **kw):
+        group = self.group.create_group(name, *args, **kw)
+        if name.strip('/') != 'tasks':
+            return group
+        child = TaskOptionsGroup(group, self.handler, tasks=True)
+        self.children.append(child)
+        return child
+
+    def create_dataset(self, name, shape=None, dtype=None, data=None, **kw):
+        if self.tasks and shape is not None:
+            kw.update(self.handler.dataset_options(shape))
+            dtype = storage_dtype(dtype, self.handler.precision)
+            self.options_set = True
+        return self.group.create_dataset(name, shape=shape, dtype=dtype, data=data, **kw)
+
+    @property
+    def applied(self):
+        # Whether the options were given to any task dataset
+        return self.options_set or any(child.applied for child in self.children)
+
+class FileHandlerMod(FileHandler):
+    """
+    Same as the Dedalus FileHandler, with extra keywords
+
+    chunk_writes        = if True, chunk the task datasets one write per chunk
+    compression         = HDF5 compression filter: None, 'gzip', or 'lzf'
+    compression_opts    = options of the filter, the level for 'gzip'
+    shuffle             = if True, apply the shuffle filter before compressing
+    precision           = 'float32' or 'float64' storage, None for the
+                          type of the data
+    """
+
+    def __init__(self, *args, chunk_writes=True, compression=None, compression_opts=None, shuffle=False, precision=None, **kw):
+        super().__init__(*args, **kw)
+        if kw.get('mode') == 'append':
+            # Continue after the existing sets: start a new set at the first
+            #   write, with write numbers following on from the last write
+            comm = self.domain.dist.comm_cart
+            last = last_write(self.base_path) if comm.rank == 0 else None
+            self.set_num, self.total_write_num, last_time = comm.bcast(last, root=0)
+            self.file_write_num = self.max_writes
+            continue_cadence(self, last_time)
+        self.precision = precision
+        self.chunk_writes = chunk_writes
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+
+    def dataset_options(self, shape):
+        # Keywords for creating the dataset of a task with the given shape
+        options = {}
+        # Scalar tasks start with shape[0] = 0 and are chunked across writes
+        if self.chunk_writes and shape[0] > 0 and np.prod(shape[1:]) > 1:
+            options['chunks'] = (1,) + tuple(shape[1:])
+        if self.compression is not None and not self.parallel:
+            options['compression'] = self.compression
+            if self.compression == 'gzip':
+                options['compression_opts'] = self.compression_opts
+            options['shuffle'] = self.shuffle
+        return options
+
+    def setup_file(self, file):
+        # The base class creates the task datasets through the wrapped file,
+        #   which passes them the options of this handler
+        wrapped = TaskOptionsGroup(file, self)
+        super().setup_file(wrapped)
+        if self.tasks and not wrapped.applied:
+            logger.warning('Dataset options of {} were not applied'.format(self.base_path))
+        # Describe the bases, for reading tasks saved in coefficient layout
+        spectral_reader.write_bases(file['scales'], self.domain)
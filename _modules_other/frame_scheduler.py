@@ -0,0 +1,230 @@
+"""
+Dynamic scheduling of frame rendering, one write at a time
+
+Every write of every set file is a separate task. Workers take the next task
+as soon as they are done with the previous one, so all workers stay busy
+whatever the number of sets or writes per set, and slow frames do not hold
+the others back. Workers are either the processes of an MPI job, taking
+tasks from a counter on the root process with one-sided MPI (so the root
+renders frames too), or a pool of local processes, which needs no MPI
+launch. When the frames are passed on to encoders, they are collected in
+order by the root process, which renders frames too while it waits, or by
+the process running the pool. Each MPI process sends only a few frames ahead
+of the ones encoded, so the frames held by the root stay bounded. Each worker
+keeps count of its frames and rendering time, for a report of the frames per
+second of each worker.
+
+"""
+
+import os
+import time
+import pathlib
+import h5py
+import numpy as np
+
+###############################################################################
+
+def set_number(path):
+    # Number of a set file, base_sN.h5
+    return int(pathlib.Path(path).stem.split('_s')[-1])
+
+def list_writes(paths):
+    # (path, index) of each write of the set files, in order of the sets, as
+    #   shell globs put base_s10.h5 before base_s2.h5
+    writes = []
+    for path in sorted(paths, key=set_number):
+        with h5py.File(str(path), mode='r') as file:
+            n_writes = int(file.attrs.get('writes', file['scales/sim_time'].shape[0]))
+        writes += [(str(path), index) for index in range(n_writes)]
+    return writes
+
+class SharedCounter:
+    """
+    Counter held by the root process, which every process increments and
+    reads in one atomic operation, without the root taking part
+
+    comm    = MPI communicator
+    """
+
+    def __init__(self, comm):
+        from mpi4py import MPI
+        self.MPI = MPI
+        self.value = np.zeros(1, dtype=np.int64)
+        memory = self.value if comm.rank == 0 else None
+        self.win = MPI.Win.Create(memory, disp_unit=self.value.itemsize, comm=comm)
+        self.one = np.ones(1, dtype=np.int64)
+
+    def next(self):
+        # Returns the current value, and increments it
+        result = np.zeros(1, dtype=np.int64)
+        self.win.Lock(0, self.MPI.LOCK_SHARED)
+        self.win.Fetch_and_op(self.one, result, 0, op=self.MPI.SUM)
+        self.win.Unlock(0)
+        return int(result[0])
+
+    def free(self):
+        self.win.Free()
+
+def run_mpi(comm, tasks, func):
+    """
+    Runs func(*task) for each task, on the first free process. Returns the
+    (frames, seconds) of each process on the root, None on the others
+
+    comm    = MPI communicator
+    tasks   = list of argument tuples, the same on all processes
+    func    = function of one task, returning True if it rendered a frame
+    """
+    counter = SharedCounter(comm)
+    frames, seconds = 0, 0.0
+    i = counter.next()
+    while i < len(tasks):
+        start_time = time.time()
+        if func(*tasks[i]):
+            frames += 1
+            seconds += time.time() - start_time
+        i = counter.next()
+    comm.Barrier()
+    counter.free()
+    return comm.gather((frames, seconds), root=0)
+
+def run_mpi_ordered(comm, tasks, func, consume, window=2):
+    """
+    Runs func(*task) for each task, on the first free process, and passes the
+    results to consume on the root in the order of the tasks. Returns the
+    (frames, seconds) of each process on the root, None on the others
+
+    comm    = MPI communicator
+    tasks   = list of argument tuples, the same on all processes
+    func    = function of one task, returning its result
+    consume = function of each result, called on the root
+    window  = number of results each process may send ahead of the ones
+              consumed, which bounds the results held by the root
+    """
+    if comm.size == 1:
+        start_time = time.time()
+        for task in tasks:
+            consume(func(*task))
+        return [(len(tasks), time.time() - start_time)]
+    counter = SharedCounter(comm)
+    MPI = counter.MPI
+    result_tag, credit_tag = 1, 2
+    frames, seconds = 0, 0.0
+    if comm.rank == 0:
+        # Results which arrive early wait for the ones before them. Each one
+        #   took a credit of its process, given back once it is consumed
+        pending = {}
+        next_i = 0
+        own_i = -1
+        status = MPI.Status()
+        def receive():
+            i, result = comm.recv(source=MPI.ANY_SOURCE, tag=result_tag, status=status)
+            pending[i] = (status.Get_source(), result)
+        while next_i < len(tasks):
+            if own_i < next_i:
+                # The last frame of the root is consumed, render the next one
+                own_i = counter.next()
+                if own_i < len(tasks):
+                    start_time = time.time()
+                    pending[own_i] = (0, func(*tasks[own_i]))
+                    frames += 1
+                    seconds += time.time() - start_time
+            else:
+                # Nothing to render until earlier results arrive
+                receive()
+            while comm.iprobe(source=MPI.ANY_SOURCE, tag=result_tag):
+                receive()
+            while next_i in pending:
+                source, result = pending.pop(next_i)
+                consume(result)
+                if source != 0:
+                    comm.send(None, dest=source, tag=credit_tag)
+                next_i += 1
+    else:
+        credits = window
+        while True:
+            # Wait for a credit if out of them, so the root is never flooded
+            while credits == 0 or comm.iprobe(source=0, tag=credit_tag):
+                comm.recv(source=0, tag=credit_tag)
+                credits += 1
+            i = counter.next()
+            if i >= len(tasks):
+                break
+            start_time = time.time()
+            result = func(*tasks[i])
+            frames += 1
+            seconds += time.time() - start_time
+            comm.send((i, result), dest=0, tag=result_tag)
+            credits -= 1
+        # Credits of the last results sent
+        while credits < window:
+            comm.recv(source=0, tag=credit_tag)
+            credits += 1
+    comm.Barrier()
+    counter.free()
+    return comm.gather((frames, seconds), root=0)
+
+# Function of a task in pool workers, set by the initializer
+pool_func = None
+
+def init_pool(func, initializer, initargs):
+    global pool_func
+    pool_func = func
+    if initializer is not None:
+        initializer(*initargs)
+
+def run_pool_task(task):
+    start_time = time.time()
+    result = pool_func(*task)
+    return os.getpid(), result, time.time() - start_time
+
+def run_pool(workers, tasks, func, initializer=None, initargs=()):
+    """
+    Runs func(*task) for each task, on the first free process of a local
+    pool. Returns the (frames, seconds) of each worker
+
+    workers     = number of processes
+    tasks       = list of argument tuples
+    func        = function of one task, returning True if it rendered a frame
+    initializer = function called with initargs once in each worker
+    """
+    import multiprocessing
+    stats = {}
+    with multiprocessing.Pool(workers, init_pool, (func, initializer, initargs)) as pool:
+        # One task at a time, so the work is balanced between workers
+        for pid, rendered, seconds in pool.imap_unordered(run_pool_task, tasks, chunksize=1):
+            frames, total = stats.get(pid, (0, 0.0))
+            if rendered:
+                stats[pid] = (frames + 1, total + seconds)
+            else:
+                stats[pid] = (frames, total)
+    return list(stats.values())
+
+def run_pool_ordered(workers, tasks, func, consume, initializer=None, initargs=()):
+    """
+    Runs func(*task) for each task, on the first free process of a local
+    pool, and passes the results to consume in the order of the tasks.
+    Returns the (frames, seconds) of each worker
+
+    workers     = number of processes
+    tasks       = list of argument tuples
+    func        = function of one task, returning its result
+    consume     = function of each result, called in this process
+    initializer = function called with initargs once in each worker
+    """
+    import multiprocessing
+    stats = {}
+    with multiprocessing.Pool(workers, init_pool, (func, initializer, initargs)) as pool:
+        # Workers carry on with later tasks while earlier results are consumed
+        for pid, result, seconds in pool.imap(run_pool_task, tasks, chunksize=1):
+            consume(result)
+            frames, total = stats.get(pid, (0, 0.0))
+            stats[pid] = (frames + 1, total + seconds)
+    return list(stats.values())
+
+def report(stats, wall_time):
+    # Prints the frames per second of each worker, and overall
+    for worker, (frames, seconds) in enumerate(stats):
+        fps = frames / seconds if seconds > 0 else 0.0
+        print('Worker {:3d}: {:5d} frames, {:6.2f} frames/s'.format(worker, frames, fps))
+    total = sum(frames for frames, seconds in stats)
+    print('Total: {:d} frames in {:.1f} s, {:.2f} frames/s on {:d} workers'.format(total, wall_time, total / wall_time, len(stats)))
@@ -0,0 +1,83 @@
+"""
+Encoders fed with frames as they are plotted
+
+Instead of saving each frame as a png, then reading them all back for the
+gif and again for the mp4, plot_slices.py can pass the pixels of each frame
+straight to the encoders, in order. The mp4 is encoded by an ffmpeg process
+reading raw RGB frames from a pipe, and the gif is appended to one frame at
+a time by create_gif.StreamingGif, against a palette computed from a frame
+passed to set_palette beforehand (plot_slices.py uses the middle write).
+
+"""
+
+import subprocess
+import numpy as np
+from create_gif import StreamingGif
+
+###############################################################################
+
+class VideoStream:
+    """
+    Pipes RGB frames into ffmpeg, with the same encoding as _run_exp.sh
+
+    path    = mp4 file to write
+    fps     = frames per second
+    """
+
+    def __init__(self, path, fps=10):
+        self.path = str(path)
+        self.fps = fps
+        self.process = None
+
+    def start(self, height, width):
+        # The size of the frames is only known at the first frame
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{:d}x{:d}'.format(width, height),
+                   '-framerate', str(self.fps), '-i', '-',
+                   # yuv420p needs an even width and height
+                   '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                   '-c:v', 'libx264', '-pix_fmt', 'yuv420p', self.path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, rgb):
+        if self.process is None:
+            self.start(*rgb.shape[:2])
+        self.process.stdin.write(np.ascontiguousarray(rgb, dtype=np.uint8).tobytes())
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise ValueError('ffmpeg failed to encode {}'.format(self.path))
+
+class FrameStreams:
+    """
+    Passes each frame to all the encoders
+
+    mp4     = mp4 file to write, or None
+    gif     = gif file to write, or None
+    fps     = frames per second
+    gif_skip        = keep every n-th frame in the gif
+    gif_downscale   = integer factor by which to shrink the frames of the gif
+    """
+
+    def __init__(self, mp4=None, gif=None, fps=10, gif_skip=1, gif_downscale=1):
+        self.streams = []
+        if mp4:
+            self.streams.append(VideoStream(mp4, fps))
+        if gif:
+            self.streams.append(StreamingGif(gif, fps, gif_skip, gif_downscale))
+
+    def set_palette(self, rgb):
+        # Palette of the gif, from a representative frame
+        for stream in self.streams:
+            if isinstance(stream, StreamingGif):
+                stream.set_palette(rgb)
+
+    def write(self, rgb):
+        for stream in self.streams:
+            stream.write(rgb)
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
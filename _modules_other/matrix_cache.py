@@ -0,0 +1,154 @@
+"""
+On-disk cache of the pencil matrices built by the Dedalus solver
+
+Building the solver expands the NCCs (background profile, sponge layer) and
+assembles the LHS matrices of every pencil, which takes minutes at high
+vertical resolution. This module stores the assembled matrices of each process
+in a cache directory, keyed by a hash of everything that enters the LHS: the
+bases, the equations and boundary conditions, the LHS parameters and the
+process layout. Later runs with the same key load the matrices instead of
+rebuilding them. Only the most recently used few entries are kept.
+
+Only the matrix assembly is skipped. The LU factorizations cannot be pickled,
+so they are still computed by the timestepper on the first step, as before.
+
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import pathlib
+
+import numpy as np
+from mpi4py import MPI
+
+import logging
+logger = logging.getLogger(__name__)
+
+###############################################################################
+
+# Types of pencil attributes which are stored in the cache
+cache_types = (np.ndarray, np.generic, int, float, complex, bool, str, type(None))
+
+def hash_value(sha, value):
+    # Add a parameter (scalar or Dedalus field) to a hash
+    from dedalus.core.field import Field
+    if isinstance(value, Field):
+        sha.update(np.ascontiguousarray(value['g']).tobytes())
+    else:
+        sha.update(repr(value).encode())
+
+def cache_key(problem, timestepper, lhs_parameters, comm):
+    """
+    Returns a hash identifying the pencil matrices of this process
+
+    problem         = Dedalus problem
+    timestepper     = Dedalus timestepper class
+    lhs_parameters  = names of the problem parameters which enter the LHS
+    comm            = MPI communicator of the domain
+    """
+    import dedalus
+    import scipy
+    sha = hashlib.sha1()
+    # Versions, as the matrix layout may change between them
+    sha.update(repr((getattr(dedalus, '__version__', None), scipy.__version__)).encode())
+    # Bases
+    for basis in problem.domain.bases:
+        sha.update(repr((type(basis).__name__, basis.name, basis.base_grid_size,
+                         basis.interval, basis.dealias)).encode())
+    # Equations and boundary conditions
+    for eq in problem.eqs + problem.bcs:
+        sha.update(repr((eq['raw_equation'], eq['raw_condition'])).encode())
+    # Parameters of the LHS
+    for name in lhs_parameters:
+        sha.update(name.encode())
+        hash_value(sha, problem.parameters[name])
+    sha.update(timestepper.__name__.encode())
+    # Process layout
+    sha.update(repr((comm.rank, comm.size)).encode())
+    local_key = sha.hexdigest()
+    # Combine the keys of all processes so they all agree on hits and misses
+    global_key = hashlib.sha1(''.join(comm.allgather(local_key)).encode())
+    return global_key.hexdigest()
+
+def is_cacheable(value):
+    # Matrices, arrays and plain values, or containers of them
+    from scipy import sparse
+    if isinstance(value, (list, tuple)):
+        return all(is_cacheable(val) for val in value)
+    if isinstance(value, dict):
+        return all(is_cacheable(val) for val in value.values())
+    return sparse.issparse(value) or isinstance(value, cache_types)
+
+def prune(cache_dir, keep):
+    """
+    Removes all but the most recently used entries of the cache
+
+    cache_dir   = directory in which the cached matrices are kept
+    keep        = number of entries to keep
+    """
+    entries = [path for path in pathlib.Path(cache_dir).iterdir() if path.is_dir()]
+    entries.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in entries[keep:]:
+        logger.info('Removing old pencil matrices in {}'.format(path))
+        shutil.rmtree(str(path), ignore_errors=True)
+
+def build_solver(problem, timestepper, cache_dir, lhs_parameters, keep=4):
+    """
+    Builds the solver, loading the pencil matrices from the cache if present,
+    and storing them in the cache otherwise
+
+    problem         = Dedalus problem
+    timestepper     = Dedalus timestepper class
+    cache_dir       = directory in which to keep the cached matrices
+    lhs_parameters  = names of the problem parameters which enter the LHS
+    keep            = number of most recently used entries of the cache to keep
+    """
+    from dedalus.core import pencil
+    comm = problem.domain.dist.comm_cart
+    key = cache_key(problem, timestepper, lhs_parameters, comm)
+    cache_path = pathlib.Path(cache_dir).joinpath(key[:16])
+    cache_file = cache_path.joinpath('p{:d}of{:d}.pkl'.format(comm.rank, comm.size))
+    # Only use the cache if every process has its matrices
+    hit = comm.allreduce(cache_file.exists(), op=MPI.LAND)
+
+    build_matrices = pencil.build_matrices
+    def build_matrices_cached(pencils, problem, names):
+        if hit:
+            logger.info('Loading pencil matrices from {}'.format(cache_path))
+            with open(str(cache_file), 'rb') as file:
+                cached = pickle.load(file)
+            for p, attrs in zip(pencils, cached):
+                p.__dict__.update(attrs)
+        else:
+            # Keep the attributes the matrix build adds or replaces
+            before = [dict(vars(p)) for p in pencils]
+            build_matrices(pencils, problem, names)
+            cached = []
+            for p, old in zip(pencils, before):
+                new = {name: val for name, val in vars(p).items() if (name not in old) or (val is not old[name])}
+                skipped = [name for name, val in new.items() if not is_cacheable(val)]
+                if skipped:
+                    logger.debug('Not caching pencil attributes: {}'.format(skipped))
+                cached.append({name: val for name, val in new.items() if is_cacheable(val)})
+            logger.info('Storing pencil matrices in {}'.format(cache_path))
+            cache_path.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so a killed job leaves no partial cache
+            tmp_file = cache_file.with_suffix('.tmp')
+            with open(str(tmp_file), 'wb') as file:
+                pickle.dump(cached, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(str(tmp_file), str(cache_file))
+
+    # Swap in the caching matrix build only while building this solver
+    pencil.build_matrices = build_matrices_cached
+    try:
+        solver = problem.build_solver(timestepper)
+    finally:
+        pencil.build_matrices = build_matrices
+    # Mark this entry as used, and drop the least recently used ones
+    comm.Barrier()
+    if comm.rank == 0 and cache_path.exists():
+        os.utime(str(cache_path))
+        prune(cache_dir, keep)
+    return solver
@@ -2,19 +2,137 @@
 Merge distributed analysis sets from a FileHandler.
 
 Usage:
-    merge.py <base_path> [--cleanup]
+    merge.py <base_path> [--cleanup] [--virtual] [--materialize] [--new]
 
 Options:
-    --cleanup   Delete distributed files after merging
+    --cleanup       Delete distributed files after merging
+    --virtual       Build each joint file as HDF5 virtual datasets over the
+                        distributed files, without copying any data
+    --materialize   Replace the virtual datasets of the joint files by
+                        contiguous copies, for archiving
+    --new           Only merge the sets which have no joint file yet, such
+                        as the sets added by extending a run
+
+A virtual joint file only holds references to the distributed files, so they
+must be kept: --cleanup is ignored with --virtual, and only applies after
+--materialize.
 
 """
 
+import pathlib
+import h5py
+import numpy as np
+
+###############################################################################
+
+def set_paths(base_path):
+    # Directories of the distributed sets of a file handler
+    base_path = pathlib.Path(base_path)
+    return sorted(path for path in base_path.glob(base_path.stem + '_s*') if path.is_dir())
+
+def proc_paths(set_path):
+    # Distributed files of one set, ordered by process
+    paths = set_path.glob(set_path.stem + '_p*.h5')
+    return sorted(paths, key=lambda path: int(path.stem.split('_p')[-1]))
+
+def make_scale(dset, name):
+    # Dimension scales, across h5py versions
+    if hasattr(dset, 'make_scale'):
+        dset.make_scale(name)
+    else:
+        dset.file[dset.parent.name].dims.create_scale(dset, name)
+
+def attach_dims(joint_dset, proc_dset):
+    # Label the dimensions and attach the same scales as the distributed files
+    joint_file = joint_dset.file
+    for i, proc_dim in enumerate(proc_dset.dims):
+        joint_dset.dims[i].label = proc_dim.label
+        for name, proc_scale in proc_dim.items():
+            scale = joint_file[proc_scale.name]
+            make_scale(scale, name)
+            joint_dset.dims[i].attach_scale(scale)
+
+def merge_set_virtual(set_path, joint_path):
+    """
+    Builds a joint file whose tasks are virtual datasets over the
+    distributed files of one set
+
+    set_path    = directory of the distributed files of the set
+    joint_path  = joint file to create
+    """
+    paths = proc_paths(set_path)
+    with h5py.File(str(joint_path), mode='w') as joint_file:
+        with h5py.File(str(paths[0]), mode='r') as proc_file:
+            for key, val in proc_file.attrs.items():
+                joint_file.attrs[key] = val
+            # Distributed files all have the global scales
+            proc_file.copy('scales', joint_file)
+            writes = proc_file['scales/sim_time'].shape[0]
+            tasks = {name: (dset.dtype, tuple(dset.attrs['global_shape'])) for name, dset in proc_file['tasks'].items()}
+        joint_file.attrs['writes'] = writes
+        joint_tasks = joint_file.create_group('tasks')
+        for name, (dtype, global_shape) in tasks.items():
+            layout = h5py.VirtualLayout(shape=(writes,) + global_shape, dtype=dtype)
+            for path in paths:
+                with h5py.File(str(path), mode='r') as proc_file:
+                    proc_dset = proc_file['tasks'][name]
+                    start = proc_dset.attrs['start']
+                    count = proc_dset.attrs['count']
+                    # Relative to the joint file, so the directory can be moved
+                    source = h5py.VirtualSource(str(path.relative_to(joint_path.parent)), proc_dset.name, shape=proc_dset.shape)
+                    dest = (slice(0, writes),) + tuple(slice(s, s+c) for s, c in zip(start, count))
+                    layout[dest] = source[:writes]
+            joint_dset = joint_tasks.create_virtual_dataset(name, layout, fillvalue=np.nan)
+            with h5py.File(str(paths[0]), mode='r') as proc_file:
+                attach_dims(joint_dset, proc_file['tasks'][name])
+
+def materialize(joint_path):
+    # Replaces the virtual datasets of a joint file by contiguous copies
+    tmp_path = joint_path.with_suffix('.tmp')
+    with h5py.File(str(joint_path), mode='r') as virtual_file, h5py.File(str(tmp_path), mode='w') as joint_file:
+        for key, val in virtual_file.attrs.items():
+            joint_file.attrs[key] = val
+        virtual_file.copy('scales', joint_file)
+        joint_tasks = joint_file.create_group('tasks')
+        for name, virtual_dset in virtual_file['tasks'].items():
+            chunks = (1,) + virtual_dset.shape[1:] if virtual_dset.ndim > 1 else True
+            joint_dset = joint_tasks.create_dataset(name, shape=virtual_dset.shape, dtype=virtual_dset.dtype, chunks=chunks)
+            for key, val in virtual_dset.attrs.items():
+                if key not in ['DIMENSION_LIST', 'DIMENSION_LABELS']:
+                    joint_dset.attrs[key] = val
+            # One write at a time, to keep memory use down
+            for index in range(virtual_dset.shape[0]):
+                joint_dset[index] = virtual_dset[index]
+            attach_dims(joint_dset, virtual_dset)
+    tmp_path.replace(joint_path)
+
 if __name__ == "__main__":
 
+    import shutil
     from docopt import docopt
     from dedalus.tools import logging
     from dedalus.tools import post
     from mpi4py import MPI
+    comm = MPI.COMM_WORLD
 
     args = docopt(__doc__)
-    post.merge_analysis(args['<base_path>'], cleanup=args['--cleanup'])
+    base_path = pathlib.Path(args['<base_path>'])
+    if args['--virtual'] or args['--materialize']:
+        paths = set_paths(base_path)
+        if args['--new']:
+            paths = [path for path in paths if not base_path.joinpath(path.name + '.h5').exists()]
+        # Divide the sets between processes
+        for set_path in paths[comm.rank::comm.size]:
+            joint_path = base_path.joinpath(set_path.name + '.h5')
+            if args['--virtual'] or not joint_path.exists():
+                merge_set_virtual(set_path, joint_path)
+            if args['--materialize']:
+                materialize(joint_path)
+                if args['--cleanup']:
+                    shutil.rmtree(str(set_path))
+    elif args['--new']:
+        paths = [path for path in set_paths(base_path) if not base_path.joinpath(path.name + '.h5').exists()]
+        for set_path in paths[comm.rank::comm.size]:
+            post.merge_distributed_set(set_path, cleanup=args['--cleanup'])
+    else:
+        post.merge_analysis(args['<base_path>'], cleanup=args['--cleanup'])
@@ -0,0 +1,218 @@
+"""
+Choose the number of MPI processes for an experiment
+
+Dedalus splits the 2D domain over a 1D process mesh (a domain of dimension d
+is split over a mesh of at most d-1 dimensions): the grid layout is split
+along z (at the dealiased resolution) and the coefficient layout along the
+Fourier modes in x. Core counts which do not divide these evenly leave some
+processes with less work, which then wait for the others every step.
+
+For every core count up to the number available, the planner finds how evenly
+the work is split, and predicts the time per step from a simple model of the
+pencil solves, the transforms, and the transposes. It picks the fastest core
+count whose split is even enough. The model's coefficients can be calibrated
+by timing a few steps of the experiment at several core counts, which are
+saved and reused. Run from the experiment directory, for example:
+    $ python3 _modules_other/mesh_planner.py --cores=40 --calibrate
+
+The resolution is read from the experiment's switchboard.py without importing
+it, as the import would select and move the physics modules.
+
+Usage:
+    mesh_planner.py [--cores=<n>] [--min-balance=<f>] [--calibrate] [--candidates=<n>] [--steps=<n>] [--warmup=<n>] [--print-cores]
+    mesh_planner.py bench [--steps=<n>] [--warmup=<n>]
+
+Options:
+    --cores=<n>         # Number of cores available [default: 2]
+    --min-balance=<f>   # Smallest fraction of evenly split work allowed [default: 0.95]
+    --calibrate         # Time the experiment at several core counts to fit the model
+    --candidates=<n>    # Number of core counts to time when calibrating [default: 4]
+    --steps=<n>         # Timed steps per core count when calibrating [default: 20]
+    --warmup=<n>        # Untimed steps before timing, includes factorization [default: 5]
+    --print-cores       # Only print the chosen number of cores, for scripts
+
+"""
+
+import sys
+import json
+import time
+import pathlib
+import subprocess
+import numpy as np
+from docopt import docopt
+
+###############################################################################
+
+calibration_file = 'mesh_calibration.json'
+switchboard_file = 'switchboard.py'
+# Line of the switchboard above which are only the parameters
+switchboard_end = "Shouldn't need to edit below here"
+
+# Default model coefficients, in seconds per unit of work (see step_work)
+default_coeffs = {'solve': 2e-8, 'transform': 5e-9, 'transpose': 2e-9, 'latency': 5e-5}
+
+def read_resolution(path=switchboard_file):
+    # n_x, n_z, and dealias, from the parameters part of the switchboard
+    with open(path, 'r') as file:
+        source = file.read()
+    if switchboard_end not in source:
+        raise ValueError("Cannot find the end of the parameters in {}".format(path))
+    params = {}
+    exec(source.split(switchboard_end)[0], params)
+    return params['n_x'], params['n_z'], params['dealias']
+
+def layout_sizes(n_x, n_z, dealias):
+    # Number of Fourier modes (pencils) split over processes in the
+    #   coefficient layout, and of dealiased z rows split in the grid layout
+    pencils = n_x // 2
+    rows = int(np.ceil(n_z * dealias))
+    return pencils, rows
+
+def balance(n, cores):
+    # Fraction of the work time not spent waiting for the busiest process
+    return n / (cores * int(np.ceil(n / cores)))
+
+def step_work(cores, n_x, n_z, dealias):
+    """
+    Work per step on the busiest process, for each term of the model
+
+    cores   = number of processes
+    n_x     = number of grid points in x
+    n_z     = number of grid points in z
+    dealias = dealias factor
+    """
+    pencils, rows = layout_sizes(n_x, n_z, dealias)
+    n_xd = int(np.ceil(n_x * dealias))
+    local_pencils = int(np.ceil(pencils / cores))
+    local_rows = int(np.ceil(rows / cores))
+    return {'solve': local_pencils * n_z,
+            'transform': local_rows * n_xd * np.log2(n_xd) + local_pencils * rows * np.log2(rows),
+            'transpose': 0.0 if cores == 1 else n_xd * rows / cores,
+            'latency': np.log2(cores)}
+
+def predict(cores, n_x, n_z, dealias, coeffs):
+    # Predicted wall time per step
+    work = step_work(cores, n_x, n_z, dealias)
+    return sum(coeffs[term] * work[term] for term in coeffs)
+
+def plan(n_x, n_z, dealias, max_cores, coeffs, min_balance=0.95):
+    """
+    Returns a list of candidate core counts, fastest first. Each is a
+    dictionary of the core count, how evenly it splits the work, and the
+    predicted time per step.
+    """
+    pencils, rows = layout_sizes(n_x, n_z, dealias)
+    t_serial = predict(1, n_x, n_z, dealias, coeffs)
+    candidates = []
+    for cores in range(1, max_cores + 1):
+        # Dedalus needs at least one z row and one pencil per process
+        if cores > min(pencils, rows):
+            break
+        even = min(balance(pencils, cores), balance(rows, cores))
+        step_time = predict(cores, n_x, n_z, dealias, coeffs)
+        candidates.append({'cores': cores,
+                           'mesh': [cores],
+                           'balance': even,
+                           'step_time': step_time,
+                           'efficiency': t_serial / (cores * step_time)})
+    even_enough = [c for c in candidates if c['balance'] >= min_balance] or candidates
+    candidates = sorted(even_enough, key=lambda c: c['step_time'])
+    # Of those within 2% of the fastest, fewer cores give more steps per core
+    near_best = [c for c in candidates if c['step_time'] <= 1.02*candidates[0]['step_time']]
+    best = min(near_best, key=lambda c: c['cores'])
+    return [best] + [c for c in candidates if c is not best]
+
+def fit_coeffs(timings, n_x, n_z, dealias):
+    """
+    Least squares fit of the model coefficients to measured step times,
+    keeping them non-negative
+
+    timings = dictionary of measured time per step for each core count
+    """
+    terms = list(default_coeffs)
+    A = np.array([[step_work(cores, n_x, n_z, dealias)[term] for term in terms] for cores in timings])
+    t = np.array(list(timings.values()))
+    active = list(range(len(terms)))
+    coeffs = np.zeros(len(terms))
+    while active:
+        sol = np.linalg.lstsq(A[:, active], t, rcond=None)[0]
+        if np.all(sol >= 0):
+            coeffs[active] = sol
+            break
+        # Drop the most negative term and refit
+        active.pop(int(np.argmin(sol)))
+    return dict(zip(terms, map(float, coeffs)))
+
+# Start of the line with the timing printed by bench
+bench_tag = 'mesh_planner bench: '
+
+def bench(n_steps, n_warmup):
+    # Time steps of the experiment on the processes this was launched with
+    sys.path.insert(0, '.')
+    import core_code as core
+    sbp = core.sbp
+    domain = core.build_domain(sbp)
+    solver = core.build_solver(core.build_problem(domain, sbp), sbp)
+    comm = domain.dist.comm_cart
+    for i in range(n_warmup):
+        solver.step(sbp.dt)
+    comm.Barrier()
+    start_time = time.time()
+    for i in range(n_steps):
+        solver.step(sbp.dt)
+    comm.Barrier()
+    if comm.rank == 0:
+        print(bench_tag + json.dumps({'cores': comm.size, 'step_time': (time.time() - start_time) / n_steps}))
+
+def calibrate(candidates, n_steps, n_warmup, n_x, n_z, dealias):
+    # Time the experiment at each core count, in separate MPI jobs
+    timings = {}
+    for cores in candidates:
+        command = ['mpiexec', '-n', str(cores), sys.executable, __file__, 'bench',
+                   '--steps={:d}'.format(n_steps), '--warmup={:d}'.format(n_warmup)]
+        output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        # The timing line, among the log of the core code
+        lines = [line for line in output.splitlines() if line.startswith(bench_tag)]
+        if not lines:
+            raise ValueError("No timing in the output of {}".format(' '.join(command)))
+        result = json.loads(lines[-1][len(bench_tag):])
+        timings[cores] = result['step_time']
+        print('Calibration: {:d} cores, {:.3e} s/step'.format(cores, timings[cores]), file=sys.stderr)
+    return fit_coeffs(timings, n_x, n_z, dealias), timings
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['bench']:
+        bench(int(args['--steps']), int(args['--warmup']))
+        sys.exit(0)
+    max_cores = int(args['--cores'])
+    min_balance = float(args['--min-balance'])
+    # Only the resolution is needed, read from the experiment's switchboard
+    n_x, n_z, dealias = read_resolution()
+
+    coeffs = dict(default_coeffs)
+    calibration = pathlib.Path(calibration_file)
+    if args['--calibrate']:
+        candidates = plan(n_x, n_z, dealias, max_cores, coeffs, min_balance)
+        # The best few, plus the extremes, so all terms of the model vary
+        cores_to_time = [c['cores'] for c in candidates[:int(args['--candidates'])]]
+        cores_to_time = sorted(set(cores_to_time + [1, max(c['cores'] for c in candidates)]))
+        coeffs, timings = calibrate(cores_to_time, int(args['--steps']), int(args['--warmup']), n_x, n_z, dealias)
+        with open(str(calibration), 'w') as file:
+            json.dump({'n_x': n_x, 'n_z': n_z, 'dealias': dealias, 'coeffs': coeffs,
+                       'timings': {str(c): t for c, t in timings.items()}}, file, indent=4)
+    elif calibration.exists():
+        with open(str(calibration), 'r') as file:
+            saved = json.load(file)
+        # Coefficients are per unit of work, so they carry over to other resolutions
+        coeffs = saved['coeffs']
+
+    candidates = plan(n_x, n_z, dealias, max_cores, coeffs, min_balance)
+    if args['--print-cores']:
+        print(candidates[0]['cores'])
+    else:
+        print('{:>6} {:>8} {:>14} {:>11}'.format('Cores', 'Balance', 'Step time [s]', 'Efficiency'))
+        for c in sorted(candidates, key=lambda c: c['cores']):
+            print('{cores:>6d} {balance:>8.3f} {step_time:>14.4e} {efficiency:>11.3f}'.format(**c))
+        best = candidates[0]
+        print('Best: {:d} cores, process mesh {}'.format(best['cores'], best['mesh']))
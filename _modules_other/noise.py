@@ -0,0 +1,65 @@
+"""
+Reproducible random noise generated locally on each process
+
+Each value of the noise is a function only of the seed and the position of
+the point in the global grid (a counter-based generator, using the SplitMix64
+hash). Every process only generates the values of its own part of the grid,
+and the assembled field is the same whatever the number of processes.
+
+See tests/test_noise.py for the check that the noise does not depend on how
+the grid is split between processes.
+
+"""
+
+import numpy as np
+
+###############################################################################
+
+# SplitMix64 constants
+golden  = np.uint64(0x9E3779B97F4A7C15)
+mix_1   = np.uint64(0xBF58476D1CE4E5B9)
+mix_2   = np.uint64(0x94D049BB133111EB)
+
+def splitmix64(x):
+    # Hash an array of uint64 counters, wrapping around on overflow
+    z = np.asarray(x, dtype=np.uint64) + golden
+    z = (z ^ (z >> np.uint64(30))) * mix_1
+    z = (z ^ (z >> np.uint64(27))) * mix_2
+    return z ^ (z >> np.uint64(31))
+
+def uniform(seed, counter):
+    # Uniform random values in [0, 1) for each counter
+    key = splitmix64(np.array([seed], dtype=np.uint64))
+    bits = splitmix64(counter ^ key)
+    return (bits >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+def standard_normal(seed, index):
+    """
+    Returns standard normal values for an array of global flat indices
+
+    seed    = integer seed of the noise
+    index   = array of non-negative integer positions in the global grid
+    """
+    index = np.asarray(index, dtype=np.uint64)
+    # Two uniform values per point for the Box-Muller transform
+    u1 = 1.0 - uniform(seed, np.uint64(2)*index)
+    u2 = uniform(seed, np.uint64(2)*index + np.uint64(1))
+    return np.sqrt(-2.0*np.log(u1)) * np.cos(2.0*np.pi*u2)
+
+def local_noise(seed, gshape, slices):
+    """
+    Returns the local part of a global field of standard normal noise
+
+    seed    = integer seed of the noise
+    gshape  = global shape of the grid
+    slices  = tuple of slices of the local part of the grid
+    """
+    # Global flat index of each local point, broadcast from 1D pieces
+    strides = np.cumprod((1,) + tuple(gshape[:0:-1]))[::-1]
+    index = np.zeros((1,)*len(gshape), dtype=np.uint64)
+    for axis, (sl, n) in enumerate(zip(slices, gshape)):
+        shape = [1]*len(gshape)
+        local = np.arange(n)[sl].astype(np.uint64) * np.uint64(strides[axis])
+        shape[axis] = local.size
+        index = index + local.reshape(shape)
+    return standard_normal(seed, index)
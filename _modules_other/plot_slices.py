@@ -2,11 +2,23 @@
 Plot planes from joint analysis files.
 
 Usage:
-    plot_slices.py EXP_NAME <files>... [--output=<dir>]
+    plot_slices.py EXP_NAME <files>... [--output=<dir>] [--skip-existing] [--workers=<n>]
+                   [--mp4=<file>] [--gif=<file>] [--fps=<fps>] [--png]
+                   [--gif-skip=<n>] [--gif-downscale=<n>]
 
 Options:
-    EXP_NAME            # Name of experiment to add switchboard module path
-    --output=<dir>      # Output directory [default: ./frames]
+    EXP_NAME              # Name of experiment to add switchboard module path
+    --output=<dir>        # Output directory [default: ./frames]
+    --skip-existing       # Only plot the writes which have no frame yet
+    --workers=<n>         # Plot with n local processes instead of the MPI processes
+    --mp4=<file>          # Encode the frames into an mp4 with ffmpeg as they are plotted
+    --gif=<file>          # Encode the frames into a gif as they are plotted
+    --fps=<fps>           # Frames per second of the mp4 and gif [default: 10]
+    --png                 # With --mp4 or --gif, also save the frames as png
+    --gif-skip=<n>        # Keep every n-th frame in the gif [default: 1]
+    --gif-downscale=<n>   # Shrink the frames of the gif by this factor [default: 1]
+
+Each write is plotted by the first free process, see frame_scheduler.py.
 
 """
 
@@ -18,7 +30,10 @@ import matplotlib.pyplot as plt
 plt.ioff()
 from dedalus.extras import plot_tools
 # Import modified version of plot bot
-from plot_tools_mod import plot_bot_3d_mod
+from plot_tools_mod import plot_bot_3d_mod, update_bot_3d_mod
+import profiles
+import archive
+import spectral_reader
 
 ###############################################################################
 # Helper functions
@@ -42,29 +57,12 @@ def flip_the_switches(plot_all_variables, plot_sponge_profile, use_sst, T):
         time_factor = T
     return tasks, nrows, ncols, title_str, time_factor
 
-# Adds the title to a frame
-def add_frame_title(fig, file, index, title_func):
-    title = title_func(file['scales/sim_time'][index])
-    fig.suptitle(title, fontsize='large')
-
-# Saves figure as a frame
-def save_fig_as_frame(fig, file, index, savename_func, output, dpi):
-    savename = savename_func(file['scales/write_number'][index])
-    savepath = output.joinpath(savename)
-    fig.savefig(str(savepath), dpi=dpi)
-    fig.clear()
-
-# Plots one frame of one task (b, p, u, or w)
-def plot_one_task(n, ncols, mfig, file, task, index, x_lims, y_lims, n_clrbar_ticks):
-    # Build subfigure axes
-    i, j = divmod(n, ncols)
-    axes = mfig.add_axes(i, j, [0, 0, 1, 1])
-    # Call 3D plotting helper, slicing in time
-    dset = file['tasks'][task]
-    plot_bot_3d_mod(dset, 0, index, x_limits=x_lims, y_limits=y_lims, n_cb_ticks=n_clrbar_ticks, axes=axes, title=task, even_scale=True)
-
 # Extracts relevant arrays from a vertical profile snapshot
 def extract_vp_snapshot(task_name, snap_dir, vp_snaps):
+    # Profiles written once at the start of the run, if present
+    hori, vert = profiles.read_profile(snap_dir + '/' + profiles.profiles_name, task_name)
+    if hori is not None:
+        return hori, vert
     vp_snap_filepath = snap_dir + '/' + vp_snaps + '/' + vp_snaps + '_s1.h5'
     with h5py.File(vp_snap_filepath, mode='r') as file:
         data = file['tasks'][task_name]
@@ -128,8 +126,109 @@ def add_sponge_profile(sl_task_name, snap_dir, sl_snaps, mfig, buffer, extra_buf
     return axes0
 
 ###############################################################################
-def main(filename, start, count, output):
-    """Save plot of specified tasks for given range of analysis writes."""
+class FrameRenderer:
+    """
+    Draws the frames of an experiment. The figure, the profile panels, and
+    the image of each task are built once, then each frame only updates the
+    data and color limits of the images and the title
+
+    sbp     = switchboard module of the experiment
+    name    = name of the experiment, for the title
+    """
+
+    def __init__(self, sbp, name):
+        self.sbp = sbp
+        self.plot_all = sbp.plot_all_variables
+        # Display parameters
+        x_f             = sbp.x_0 + sbp.L_x_dis
+        z_b             = sbp.z_t - sbp.L_z_dis
+        # Calculate aspect ratio
+        AR = sbp.L_x_dis / sbp.L_z_dis
+        # Set tuples for display boundaries
+        self.x_lims = [sbp.x_0, x_f]
+        self.y_lims = [z_b, sbp.z_t]
+
+        # Change the size of the text overall
+        font = {'size' : sbp.font_size}
+        plt.rc('font', **font)
+        # Set parameters based on switches
+        self.tasks, nrows, self.ncols, title_str, time_factor = flip_the_switches(self.plot_all, sbp.plot_sponge, sbp.use_stop_sim_time, sbp.T)
+        self.title_func = lambda sim_time: title_str.format(name, sim_time/time_factor)
+        self.savename_func = lambda write: 'write_{:06}.png'.format(write)
+        # Layout
+        image = plot_tools.Box(AR, 1)
+        pad = plot_tools.Frame(0.2, 0.2, 0.15, 0.15)
+        margin = plot_tools.Frame(0.3, 0.2, 0.1, 0.1)
+
+        # Create multifigure
+        self.mfig = plot_tools.MultiFigure(nrows, self.ncols, image, pad, margin, sbp.scale)
+        self.fig = self.mfig.figure
+        # Drawn at the resolution of the saved frames
+        self.fig.set_dpi(sbp.dpi)
+        if (self.plot_all == False):
+            # Plot stratification profile on the left
+            plot_bp_on_left(sbp.bp_task_name, sbp.snapshots_dir, sbp.bp_snap_dir, self.mfig, sbp.buffer, sbp.extra_buffer, sbp.vp_dis_ratio, self.y_lims)
+            if sbp.plot_sponge:
+                add_sponge_profile(sbp.sl_task_name, sbp.snapshots_dir, sbp.sl_snap_dir, self.mfig, sbp.buffer, sbp.extra_buffer, sbp.vp_dis_ratio, self.y_lims)
+        self.title = self.fig.suptitle('', fontsize='large')
+        # Images of the tasks, built at the first frame
+        self.images = {}
+        # Datasets of the tasks in the current file
+        self.dsets = {}
+        self.filename = None
+
+    def open_task(self, file, task):
+        # Dataset of a task, reused for all the writes of a file
+        if file.filename != self.filename:
+            self.dsets = {}
+            self.filename = file.filename
+        if task not in self.dsets:
+            dset = archive.open_task(file, task)
+            if spectral_reader.is_coefficient(dset):
+                # Evaluate the coefficients on the grid, only inside the plotted region
+                scales = (self.sbp.plot_scale, self.sbp.plot_scale)
+                dset = spectral_reader.GridTask(file, dset, scales=scales, ranges=(self.x_lims, self.y_lims))
+            self.dsets[task] = dset
+        return self.dsets[task]
+
+    def draw(self, file, index):
+        # Plots one frame of each task (b, p, u, or w)
+        for n, task in enumerate(self.tasks):
+            dset = self.open_task(file, task)
+            if task in self.images:
+                update_bot_3d_mod(self.images[task], dset, 0, index, even_scale=True)
+                continue
+            # shift n so that animation is on the right side
+            if (self.plot_all == False):
+                n = 1
+            # Build subfigure axes
+            i, j = divmod(n, self.ncols)
+            axes = self.mfig.add_axes(i, j, [0, 0, 1, 1])
+            # Call 3D plotting helper, slicing in time
+            paxes, caxes, self.images[task] = plot_bot_3d_mod(dset, 0, index, x_limits=self.x_lims, y_limits=self.y_lims, n_cb_ticks=self.sbp.n_clrbar_ticks, axes=axes, title=task, even_scale=True,
+                                                              uniform=self.sbp.plot_uniform, uniform_points=self.sbp.plot_uniform_points)
+        # Add title to frame
+        self.title.set_text(self.title_func(file['scales/sim_time'][index]))
+
+    def savepath(self, file, index, output):
+        return output.joinpath(self.savename_func(file['scales/write_number'][index]))
+
+    def save(self, file, index, output):
+        # Saves figure as a frame
+        self.fig.savefig(str(self.savepath(file, index, output)), dpi=self.sbp.dpi)
+
+    def rgb(self):
+        # Pixels of the frame, as saved
+        self.fig.canvas.draw()
+        return np.asarray(self.fig.canvas.buffer_rgba())[..., :3].copy()
+
+# Built at the first frame of each process
+renderer = None
+# Set file of the last frame, kept open for the next writes
+open_file = None
+
+def open_write(filename):
+    """Renderer and open set file for plotting a write of a set file."""
 
     # To import the switchboard
     import sys
@@ -137,74 +236,100 @@ def main(filename, start, count, output):
     sys.path.insert(0, switch_path) # Adds higher directory to python modules path
     import switchboard as sbp
 
-    # Get relevant parameters from switchboard used in loop
-    plot_all        = sbp.plot_all_variables
-    #bp_task_name    = sbp.bp_task_name
-    n_clrbar_ticks  = sbp.n_clrbar_ticks
-    #T               = sbp.T
-    # Display parameters
-    x_f             = sbp.x_0 + sbp.L_x_dis
-    z_b             = sbp.z_t - sbp.L_z_dis
-
-    # Calculate aspect ratio
-    AR = sbp.L_x_dis / sbp.L_z_dis
-    # Set tuples for display boundaries
-    x_lims = [sbp.x_0, x_f]
-    y_lims = [z_b, sbp.z_t]
-
-    # Change the size of the text overall
-    font = {'size' : sbp.font_size}
-    plt.rc('font', **font)
-    # Set parameters based on switches
-    tasks, nrows, ncols, title_str, time_factor = flip_the_switches(plot_all, sbp.plot_sponge, sbp.use_stop_sim_time, sbp.T)
-    # Plot settings
-    scale   = sbp.scale
-    dpi     = sbp.dpi
-    title_func = lambda sim_time: title_str.format(NAME, sim_time/time_factor)
-    savename_func = lambda write: 'write_{:06}.png'.format(write)
-    # Layout
-    image = plot_tools.Box(AR, 1)
-    pad = plot_tools.Frame(0.2, 0.2, 0.15, 0.15)
-    margin = plot_tools.Frame(0.3, 0.2, 0.1, 0.1)
-
-    # Create multifigure
-    mfig = plot_tools.MultiFigure(nrows, ncols, image, pad, margin, scale)
-    fig = mfig.figure
-    # Plot writes
-    with h5py.File(filename, mode='r') as file:
-        for index in range(start, start+count):
-            for n, task in enumerate(tasks):
-                if (plot_all == False):
-                    # Plot stratification profile on the left
-                    ax0 = plot_bp_on_left(sbp.bp_task_name, sbp.snapshots_dir, sbp.bp_snap_dir, mfig, sbp.buffer, sbp.extra_buffer, sbp.vp_dis_ratio, y_lims)
-                    if sbp.plot_sponge:
-                        ax1 = add_sponge_profile(sbp.sl_task_name, sbp.snapshots_dir, sbp.sl_snap_dir, mfig, sbp.buffer, sbp.extra_buffer, sbp.vp_dis_ratio, y_lims)
-                    # shift n so that animation is on the right side
-                    n = 1
-                plot_one_task(n, ncols, mfig, file, task, index, x_lims, y_lims, n_clrbar_ticks)
-            # Add title to frame
-            add_frame_title(fig, file, index, title_func)
-            # Save figure
-            save_fig_as_frame(fig, file, index, savename_func, output, dpi)
-    plt.close(fig)
+    global renderer, open_file
+    if renderer is None:
+        renderer = FrameRenderer(sbp, NAME)
+    if open_file is None or open_file.filename != str(filename):
+        if open_file is not None:
+            open_file.close()
+        open_file = h5py.File(str(filename), mode='r')
+    return renderer, open_file
+
+def render_write(filename, index, output, skip_existing=False):
+    """Save plot of specified tasks for one analysis write, returns True if plotted."""
+
+    renderer, file = open_write(filename)
+    # Frames of earlier runs, when extending a run
+    if skip_existing and renderer.savepath(file, index, output).exists():
+        return False
+    renderer.draw(file, index)
+    renderer.save(file, index, output)
+    return True
+
+def render_rgb(filename, index, output, save_png=False):
+    """Plot of specified tasks for one analysis write, returns its pixels."""
+
+    renderer, file = open_write(filename)
+    renderer.draw(file, index)
+    if save_png:
+        renderer.save(file, index, output)
+    return renderer.rgb()
+
+def palette_frame(tasks):
+    # Pixels of the middle write, when the waves have developed, for the
+    #   palette of the gif (the first writes are close to zero everywhere)
+    path, index, output, save_png = tasks[len(tasks)//2]
+    return render_rgb(path, index, output)
+
+def set_name(name):
+    # Experiment name in pool workers
+    global NAME
+    NAME = name
 
 ###############################################################################
 if __name__ == "__main__":
 
+    import time
     import pathlib
     from docopt import docopt
-    from dedalus.tools import logging
-    from dedalus.tools import post
-    from dedalus.tools.parallel import Sync
+    import frame_scheduler
+    import frame_stream
 
     args = docopt(__doc__)
 
     NAME = str(args['EXP_NAME'])
 
     output_path = pathlib.Path(args['--output']).absolute()
-    # Create output directory if needed
-    with Sync() as sync:
-        if sync.comm.rank == 0:
-            if not output_path.exists():
-                output_path.mkdir()
-    post.visit_writes(args['<files>'], main, output=output_path)
+    # Each write is rendered by the first free worker
+    writes = frame_scheduler.list_writes(args['<files>'])
+    stream = args['--mp4'] or args['--gif']
+    if stream:
+        # Frames go to the encoders in order, pngs only if asked for
+        tasks = [(path, index, output_path, args['--png']) for path, index in writes]
+        func = render_rgb
+    else:
+        tasks = [(path, index, output_path, args['--skip-existing']) for path, index in writes]
+        func = render_write
+    make_output = not stream or args['--png']
+    start_time = time.time()
+    if args['--workers']:
+        # Local processes, no MPI launch needed
+        if make_output:
+            output_path.mkdir(parents=True, exist_ok=True)
+        if stream:
+            streams = frame_stream.FrameStreams(args['--mp4'], args['--gif'], int(args['--fps']), int(args['--gif-skip']), int(args['--gif-downscale']))
+            if args['--gif'] and tasks:
+                streams.set_palette(palette_frame(tasks))
+            stats = frame_scheduler.run_pool_ordered(int(args['--workers']), tasks, func, streams.write, set_name, (NAME,))
+            streams.close()
+        else:
+            stats = frame_scheduler.run_pool(int(args['--workers']), tasks, func, set_name, (NAME,))
+        frame_scheduler.report(stats, time.time() - start_time)
+    else:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+        # Create output directory if needed
+        if comm.rank == 0 and make_output:
+            output_path.mkdir(parents=True, exist_ok=True)
+        comm.Barrier()
+        if stream:
+            streams = frame_stream.FrameStreams(args['--mp4'], args['--gif'], int(args['--fps']), int(args['--gif-skip']), int(args['--gif-downscale'])) if comm.rank == 0 else None
+            if streams and args['--gif'] and tasks:
+                streams.set_palette(palette_frame(tasks))
+            stats = frame_scheduler.run_mpi_ordered(comm, tasks, func, streams.write if streams else None)
+            if streams:
+                streams.close()
+        else:
+            stats = frame_scheduler.run_mpi(comm, tasks, func)
+        if comm.rank == 0:
+            frame_scheduler.report(stats, time.time() - start_time)
@@ -51,7 +51,7 @@ class DimWrapper:
             return self.basis.elements
 
 
-def plot_bot_mod(dset, image_axes, data_slices, x_limits=None, y_limits=None, n_cb_ticks=3, image_scales=(0,0), clim=None, even_scale=False, cmap='RdBu_r', axes=None, figkw={}, title=None, func=None):
+def plot_bot_mod(dset, image_axes, data_slices, x_limits=None, y_limits=None, n_cb_ticks=3, image_scales=(0,0), clim=None, even_scale=False, cmap='RdBu_r', axes=None, figkw={}, title=None, func=None, uniform=False, uniform_points=None):
     """
     Plot a 2d slice of the grid data of a dset/field.
 
@@ -85,6 +85,13 @@ def plot_bot_mod(dset, image_axes, data_slices, x_limits=None, y_limits=None, n_
         Title for plot (default: dataset name)
     func : function(xmesh, ymesh, data), optional
         Function to apply to selected meshes and data before plotting (default: None)
+    uniform : bool, optional
+        Resample the data on a uniform grid and draw it with imshow, which is
+        faster than pcolormesh on a Chebyshev grid (default: False, func is
+        then not applied)
+    uniform_points : int, optional
+        Number of points of the uniform grid along non-uniform axes
+        (default: as many as the grid)
 
     """
 
@@ -97,9 +104,14 @@ def plot_bot_mod(dset, image_axes, data_slices, x_limits=None, y_limits=None, n_
     xscale, yscale = image_scales
 
     # Get meshes and data
-    xmesh, ymesh, data = get_plane(dset, xaxis, yaxis, data_slices, xscale, yscale)
-    if func is not None:
-        xmesh, ymesh, data = func(xmesh, ymesh, data)
+    if uniform:
+        xgrid, ygrid = get_plane_grids(dset, xaxis, yaxis, data_slices, xscale, yscale)
+        resampler = UniformResampler(xgrid, ygrid, uniform_points)
+        data = get_plane_data(dset, xaxis, yaxis, data_slices, xscale, yscale)
+    else:
+        xmesh, ymesh, data = get_plane(dset, xaxis, yaxis, data_slices, xscale, yscale)
+        if func is not None:
+            xmesh, ymesh, data = func(xmesh, ymesh, data)
 
     # Setup figure
     if axes is None:
@@ -124,8 +136,15 @@ def plot_bot_mod(dset, image_axes, data_slices, x_limits=None, y_limits=None, n_
     cmap.set_bad('0.7')
 
     # Plot
-    plot = paxes.pcolormesh(xmesh, ymesh, data, cmap=cmap, zorder=1)
-    paxes.axis(pad_limits(xmesh, ymesh))
+    if uniform:
+        plot = paxes.imshow(resampler(data), cmap=cmap, zorder=1, origin='lower', extent=resampler.extent,
+                            aspect='auto', interpolation='nearest')
+        # Kept for updating the image
+        plot.resampler = resampler
+        paxes.axis(resampler.extent)
+    else:
+        plot = paxes.pcolormesh(xmesh, ymesh, data, cmap=cmap, zorder=1)
+        paxes.axis(pad_limits(xmesh, ymesh))
     paxes.tick_params(length=0, width=0)
     if clim is None:
         if even_scale:
@@ -164,7 +183,7 @@ def plot_bot_mod(dset, image_axes, data_slices, x_limits=None, y_limits=None, n_
     if (y_limits != None):
         paxes.set_ylim(y_limits)
 
-    return paxes, caxes
+    return paxes, caxes, plot
 
 
 def plot_bot_2d_mod(dset, transpose=False, **kw):
@@ -226,6 +245,15 @@ def plot_bot_3d_mod(dset, normal_axis, normal_index, transpose=False, **kw):
     if len(dset.shape) != 3:
         raise ValueError("This function is for plotting 3d datasets only.")
 
+    # Call general plotting function
+    image_axes, data_slices = image_axes_3d(dset, normal_axis, normal_index, transpose)
+
+    return plot_bot_mod(dset, image_axes, data_slices, **kw)
+
+
+def image_axes_3d(dset, normal_axis, normal_index, transpose=False):
+    """Image axes and data slices of a 2d slice of a 3d dataset."""
+
     # Resolve axis name to axis index
     if isinstance(normal_axis, str):
         for axis, dim in enumerate(dset.dims):
@@ -235,15 +263,52 @@ def plot_bot_3d_mod(dset, normal_axis, normal_index, transpose=False, **kw):
         else:
             raise ValueError("Axis name not found.")
 
-    # Call general plotting function
     axes = (0, 1, 2)
     image_axes = axes[:normal_axis] + axes[normal_axis+1:]
     if transpose:
         image_axes = image_axes[::-1]
     data_slices = [slice(None), slice(None), slice(None)]
     data_slices[normal_axis] = normal_index
+    return image_axes, tuple(data_slices)
 
-    return plot_bot_mod(dset, image_axes, tuple(data_slices), **kw)
+
+def update_bot_3d_mod(plot, dset, normal_axis, normal_index, transpose=False, image_scales=(0,0), clim=None, even_scale=False):
+    """
+    Update an image made by plot_bot_3d_mod with another 2d slice of a
+    dataset on the same grid, keeping the axes, mesh, and colorbar.
+
+    Parameters
+    ----------
+    plot : QuadMesh
+        Image returned by plot_bot_3d_mod, after the axes
+    dset, normal_axis, normal_index, transpose, image_scales, clim, even_scale :
+        As for plot_bot_3d_mod
+
+    """
+
+    # Only the data is selected, the mesh is kept
+    (xaxis, yaxis), data_slices = image_axes_3d(dset, normal_axis, normal_index, transpose)
+    xscale, yscale = image_scales
+    data = get_plane_data(dset, xaxis, yaxis, data_slices, xscale, yscale)
+    resampler = getattr(plot, 'resampler', None)
+    if resampler is None:
+        plot.set_array(data.ravel())
+    else:
+        # Images drawn with imshow, the interpolation is only rebuilt if
+        #   the grid has changed
+        xgrid, ygrid = get_plane_grids(dset, xaxis, yaxis, data_slices, xscale, yscale)
+        if not resampler.matches(xgrid, ygrid):
+            resampler = plot.resampler = UniformResampler(xgrid, ygrid, resampler.n_points)
+            plot.set_extent(resampler.extent)
+        plot.set_data(resampler(data))
+    if clim is None:
+        if even_scale:
+            lim = max(abs(data.min()), abs(data.max()))
+            clim = (-lim, lim)
+        else:
+            clim = (data.min(), data.max())
+    # Also updates the colorbar
+    plot.set_clim(*clim)
 
 
 class MultiFigure:
@@ -572,6 +637,43 @@ def get_plane(dset, xaxis, yaxis, slices, xscale=0, yscale=0, **kw):
     yorder = np.argsort(ygrid)
     xmesh, ymesh = quad_mesh(xgrid[xorder], ygrid[yorder], **kw)
 
+    # Select and arrange data
+    data = get_plane_data(dset, xaxis, yaxis, slices, xscale, yscale)
+
+    return xmesh, ymesh, data
+
+
+def get_plane_grids(dset, xaxis, yaxis, slices, xscale=0, yscale=0):
+    """
+    Select the sorted grids of a plane from dataset.
+
+    Parameters as for get_plane.
+
+    """
+
+    # Make sure slices are in tuple
+    slices = tuple(slices)
+
+    xgrid = dset.dims[xaxis][xscale][slices[xaxis]]
+    ygrid = dset.dims[yaxis][yscale][slices[yaxis]]
+    return np.sort(xgrid), np.sort(ygrid)
+
+
+def get_plane_data(dset, xaxis, yaxis, slices, xscale=0, yscale=0):
+    """
+    Select plane data from dataset, ordered as the meshes of get_plane.
+
+    Parameters as for get_plane.
+
+    """
+
+    # Make sure slices are in tuple
+    slices = tuple(slices)
+
+    # Sorted grids
+    xorder = np.argsort(dset.dims[xaxis][xscale][slices[xaxis]])
+    yorder = np.argsort(dset.dims[yaxis][yscale][slices[yaxis]])
+
     # Select and arrange data
     data = dset[slices]
     if xaxis < yaxis:
@@ -579,4 +681,91 @@ def get_plane(dset, xaxis, yaxis, slices, xscale=0, yscale=0, **kw):
     data = data[yorder]
     data = data[:, xorder]
 
-    return xmesh, ymesh, data
+    return data
+
+
+def interpolation_matrix(grid, points, order=4):
+    """
+    Matrix interpolating data on a sorted 1d grid to a set of points, with the
+    Lagrange polynomial through the `order` grid points nearest each point.
+
+    Parameters
+    ----------
+    grid : 1d array
+        Sorted grid, e.g. Chebyshev points or a region of them.
+    points : 1d array
+        Points to interpolate to.
+    order : int, optional
+        Number of grid points of each interpolant (default: 4, cubic).
+
+    """
+
+    order = min(order, grid.size)
+    # First grid point of the stencil of each point
+    start = np.searchsorted(grid, points) - order//2
+    start = np.clip(start, 0, grid.size - order)
+    stencil = start[:, None] + np.arange(order)
+    nodes = grid[stencil]
+    # Lagrange weights of each node of each stencil
+    weights = np.ones(nodes.shape)
+    for k in range(order):
+        for m in range(order):
+            if m != k:
+                weights[:, k] *= (points - nodes[:, m]) / (nodes[:, k] - nodes[:, m])
+    matrix = np.zeros((points.size, grid.size))
+    np.put_along_axis(matrix, stencil, weights, axis=1)
+    return matrix
+
+
+class UniformResampler:
+    """
+    Resamples 2d planes on a grid to a uniform grid, to draw them with imshow.
+    Uniform axes (Fourier) are kept, and the interpolation matrices of
+    non-uniform axes (Chebyshev) are computed once, so each plane is
+    resampled with a single matrix multiply per axis.
+
+    Parameters
+    ----------
+    xgrid, ygrid : 1d arrays
+        Sorted grids of the plane.
+    n_points : int, optional
+        Number of points of the uniform grid along non-uniform axes
+        (default: as many as the grid).
+
+    """
+
+    def __init__(self, xgrid, ygrid, n_points=None):
+        self.xgrid = xgrid
+        self.ygrid = ygrid
+        self.n_points = n_points
+        self.xmatrix, xuniform = self.axis_matrix(xgrid)
+        self.ymatrix, yuniform = self.axis_matrix(ygrid)
+        # Pixels centered on the uniform grid points
+        self.extent = self.pixel_limits(xuniform) + self.pixel_limits(yuniform)
+
+    def axis_matrix(self, grid):
+        # Interpolation matrix to a uniform grid, None if already uniform
+        if grid.size < 3 or np.allclose(np.diff(grid), grid[1] - grid[0]):
+            return None, grid
+        n_points = self.n_points or grid.size
+        uniform = np.linspace(grid[0], grid[-1], n_points)
+        return interpolation_matrix(grid, uniform), uniform
+
+    @staticmethod
+    def pixel_limits(grid):
+        if grid.size < 2:
+            return [grid[0] - 0.5, grid[0] + 0.5]
+        half = (grid[-1] - grid[0]) / (grid.size - 1) / 2
+        return [grid[0] - half, grid[-1] + half]
+
+    def matches(self, xgrid, ygrid):
+        # True if the resampler was built for these grids
+        return np.array_equal(xgrid, self.xgrid) and np.array_equal(ygrid, self.ygrid)
+
+    def __call__(self, data):
+        # data ordered as by get_plane_data, with y along the first axis
+        if self.ymatrix is not None:
+            data = self.ymatrix @ data
+        if self.xmatrix is not None:
+            data = data @ self.xmatrix.T
+        return data
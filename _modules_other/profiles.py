@@ -0,0 +1,47 @@
+"""
+Time-invariant vertical profiles, written once per run
+
+The background profile (BP) and sponge layer (SL) do not change during a run,
+so instead of writing them as 2D fields every snapshot, the core code writes
+them once, as 1D profiles on the global z grid, into a single HDF5 file in
+the snapshots directory. Each profile is a dataset under `tasks` with the
+expression it represents as an attribute, next to the z grid under `scales`.
+
+"""
+
+import pathlib
+
+import h5py
+import numpy as np
+
+###############################################################################
+
+profiles_name = 'profiles.h5'
+
+def write_profiles(filename, z, profiles, attrs=None):
+    """
+    Writes 1D vertical profiles to an HDF5 file, call from one process only
+
+    filename    = path of the file to write
+    z           = 1D array of the global z grid
+    profiles    = dictionary of name: (expression, 1D array on the z grid)
+    attrs       = dictionary of extra attributes for the file
+    """
+    filename = pathlib.Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(str(filename), mode='w') as file:
+        file.create_dataset('scales/z', data=np.asarray(z).ravel())
+        for name, (expression, profile) in profiles.items():
+            dset = file.create_dataset('tasks/' + name, data=np.asarray(profile).ravel())
+            dset.attrs['expression'] = expression
+        for key, val in (attrs or {}).items():
+            file.attrs[key] = val
+
+def read_profile(filename, name):
+    # Returns the profile and the z grid, or (None, None) if not in the file
+    if not pathlib.Path(filename).exists():
+        return None, None
+    with h5py.File(str(filename), mode='r') as file:
+        if name not in file['tasks']:
+            return None, None
+        return file['tasks'][name][()], file['scales/z'][()]
@@ -0,0 +1,180 @@
+"""
+File handler which only saves a region of the domain
+
+Saves the tasks on the part of the grid inside a range in x and z, keeping
+every n-th point along each axis. The region is small compared to the full
+fields, so each process sends its part to the root process, which writes one
+file per set in the same layout as merged files (base/base_sN.h5), with the
+coordinates of the region as the scales. No merging is needed afterwards.
+
+"""
+
+import shutil
+import pathlib
+
+import h5py
+import numpy as np
+from dedalus.core.evaluator import Handler
+from file_handler_mod import storage_dtype, list_sets, last_write, continue_cadence
+
+###############################################################################
+
+time_scales = ['sim_time', 'world_time', 'wall_time', 'timestep', 'iteration', 'write_number']
+
+class RegionFileHandler(Handler):
+    """
+    base_path   = directory of the output sets
+    domain      = Dedalus domain
+    vars        = namespace of the problem, for parsing tasks
+    ranges      = (min, max) coordinates to save along each axis, None for all
+    decimate    = keep every n-th point along each axis
+    max_writes  = number of writes per set
+    mode        = 'overwrite' or 'append'
+    chunk_writes = if True, chunk the task datasets one write per chunk
+    compression, compression_opts, shuffle = HDF5 filter options
+    precision   = 'float32' or 'float64' storage, None for the type of the data
+    Other keywords set the cadence, as for the Dedalus FileHandler
+    """
+
+    def __init__(self, base_path, domain, vars, ranges=(None, None), decimate=(1, 1), max_writes=np.inf, mode='overwrite',
+                 chunk_writes=True, compression=None, compression_opts=None, shuffle=False, precision=None, **kw):
+        super().__init__(domain, vars, **kw)
+        self.precision = precision
+        self.base_path = pathlib.Path(base_path)
+        self.ranges = ranges
+        self.decimate = decimate
+        self.max_writes = max_writes
+        self.chunk_writes = chunk_writes
+        self.filter_options = {}
+        if compression is not None:
+            self.filter_options = {'compression': compression, 'shuffle': shuffle}
+            if compression == 'gzip':
+                self.filter_options['compression_opts'] = compression_opts
+        self.comm = domain.dist.comm_cart
+        self.indices = {}
+        # Set and write numbers, continued from existing sets when appending
+        set_num, total_write_num, last_time = 0, 0, None
+        if self.comm.rank == 0:
+            if mode == 'overwrite':
+                # Remove the sets of earlier runs, distributed or joint,
+                #   leaving the other files of the directory
+                for folder, joint in list_sets(self.base_path).values():
+                    if folder is not None:
+                        shutil.rmtree(str(folder))
+                    if joint is not None:
+                        joint.unlink()
+            elif mode == 'append':
+                set_num, total_write_num, last_time = last_write(self.base_path)
+            else:
+                raise ValueError("Unknown file handler mode '{}'".format(mode))
+            self.base_path.mkdir(parents=True, exist_ok=True)
+        self.set_num, self.total_write_num, last_time = self.comm.bcast((set_num, total_write_num, last_time), root=0)
+        # Start a new set at the first write
+        self.file_write_num = self.max_writes
+        continue_cadence(self, last_time)
+
+    def region_indices(self, scales, constant):
+        # Global grid indices of the region along each axis, for given scales
+        key = (tuple(scales), tuple(constant))
+        if key not in self.indices:
+            indices = []
+            for basis, scale, const, bounds, step in zip(self.domain.bases, scales, constant, self.ranges, self.decimate):
+                if const:
+                    indices.append(np.array([0]))
+                    continue
+                grid = basis.grid(scale)
+                inside = np.ones(grid.size, dtype=bool)
+                if bounds is not None:
+                    inside = (grid >= min(bounds)) & (grid <= max(bounds))
+                indices.append(np.flatnonzero(inside)[::step])
+            self.indices[key] = indices
+        return self.indices[key]
+
+    def gather_region(self, task):
+        # Assembles the region of one task on the root process
+        out = task['out']
+        out.set_scales(task['scales'], keep_data=True)
+        out.require_grid_space()
+        constant = out.meta[:]['constant']
+        indices = self.region_indices(task['scales'], constant)
+        slices = out.layout.slices(scales=task['scales'])
+        # Local points of the region, and their positions within the region
+        local_index, region_pos = [], []
+        for index, sl, const in zip(indices, slices, constant):
+            if const:
+                local_index.append(np.array([0]))
+                region_pos.append(np.array([0]))
+                continue
+            local = index[(index >= sl.start) & (index < sl.stop)]
+            local_index.append(local - sl.start)
+            region_pos.append(np.searchsorted(index, local))
+        block = out.data[np.ix_(*local_index)]
+        pieces = self.comm.gather((region_pos, block), root=0)
+        if self.comm.rank != 0:
+            return None, indices, constant
+        region = np.zeros([index.size for index in indices], dtype=out.data.dtype)
+        for pos, piece in pieces:
+            region[np.ix_(*pos)] = piece
+        return region, indices, constant
+
+    def setup_file(self, file, regions):
+        file.attrs['set_number'] = self.set_num
+        file.attrs['handler_name'] = self.base_path.stem
+        file.attrs['writes'] = 0
+        scale_group = file.create_group('scales')
+        for name in time_scales:
+            scale_group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=np.float64)
+        tasks = file.create_group('tasks')
+        for task, (region, indices, constant) in zip(self.tasks, regions):
+            # Resizable datasets need chunks, left to h5py if not one per write
+            chunks = (1,) + region.shape if self.chunk_writes else True
+            dset = tasks.create_dataset(task['name'], shape=(0,) + region.shape, maxshape=(None,) + region.shape,
+                                        dtype=storage_dtype(region.dtype, self.precision), chunks=chunks, **self.filter_options)
+            dset.attrs['decimate'] = self.decimate
+            dset.dims[0].label = 't'
+            for name in time_scales:
+                scale = scale_group[name]
+                scale.make_scale(name)
+                dset.dims[0].attach_scale(scale)
+            # Coordinates of the region as the spatial scales, the region is
+            #   the same for all tasks with the same scales
+            for axis, (basis, index, scale, const) in enumerate(zip(self.domain.bases, indices, task['scales'], constant)):
+                if const:
+                    name = lookup = 'constant'
+                    data = np.zeros(1)
+                else:
+                    name = basis.name
+                    lookup = '{}/{}'.format(basis.name, scale)
+                    data = basis.grid(scale)[index]
+                if lookup not in scale_group:
+                    scale_group.create_dataset(lookup, data=data)
+                scale = scale_group[lookup]
+                scale.make_scale(name)
+                dset.dims[axis+1].label = name
+                dset.dims[axis+1].attach_scale(scale)
+
+    def process(self, **kw):
+        # Gather the regions of every task, then write them from the root
+        regions = [self.gather_region(task) for task in self.tasks]
+        if self.file_write_num >= self.max_writes:
+            self.set_num += 1
+            self.file_write_num = 0
+        self.file_write_num += 1
+        self.total_write_num += 1
+        if self.comm.rank != 0:
+            return
+        path = self.base_path.joinpath('{}_s{:d}.h5'.format(self.base_path.stem, self.set_num))
+        with h5py.File(str(path), mode='a') as file:
+            if 'tasks' not in file:
+                self.setup_file(file, regions)
+            index = file.attrs['writes']
+            file.attrs['writes'] = index + 1
+            kw['write_number'] = self.total_write_num
+            for name in time_scales:
+                dset = file['scales'][name]
+                dset.resize(index + 1, axis=0)
+                dset[index] = kw.get(name, np.nan)
+            for task, (region, indices, constant) in zip(self.tasks, regions):
+                dset = file['tasks'][task['name']]
+                dset.resize(index + 1, axis=0)
+                dset[index] = region
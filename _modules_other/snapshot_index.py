@@ -0,0 +1,202 @@
+"""
+Index of the writes of a snapshot handler
+
+Maps each write number to the set file and the index of the write in that
+file, along with its sim time, time in forcing periods (t/T), iteration,
+and timestep, in an SQLite file next to the sets (base_path/snapshot_index.db).
+Writes can then be found by write number, sim time, or period without opening
+every set. The index is updated incrementally: only sets which are new or
+changed since the last update are read. The forcing period is written next
+to the sets by the run (base_path/forcing.json), so it is read without
+importing the switchboard.
+
+Usage:
+    snapshot_index.py <base_path> [--T=<T>] [--write=<n> | --time=<t> | --period=<p> | --last=<p>]
+
+Options:
+    --T=<T>         # Forcing period [s], read from forcing.json if not given
+    --write=<n>     # Print the write with this write number
+    --time=<t>      # Print the write closest to this sim time [s]
+    --period=<p>    # Print the write closest to this time in periods
+    --last=<p>      # Print the writes of the last p periods
+
+"""
+
+import json
+import pathlib
+import sqlite3
+import h5py
+import numpy as np
+
+###############################################################################
+
+index_name = 'snapshot_index.db'
+period_name = 'forcing.json'
+columns = ['write_number', 'file', 'idx', 'sim_time', 'period', 'iteration', 'timestep']
+
+schema = """
+CREATE TABLE IF NOT EXISTS writes (
+    write_number INTEGER PRIMARY KEY, file TEXT, idx INTEGER,
+    sim_time REAL, period REAL, iteration INTEGER, timestep REAL);
+CREATE INDEX IF NOT EXISTS writes_sim_time ON writes (sim_time);
+CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL);
+"""
+
+def write_period(base_path, T):
+    # Records the forcing period next to the sets, for the index
+    base_path = pathlib.Path(base_path)
+    base_path.mkdir(parents=True, exist_ok=True)
+    with open(str(base_path.joinpath(period_name)), 'w') as file:
+        json.dump({'T': T}, file)
+
+def read_period(base_path):
+    # Forcing period recorded by the run which wrote the sets
+    path = pathlib.Path(base_path).joinpath(period_name)
+    if not path.exists():
+        raise ValueError("No {} in {}, give the forcing period with --T".format(period_name, base_path))
+    with open(str(path), 'r') as file:
+        return float(json.load(file)['T'])
+
+def set_files(base_path):
+    # Set files of a handler, merged or written in one file per set
+    paths = base_path.glob(base_path.stem + '_s*.h5')
+    return sorted(paths, key=lambda path: int(path.stem.split('_s')[-1]))
+
+def read_scale(file, name, writes):
+    # A scale of a set file, NaN if the handler did not record it
+    if name in file['scales']:
+        return file['scales'][name][:writes]
+    return np.full(writes, np.nan)
+
+def update_index(base_path, T):
+    """
+    Brings the index of a snapshot directory up to date, returns its path
+
+    base_path   = directory of the set files
+    T           = forcing period, to store the time of each write in periods
+    """
+    base_path = pathlib.Path(base_path)
+    index_path = base_path.joinpath(index_name)
+    db = sqlite3.connect(str(index_path))
+    with db:
+        db.executescript(schema)
+        # Start over if the period changed
+        row = db.execute("SELECT value FROM meta WHERE key = 'T'").fetchone()
+        if row is None or row[0] != T:
+            db.execute('DELETE FROM writes')
+            db.execute('DELETE FROM files')
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('T', ?)", (T,))
+        known = dict((file, (mtime, size)) for file, mtime, size in db.execute('SELECT * FROM files'))
+        paths = set_files(base_path)
+        # Sets which were removed
+        for name in set(known) - set(path.name for path in paths):
+            db.execute('DELETE FROM writes WHERE file = ?', (name,))
+            db.execute('DELETE FROM files WHERE file = ?', (name,))
+        for path in paths:
+            stat = path.stat()
+            if known.get(path.name) == (stat.st_mtime, stat.st_size):
+                continue
+            with h5py.File(str(path), mode='r') as file:
+                writes = int(file.attrs.get('writes', file['scales/sim_time'].shape[0]))
+                write_number = read_scale(file, 'write_number', writes)
+                sim_time = read_scale(file, 'sim_time', writes)
+                iteration = read_scale(file, 'iteration', writes)
+                timestep = read_scale(file, 'timestep', writes)
+            rows = [(int(write_number[i]), path.name, i, float(sim_time[i]), float(sim_time[i] / T),
+                     int(iteration[i]) if np.isfinite(iteration[i]) else None, float(timestep[i]))
+                    for i in range(writes)]
+            db.execute('DELETE FROM writes WHERE file = ?', (path.name,))
+            db.executemany('INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (path.name, stat.st_mtime, stat.st_size))
+    db.close()
+    return index_path
+
+class SnapshotIndex:
+    """
+    Lookups in the index of a snapshot directory. Each write is returned as a
+    dictionary of the columns of the index, with 'path' the set file
+
+    base_path   = directory of the set files and of the index
+    """
+
+    def __init__(self, base_path):
+        self.base_path = pathlib.Path(base_path)
+        index_path = self.base_path.joinpath(index_name)
+        if not index_path.exists():
+            raise ValueError("No snapshot index in {}, run snapshot_index.py first".format(self.base_path))
+        self.db = sqlite3.connect(str(index_path))
+        self.T = self.db.execute("SELECT value FROM meta WHERE key = 'T'").fetchone()[0]
+
+    def rows(self, query, values=()):
+        writes = []
+        for row in self.db.execute(query, values):
+            write = dict(zip(columns, row))
+            write['path'] = self.base_path.joinpath(write['file'])
+            writes.append(write)
+        return writes
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM writes').fetchone()[0]
+
+    def write(self, write_number):
+        # The write with this write number, None if there is none
+        writes = self.rows('SELECT * FROM writes WHERE write_number = ?', (write_number,))
+        return writes[0] if writes else None
+
+    def at_time(self, sim_time):
+        # The write closest to a sim time, from the writes on either side
+        before = self.rows('SELECT * FROM writes WHERE sim_time <= ? ORDER BY sim_time DESC LIMIT 1', (sim_time,))
+        after = self.rows('SELECT * FROM writes WHERE sim_time >= ? ORDER BY sim_time LIMIT 1', (sim_time,))
+        writes = before + after
+        if not writes:
+            return None
+        return min(writes, key=lambda write: abs(write['sim_time'] - sim_time))
+
+    def at_period(self, period):
+        # The write closest to a time in forcing periods
+        return self.at_time(period * self.T)
+
+    def between(self, t_start, t_stop):
+        # The writes with t_start <= sim time <= t_stop, in order
+        return self.rows('SELECT * FROM writes WHERE sim_time BETWEEN ? AND ? ORDER BY sim_time', (t_start, t_stop))
+
+    def last_periods(self, n_periods):
+        # The writes of the last n_periods forcing periods of the run
+        t_end = self.db.execute('SELECT MAX(sim_time) FROM writes').fetchone()[0]
+        if t_end is None:
+            return []
+        return self.between(t_end - n_periods * self.T, t_end)
+
+    def close(self):
+        self.db.close()
+
+if __name__ == "__main__":
+
+    from docopt import docopt
+    args = docopt(__doc__)
+    if args['--T'] is not None:
+        T = float(args['--T'])
+    else:
+        T = read_period(args['<base_path>'])
+    index_path = update_index(args['<base_path>'], T)
+    index = SnapshotIndex(args['<base_path>'])
+    if args['--write'] is not None:
+        writes = [index.write(int(args['--write']))]
+    elif args['--time'] is not None:
+        writes = [index.at_time(float(args['--time']))]
+    elif args['--period'] is not None:
+        writes = [index.at_period(float(args['--period']))]
+    elif args['--last'] is not None:
+        writes = index.last_periods(float(args['--last']))
+    else:
+        print('Indexed {} writes in {}'.format(len(index), index_path))
+        writes = []
+    for write in writes:
+        if write is None:
+            print('No such write')
+        else:
+            # Scales the handler did not record come back from SQLite as None
+            write = {key: np.nan if value is None else value for key, value in write.items()}
+            print('write {write_number}: {file}[{idx}], t = {sim_time:.4f} s = {period:.4f} T, iteration {iteration}, dt = {timestep:.4g}'.format(**write))
+    index.close()
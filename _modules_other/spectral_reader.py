@@ -0,0 +1,136 @@
+"""
+Grid data from snapshots saved in coefficient layout
+
+Snapshots saved with `snap_layout = 'c'` hold the Fourier (x) and Chebyshev
+(z) coefficients of each task, which are exact and more compact than grid
+data. The bases are described by attributes of the `scales` group of each
+file (type, interval, and size of each basis). GridTask reconstructs grid data
+only for the writes that are read, on the Dedalus grid at any scale, and only
+inside a given region. It behaves like an h5py dataset of grid data, so it
+can be passed to plot_bot.
+
+"""
+
+import numpy as np
+
+###############################################################################
+
+def write_bases(scale_group, domain):
+    # Describe the bases of the domain in the attributes of the scales group
+    for basis in domain.bases:
+        scale_group.attrs[basis.name + '_type'] = type(basis).__name__
+        scale_group.attrs[basis.name + '_interval'] = basis.interval
+        scale_group.attrs[basis.name + '_size'] = basis.base_grid_size
+
+def is_coefficient(dset):
+    # True if a task was saved in coefficient layout, with axes like 'kx'
+    return any(dset.dims[axis].label.startswith('k') for axis in range(1, dset.ndim))
+
+def native_grid(basis_type, n):
+    # Dedalus grid points on the native interval of each basis
+    if basis_type == 'Fourier':
+        return 2*np.pi * np.arange(n) / n
+    if basis_type == 'Chebyshev':
+        return -np.cos(np.pi * (np.arange(n) + 0.5) / n)
+    raise ValueError("Cannot reconstruct basis of type '{}'".format(basis_type))
+
+def problem_grid(basis_type, interval, native):
+    # Map native grid points to the interval of the problem
+    a, b = interval
+    if basis_type == 'Fourier':
+        return a + (b - a) * native / (2*np.pi)
+    return a + (b - a) * (native + 1) / 2
+
+def evaluation_matrix(basis_type, n_coeffs, native):
+    """
+    Matrix taking the coefficients of a basis to its values at native grid
+    points, with the Dedalus normalization of the coefficients
+    """
+    if basis_type == 'Fourier':
+        # Real Fourier basis: f = c_0 + 2 Re(sum_k c_k exp(i k x))
+        k = np.arange(n_coeffs)
+        weights = np.where(k == 0, 1.0, 2.0)
+        return weights * np.exp(1j * np.outer(native, k))
+    if basis_type == 'Chebyshev':
+        return np.polynomial.chebyshev.chebvander(native, n_coeffs - 1)
+    raise ValueError("Cannot reconstruct basis of type '{}'".format(basis_type))
+
+class Dim:
+    # Mimics an h5py dimension, with its label and scales
+    def __init__(self, label, scales):
+        self.label = label
+        self.scales = scales
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return dict(self.scales)[key]
+        return self.scales[key][1]
+
+    def __len__(self):
+        return len(self.scales)
+
+    def keys(self):
+        return [name for name, scale in self.scales]
+
+    def items(self):
+        return list(self.scales)
+
+class GridTask:
+    """
+    Grid data of a task saved in coefficient layout, reconstructed on read
+
+    file    = open snapshot file
+    dset    = coefficient dataset of the task, shape (writes, kx, kz)
+    scales  = scale of the grid along each axis, relative to the basis size
+    ranges  = (min, max) coordinates to reconstruct along each axis, None for all
+    """
+
+    def __init__(self, file, dset, scales=(1, 1), ranges=(None, None)):
+        self.dset = dset
+        scale_group = file['scales']
+        self.matrices = []
+        grids = []
+        for axis, (scale, bounds) in enumerate(zip(scales, ranges)):
+            name = dset.dims[axis+1].label[1:]
+            basis_type = scale_group.attrs[name + '_type']
+            if isinstance(basis_type, bytes):
+                basis_type = basis_type.decode()
+            interval = scale_group.attrs[name + '_interval']
+            n = int(np.round(scale_group.attrs[name + '_size'] * scale))
+            native = native_grid(basis_type, n)
+            grid = problem_grid(basis_type, interval, native)
+            # Only the points inside the region
+            if bounds is not None:
+                inside = (grid >= min(bounds)) & (grid <= max(bounds))
+                native, grid = native[inside], grid[inside]
+            self.matrices.append(evaluation_matrix(basis_type, dset.shape[axis+1], native))
+            grids.append((name, grid))
+        time_dim = dset.dims[0]
+        self.dims = [Dim(time_dim.label, [(key, time_dim[key]) for key in time_dim.keys()])]
+        self.dims += [Dim(name, [(name, grid)]) for name, grid in grids]
+        self.shape = (dset.shape[0],) + tuple(grid.size for name, grid in grids)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(np.float64)
+        self.attrs = dset.attrs
+        self.name = dset.name
+
+    def __len__(self):
+        return self.shape[0]
+
+    def reconstruct(self, coeffs):
+        # Grid values from the coefficients of one write
+        Ex, Ez = self.matrices
+        return np.real(Ex @ coeffs @ Ez.T)
+
+    def __getitem__(self, key):
+        # Only the selected writes are reconstructed
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),)*(self.ndim - len(key))
+        writes = np.arange(self.shape[0])[key[0]]
+        if np.ndim(writes) == 0:
+            return self.reconstruct(self.dset[int(writes)])[key[1:]]
+        data = np.zeros((writes.size,) + self.shape[1:], dtype=self.dtype)
+        for j, i in enumerate(writes):
+            data[j] = self.reconstruct(self.dset[int(i)])
+        return data[(slice(None),) + key[1:]]
@@ -0,0 +1,123 @@
+"""
+Per-phase timing of the main loop
+
+Times the phases of each iteration on every process and writes a JSON report
+with the minimum, mean, and maximum over processes of the time spent in each
+phase. Times are exclusive: time spent in a nested phase (for example a
+transpose during the output evaluation) is only counted in the nested phase.
+
+The phases inside solver.step are found by wrapping the Dedalus distributor's
+transforms and transposes and the evaluator's scheduled output, so what is
+left in 'step' is the linear solve, the RHS arithmetic, and other overhead.
+
+"""
+
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+###############################################################################
+
+class StepProfiler:
+    """
+    comm    = MPI communicator over which to aggregate the timings
+    enabled = if False, all timers do nothing
+    """
+
+    def __init__(self, comm, enabled=True):
+        self.comm = comm
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        # Stack of [name, start time, time spent in nested phases]
+        self.stack = []
+        self.start_time = time.time()
+
+    def start(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self):
+        name, start, nested = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.totals[name] += elapsed - nested
+        self.calls[name] += 1
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def wrap(self, name, func):
+        # Returns func, timed as the given phase
+        def func_timed(*args, **kw):
+            self.start(name)
+            try:
+                return func(*args, **kw)
+            finally:
+                self.stop()
+        func_timed.untimed = func
+        return func_timed
+
+    def timed(self, obj, method):
+        # Replaces a method of obj by its timed version, unwrapping any timing
+        #   left by a previous profiler (e.g. on a solver reused in a sweep)
+        func = getattr(obj, method)
+        func = getattr(func, 'untimed', func)
+        if self.enabled:
+            func = self.wrap(self.name_of(obj, method), func)
+        setattr(obj, method, func)
+
+    def instrument_solver(self, solver):
+        # Time the transforms, transposes, and output inside solver.step
+        for path in solver.domain.dist.paths:
+            for method in ['increment', 'decrement', 'increment_single', 'decrement_single']:
+                if hasattr(path, method):
+                    self.timed(path, method)
+        self.timed(solver.evaluator, 'evaluate_scheduled')
+
+    @staticmethod
+    def name_of(obj, method):
+        # Phase name of a wrapped method: 'transforms', 'transposes', or 'output'
+        if method == 'evaluate_scheduled':
+            return 'output'
+        return type(obj).__name__.lower() + 's'
+
+    def report(self, filename, iterations):
+        """
+        Aggregates the timings over all processes and writes them to a JSON
+        file from the root process. Must be called on every process.
+        """
+        if not self.enabled:
+            return
+        wall_time = time.time() - self.start_time
+        all_totals = self.comm.gather(dict(self.totals), root=0)
+        all_calls = self.comm.gather(dict(self.calls), root=0)
+        if self.comm.rank != 0:
+            return
+        names = sorted(set().union(*all_totals))
+        phases = {}
+        for name in names:
+            times = np.array([totals.get(name, 0.0) for totals in all_totals])
+            calls = np.array([calls.get(name, 0) for calls in all_calls])
+            phases[name] = {'min': float(times.min()),
+                            'mean': float(times.mean()),
+                            'max': float(times.max()),
+                            'fraction': float(times.mean()/wall_time),
+                            'calls': int(calls.max())}
+        report = {'processes': self.comm.size,
+                  'iterations': int(iterations),
+                  'wall_time': wall_time,
+                  'phases': phases}
+        with open(filename, 'w') as file:
+            json.dump(report, file, indent=4, sort_keys=True)
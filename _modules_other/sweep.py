@@ -0,0 +1,131 @@
+"""
+Helpers for running a parameter sweep within a single MPI job
+
+Each point of a sweep is a dictionary of switchboard overrides, set by
+`sweep_overrides` in the switchboard. The core code builds the domain once
+and only rebuilds the problem and solver when the physics of a sweep point
+differs from that of the previous point.
+
+"""
+
+import json
+import time
+import hashlib
+import pathlib
+from types import SimpleNamespace
+
+import numpy as np
+
+###############################################################################
+
+# Overrides that require the boundary forcing to be re-derived, in the order
+#   of the arguments of derive_forcing
+forcing_keys = ['N_0', 'k', 'omega', 'A', 'g', 'Dis_buff_x', 'x_sim_0', 'x_0']
+
+# Overrides that move the simulated domain, whose corners are re-derived
+#   from them as in the switchboard
+geometry_keys = ['L_x', 'L_z', 'Dis_buff_x', 'Dis_buff_z', 'x_0', 'z_0']
+
+# Switchboard parameters which enter the problem or the solver.
+#   If these are unchanged between sweep points, the solver is reused
+physics_keys = ['n_x', 'n_z', 'dealias', 'x_sim_0', 'x_sim_f', 'z_sim_0',
+                'z_sim_f', 'nu', 'kappa', 'N_0', 'k_x', 'k_z', 'omega', 'g',
+                'T', 'nT', 'bf_slope', 'bfl_edge', 'bfr_edge', 'PolRel',
+                'window', 'ramp', 'fu', 'fw', 'fb', 'use_separable_forcing',
+                'timestepper']
+
+# Switchboard parameters which define the domain
+domain_keys = ['n_x', 'n_z', 'dealias', 'x_sim_0', 'x_sim_f', 'z_sim_0', 'z_sim_f',
+               'process_mesh']
+
+def switchboard_namespace(sbp):
+    # Copy the parameters of the switchboard module into a namespace
+    params = {key: val for key, val in vars(sbp).items() if not key.startswith('__')}
+    return SimpleNamespace(**params)
+
+def apply_overrides(sbp, overrides, index):
+    """
+    Returns a copy of the switchboard parameters with the overrides of
+    one sweep point applied
+
+    sbp         = switchboard module
+    overrides   = dictionary of switchboard parameters to change
+    index       = index of the sweep point, used to name its output directory
+    """
+    params = switchboard_namespace(sbp)
+    for key, val in overrides.items():
+        if not hasattr(params, key):
+            raise ValueError("Sweep override '{}' is not a switchboard parameter".format(key))
+        setattr(params, key, val)
+    # Re-derive the corners of the simulated domain, unless overridden too
+    if any(key in overrides for key in geometry_keys):
+        corners = {'x_sim_0': params.x_0 - params.Dis_buff_x,
+                   'z_sim_0': params.z_0 + params.Dis_buff_z}
+        corners['x_sim_f'] = overrides.get('x_sim_0', corners['x_sim_0']) + params.L_x
+        corners['z_sim_f'] = overrides.get('z_sim_0', corners['z_sim_0']) - params.L_z
+        for key, val in corners.items():
+            if key not in overrides:
+                setattr(params, key, val)
+    # Re-derive the boundary forcing from the specified parameters
+    if any(key in overrides for key in forcing_keys + geometry_keys):
+        if params.derive_forcing is None:
+            raise ValueError("Boundary forcing module cannot re-derive forcing for sweep")
+        derived = params.derive_forcing(*[getattr(params, key) for key in forcing_keys])
+        for key, val in derived.items():
+            setattr(params, key, val)
+    # Stopping time follows the (possibly new) forcing period
+    if params.use_stop_sim_time == False:
+        params.stop_sim_time = params.stop_n_periods * params.T
+    # Each sweep point writes into its own snapshots directory
+    params.snapshots_dir = '{}/{}_{:03d}'.format(sbp.snapshots_dir, sbp.sweep_dir, index)
+    params.checkpoint_dir = '{}/{}'.format(params.snapshots_dir, sbp.checkpoint_dir)
+    return params
+
+def domain_key(params):
+    # The parameters of the bases, which the domain is built from
+    return tuple(getattr(params, key) for key in domain_keys)
+
+def physics_key(params, profiles):
+    """
+    Returns a hash of everything that goes into building the problem
+
+    params      = switchboard parameters of one sweep point
+    profiles    = list of arrays of vertical profiles (BP, SL) on the global z grid
+    """
+    sha = hashlib.sha1()
+    for key in physics_keys:
+        val = getattr(params, key)
+        if isinstance(val, dict):
+            val = sorted(val.items())
+        sha.update(repr((key, val)).encode())
+    for profile in profiles:
+        sha.update(np.ascontiguousarray(profile, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+def write_sweep_point(params, overrides, index):
+    # Record the overrides of this sweep point next to its output
+    point_dir = pathlib.Path(params.snapshots_dir)
+    point_dir.mkdir(parents=True, exist_ok=True)
+    with open(str(point_dir.joinpath('sweep_point.json')), 'w') as file:
+        json.dump({'index': index, 'overrides': overrides}, file, indent=4, default=str)
+
+def reset_solver(solver, timestepper):
+    """
+    Resets a built solver so it can integrate another sweep point from t=0
+    without rebuilding and refactorizing the pencil matrices
+
+    solver      = Dedalus initial value solver
+    timestepper = Dedalus timestepper class used to build the solver
+    """
+    from dedalus.core.evaluator import SystemHandler
+    # Keep only the handler which evaluates the RHS of the equations
+    evaluator = solver.evaluator
+    evaluator.handlers = [h for h in evaluator.handlers if isinstance(h, SystemHandler)]
+    # Zero the state
+    for field in solver.state.fields:
+        field['c'] = 0
+    # Reset the clocks and the timestepper history
+    solver.sim_time = solver.initial_sim_time = 0.0
+    solver.iteration = solver.initial_iteration = 0
+    solver.timestepper = timestepper(solver.state.nfields, solver.domain)
+    solver.start_time = time.time()
@@ -0,0 +1,113 @@
+"""
+Wall time budget for the main loop
+
+Keeps moving averages of the time per step and the time per snapshot write,
+and stops the main loop while there is still enough wall time left to finish
+the next writes and a final checkpoint before the scheduler's limit.
+
+The wall time limit is read from an environment variable holding the time
+(in seconds since the epoch) at which the job will be killed, as set in
+lanceur.slrm. If it is not set, the limit is `stop_wall_time` minutes after
+the start of the run.
+
+"""
+
+import os
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+###############################################################################
+
+class WallBudget:
+    """
+    solver          = Dedalus initial value solver
+    stop_wall_time  = fallback wall time limit in minutes from now
+    end_env         = name of the environment variable with the end time
+    safety_factor   = multiplies the predicted time needed to stop cleanly
+    margin          = extra seconds kept in reserve
+    check_cadence   = iterations between checks, which need a broadcast
+    smoothing       = weight of the newest sample in the moving averages
+    """
+
+    def __init__(self, solver, stop_wall_time, end_env='WALL_END_EPOCH', safety_factor=2.0, margin=30.0, check_cadence=10, smoothing=0.1):
+        self.solver = solver
+        self.comm = solver.domain.dist.comm_cart
+        self.check_cadence = check_cadence
+        self.safety_factor = safety_factor
+        self.margin = margin
+        self.smoothing = smoothing
+        # Time at which the job will be killed
+        self.end_time = time.time() + stop_wall_time*60.0
+        env_end = os.environ.get(end_env)
+        if env_end:
+            self.end_time = min(self.end_time, float(env_end))
+        # Moving averages, in seconds
+        self.step_time = None
+        self.io_time = None
+        self.checkpoint_time = None
+        self.step_io = 0.0
+
+    def average(self, old, new):
+        if old is None:
+            return new
+        return (1.0 - self.smoothing)*old + self.smoothing*new
+
+    def watch_file_handlers(self, handlers):
+        # Time every write of the handlers which write files
+        for handler in handlers:
+            if hasattr(handler, 'base_path'):
+                handler.process = self.timed_write(handler.process)
+
+    def timed_write(self, process):
+        def process_timed(*args, **kw):
+            start = time.time()
+            result = process(*args, **kw)
+            self.step_io += time.time() - start
+            return result
+        return process_timed
+
+    def watch_checkpointer(self, checkpointer):
+        # Time every checkpoint that is actually written
+        write = checkpointer.write
+        def write_timed(*args, **kw):
+            start = time.time()
+            last_iteration = checkpointer.last_iteration
+            result = write(*args, **kw)
+            if checkpointer.last_iteration != last_iteration:
+                self.record_checkpoint(time.time() - start)
+            return result
+        checkpointer.write = write_timed
+
+    def record_step(self, elapsed):
+        # Call after each step with its total wall time
+        if self.step_io > 0:
+            self.io_time = self.average(self.io_time, self.step_io)
+        self.step_time = self.average(self.step_time, elapsed - self.step_io)
+        self.step_io = 0.0
+
+    def record_checkpoint(self, elapsed):
+        self.checkpoint_time = self.average(self.checkpoint_time, elapsed)
+
+    def remaining(self):
+        return self.end_time - time.time()
+
+    def needed(self):
+        # Predicted time to reach the next check, write, and checkpoint
+        step = self.step_time or 0.0
+        io = self.io_time or 0.0
+        # Until a checkpoint has been timed, assume it costs a full write
+        checkpoint = self.checkpoint_time if self.checkpoint_time is not None else io
+        return self.safety_factor*(self.check_cadence*step + io + checkpoint) + self.margin
+
+    def should_stop(self):
+        # Call once per iteration, the root process decides for everyone
+        if self.solver.iteration % self.check_cadence != 0:
+            return False
+        stop = False
+        if self.comm.rank == 0:
+            stop = self.remaining() < self.needed()
+            if stop:
+                logger.info('Wall time left {:.1f} s, needed to stop cleanly {:.1f} s'.format(self.remaining(), self.needed()))
+        return self.comm.bcast(stop, root=0)
@@ -22,19 +22,6 @@ N_0     = 1.0                   # [rad/s]
 k       = 45                    # [m^-1]
 # 3. Oscillation frequency
 omega   = 0.7071                # [rad s^-1]
-# Use the equations given in Cushman-Roisin and Beckers ch 13 for the rest:
-# 4. Angle of beam w.r.t. the horizontal (eq 13.6, dispersion relation)
-theta   = np.arccos(omega/N_0)  # [rad]
-# 5. Horizontal wavenumber = k*cos(\theta)
-k_x     = k*omega/N_0           # [m^-1]
-# 6. Vertical wavenumber
-k_z     = k*np.sin(theta)       # [m^-1]
-
-# Other parameters specified by relations
-# Horizontal wavelength
-lam_x   = 2*np.pi / k_x         # [m]
-# Oscillation period = 2pi / omega
-T       = 2*np.pi / omega       # [s]
 
 ###############################################################################
 # Dedalus syntax substitutions for spatial window and temporal ramp
@@ -49,29 +36,60 @@ nT        = 3.0
 bf_slope  = 35
 # Number of horizontal wavelengths that fit into the window
 win_lams  = 1
-# Width of window
-win_width = lam_x * win_lams
-# Check if 1/2 window width fits to the left of display domain
-Dis_buff_x= sbp.Dis_buff_x
-if (0.5 * win_width < Dis_buff_x):
-    # It will fit, put 1/2 on left, 1/2 on right
-    x_sim_0  = sbp.x_sim_0
-    bfl_edge = x_sim_0 - lam_x/2.0
-    bfr_edge = x_sim_0 + lam_x/2.0
-else:
-    # It will not fit, put as far left as possible
-    x_0      = sbp.x_0
-    bfl_edge = x_0
-    bfr_edge = x_0 + lam_x
 
 ###############################################################################
-# Polarization relation from Cushman-Roisin and Beckers eq (13.7)
-#   (signs implemented in substitutions below)
-PolRel = {'u': A*(sbp.g*omega*k_z)/(N_0**2*k_x),
-          'w': A*(sbp.g*omega)/(N_0**2),
-          'b': A*sbp.g}
-          #'p': A*(g*(omega**2)*kz)/((N0**2)*(kx**2))}
-          #'p': A*(g*rho_0*kz)/(kx**2+kz**2)} # relation for p not used
+# Derived forcing parameters
+
+def derive_forcing(N_0, k, omega, A, g, Dis_buff_x, x_sim_0, x_0):
+    """
+    Returns a dictionary of the forcing parameters that follow from the
+    3 specified ones, the forcing amplitude, gravity, and the position of the
+    domain. Used below, and by the parameter sweep to re-derive the forcing
+    for each sweep point.
+    """
+    # Use the equations given in Cushman-Roisin and Beckers ch 13 for the rest:
+    # 4. Angle of beam w.r.t. the horizontal (eq 13.6, dispersion relation)
+    theta   = np.arccos(omega/N_0)  # [rad]
+    # 5. Horizontal wavenumber = k*cos(\theta)
+    k_x     = k*omega/N_0           # [m^-1]
+    # 6. Vertical wavenumber
+    k_z     = k*np.sin(theta)       # [m^-1]
+    # Other parameters specified by relations
+    # Horizontal wavelength
+    lam_x   = 2*np.pi / k_x         # [m]
+    # Oscillation period = 2pi / omega
+    T       = 2*np.pi / omega       # [s]
+    # Width of window
+    win_width = lam_x * win_lams
+    # Check if 1/2 window width fits to the left of display domain
+    if (0.5 * win_width < Dis_buff_x):
+        # It will fit, put 1/2 on left, 1/2 on right
+        bfl_edge = x_sim_0 - lam_x/2.0
+        bfr_edge = x_sim_0 + lam_x/2.0
+    else:
+        # It will not fit, put as far left as possible
+        bfl_edge = x_0
+        bfr_edge = x_0 + lam_x
+    # Polarization relation from Cushman-Roisin and Beckers eq (13.7)
+    #   (signs implemented in substitutions below)
+    PolRel = {'u': A*(g*omega*k_z)/(N_0**2*k_x),
+              'w': A*(g*omega)/(N_0**2),
+              'b': A*g}
+              #'p': A*(g*(omega**2)*kz)/((N0**2)*(kx**2))}
+              #'p': A*(g*rho_0*kz)/(kx**2+kz**2)} # relation for p not used
+    return {'N_0': N_0, 'k': k, 'omega': omega, 'A': A, 'theta': theta,
+            'k_x': k_x, 'k_z': k_z, 'lam_x': lam_x, 'T': T,
+            'bfl_edge': bfl_edge, 'bfr_edge': bfr_edge, 'PolRel': PolRel}
+
+derived   = derive_forcing(N_0, k, omega, A, sbp.g, sbp.Dis_buff_x, sbp.x_sim_0, sbp.x_0)
+theta     = derived['theta']        # [rad]
+k_x       = derived['k_x']          # [m^-1]
+k_z       = derived['k_z']          # [m^-1]
+lam_x     = derived['lam_x']        # [m]
+T         = derived['T']            # [s]
+bfl_edge  = derived['bfl_edge']     # [m]
+bfr_edge  = derived['bfr_edge']     # [m]
+PolRel    = derived['PolRel']       # Dictionary of coefficients for variables
 
 ###############################################################################
 # Substitutions for boundary forcing (see C-R & B eq 13.7)
@@ -79,3 +97,14 @@ fu      = "-BFu*sin(kx*x + kz*z - omega*t)*window*ramp"
 fw      = " BFw*sin(kx*x + kz*z - omega*t)*window*ramp"
 fb      = "-BFb*cos(kx*x + kz*z - omega*t)*window*ramp"
 fp      = "-BFp*sin(kx*x + kz*z - omega*t)*window*ramp"
+
+###############################################################################
+# Separable form of the forcing substitutions above
+#   Sign and phase function of each forcing substitution
+forcing_phases = {'u': (-1, 'sin'),
+                  'w': ( 1, 'sin'),
+                  'b': (-1, 'cos')}
+
+# Numpy version of the window substitution
+def build_window_array(x, slope, left_edge, right_edge):
+    return (1/2)*(np.tanh(slope*(x-left_edge))+1)*(1/2)*(np.tanh(slope*(-x+right_edge))+1)
@@ -16,6 +16,9 @@ n_x = 256                   # []
 n_z = 512                   # []
 # Dealias factor
 dealias = 3/2               # []
+# MPI process mesh, None to let Dedalus choose. See mesh_planner.py for the
+#   best number of processes, or run with `-c auto`
+process_mesh = None         # [] list of processes along each split axis
 # Stopping conditions for the simulation
 stop_n_periods = 10          # [] oscillation periods
 stop_wall_time = 60         # [minutes]
@@ -24,13 +27,44 @@ stop_sim_time  = 3          # [s] to be calculated from stop_n_periods later
 
 # If True, the program will use stop_sim_time, if False, stop_n_periods*T
 use_stop_sim_time = False
+# Timestepper, any of the Dedalus timesteppers (RK111, RK222, RK443, SBDF1-4,
+#   CNAB1-2, MCNAB2, CNLF2). See bench_timesteppers.py to compare them
+timestepper = 'RK222'
 # Initial time step size
 dt = 0.125
 # Determine whether adaptive time stepping is on or off
 adapt_dt = False             # {T/F}
+# If True, precompute the spatial part of the boundary forcing once and only
+#   evaluate its time dependence each step (see forcing.py). Check that it
+#   agrees with the string substitutions with bench_forcing.py first
+use_separable_forcing = False # {T/F}
 # Restart simulation parameters
 restart_add_time = stop_sim_time
 restart_file  = 'restart.h5'
+# Checkpoints of the solver state, resumed from automatically if a run is killed
+use_checkpoints    = True   # {T/F}
+checkpoint_dir     = 'checkpoints'
+checkpoint_iter    = 1000   # [] iterations between checkpoints, None to disable
+checkpoint_wall_dt = 10     # [minutes] wall time between checkpoints, None to disable
+checkpoint_keep    = 2      # [] number of newest checkpoints to keep
+# Stop the main loop early enough to write a final checkpoint before the
+#   scheduler's wall time limit, read from the environment variable below
+#   (seconds since the epoch, set in lanceur.slrm), or else from stop_wall_time
+use_wall_budget    = True   # {T/F}
+wall_end_env       = 'WALL_END_EPOCH'
+wall_safety_factor = 2.0    # [] multiplies the predicted time needed to stop
+wall_margin        = 30     # [s] extra time kept in reserve
+# Cache the solver's pencil matrices on disk, to skip assembling them on
+#   later runs with the same grid, equations, LHS parameters, and number of
+#   processes. The LU factorizations are still computed on the first step
+use_matrix_cache  = False   # {T/F}
+matrix_cache_dir  = '../_matrix_cache'
+matrix_cache_keep = 4       # [] number of most recently used entries to keep
+# Time the phases of each step (transforms, transposes, solve, output, CFL,
+#   flow properties) and write a report of their min/mean/max over processes
+#   to the snapshots directory at the end of the run
+profile_steps  = False        # {T/F}
+profile_report = 'timing_report.json'
 
 ###############################################################################
 # Domain parameters
@@ -90,12 +124,50 @@ n_clrbar_ticks = 3
 font_size   = 12
 scale       = 2.5
 dpi         = 100
+# Grid scale at which snapshots saved in coefficient layout are plotted
+plot_scale  = 1
+# If True, frames are resampled from the Chebyshev grid onto a uniform grid
+#   and drawn with imshow, which is faster than pcolormesh. See
+#   bench_render.py for the speed up and the difference in pixels
+plot_uniform        = False # {T/F}
+plot_uniform_points = None  # [] points of the uniform grid in z, None for n_z
 
 ###############################################################################
 # Snapshot parameters
 snapshots_dir   = 'snapshots'
 snap_dt         = 0.25
 snap_max_writes = 50
+# Variables and derived expressions to save, as {name: expression}. The
+#   first-order variables (bz, uz, wz) are left out by default, as resuming
+#   uses the checkpoints. Set to None to save the whole state of the solver,
+#   which restarting from restart.h5 needs
+snap_tasks      = {'b': 'b', 'p': 'p', 'u': 'u', 'w': 'w'}
+# Precision in which the snapshots are stored, 'float32' or 'float64', None
+#   for the type of the data. Restarts from float32 snapshots lose precision
+snap_precision  = None
+# Layout of the snapshots, 'g' for grid data or 'c' for the Fourier and
+#   Chebyshev coefficients, which plot_slices.py evaluates on the grid at
+#   plot_scale, only inside the plotted region
+snap_layout     = 'g'
+# HDF5 layout of the snapshot datasets. See bench_compression.py for the
+#   write cost and size of each compression option
+snap_chunk_writes     = True    # {T/F} one chunk per write of each task
+snap_compression      = None    # None, 'gzip', or 'lzf' (lossless)
+snap_compression_opts = 1       # [] gzip level, 1 (fast) to 9 (small)
+snap_shuffle          = True    # {T/F} shuffle bytes before compressing
+# If True and h5py was built with MPI, all processes write into one file per
+#   set, which needs no merging (compression is then skipped). Otherwise,
+#   each process writes its own file
+snap_parallel         = True    # {T/F}
+# If True, the snapshots only save the region below, keeping every n-th point
+#   along x and z, in one file per set written by the root process. Needs
+#   snap_layout = 'g' and snap_parallel = False
+snap_use_region  = False
+snap_region_x    = (x_0, x_0 + L_x_dis)     # [m] None for all of x
+snap_region_z    = (z_t - L_z_dis, z_t)     # [m] None for all of z
+snap_decimate    = (1, 1)                   # [] in x and z
+# If True, the region stops at the top of the sponge layer
+snap_skip_sponge = True
 
 # Background profile snapshot parameters
 take_bp_snaps   = True
@@ -111,6 +183,10 @@ sl_snap_dir     = 'sl_snaps'
 sl_task         = "SL"
 sl_task_name    = 'sl'
 
+# If True, the BP and SL profiles above are written once, as 1D profiles in
+#   snapshots_dir/profiles.h5, instead of as 2D snapshots every snap_dt
+static_profiles = True
+
 ###############################################################################
 # CFL parameters
 CFL_cadence     = 10
@@ -121,12 +197,22 @@ CFL_max_dt      = 0.125
 CFL_threshold   = 0.05
 
 ###############################################################################
-# Flow properties
+# Flow properties, reduced without blocking (see diagnostics.py), so the
+#   value logged every flow_cadence iterations is from one cadence earlier
 flow_cadence    = 10
 flow_property   = "(kx*u + kz*w)/omega"
 flow_name       = 'Lin_Criterion'
 flow_log_message= 'Max linear criterion = {0:f}'
 
+###############################################################################
+# Parameter sweep
+#   Each dictionary of switchboard overrides is one sweep point. All points are
+#   run in turn in the same MPI job. Leave empty to run a single experiment
+#   For example: [{'omega': 0.5}, {'omega': 0.7071, 'A': 1.0e-4}]
+sweep_overrides = []
+# Name of the output directory of each sweep point, under snapshots_dir
+sweep_dir       = 'sweep'
+
 ###############################################################################
 ################    Shouldn't need to edit below here    #####################
 ###############################################################################
@@ -179,6 +265,13 @@ fu      = bf.fu
 fw      = bf.fw
 fb      = bf.fb
 fp      = bf.fp
+# Function to re-derive the forcing parameters, used for parameter sweeps
+derive_forcing = getattr(bf, 'derive_forcing', None)
+# Separable form of the forcing, if the boundary forcing file provides it
+forcing_phases      = getattr(bf, 'forcing_phases', None)
+build_window_array  = getattr(bf, 'build_window_array', None)
+if forcing_phases is None or build_window_array is None:
+    use_separable_forcing = False
 
 ###############################################################################
 # Background Density Profile
@@ -197,6 +290,10 @@ sys.path.insert(0, p_module_dir)
 import sponge_layer as sl
 # The sponge layer profile generator function
 build_sl_array = sl.build_sl_array
+# Leave the sponge layer out of the snapshot region
+z_sl_top = getattr(sl, 'z_sl_top', None)
+if snap_skip_sponge and use_sponge and z_sl_top is not None and snap_region_z is not None:
+    snap_region_z = (max(min(snap_region_z), z_sl_top), max(snap_region_z))
 
 ###############################################################################
 # Cleaning up the _modules-physics directory tree
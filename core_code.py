@@ -14,11 +14,25 @@ This will create a new directory for your experiment under `_experiments`. Edit
 To run an experiment, run the `run.sh` script with the `-n`, `-c`, `-l`, `-v` flags, as specified in that script's header. Running an experiment again will overwrite the old outputs.
     $ sh run.sh -n my_new_exp -c 2 -l 1 -v 1
 
+To run a parameter sweep, list the switchboard overrides of each sweep point in `sweep_overrides` in the switchboard. All points are run one after another in the same MPI job, reusing the domain, and reusing the solver whenever the physics of consecutive points is the same. Each point writes its outputs to its own directory under the snapshots directory.
+
 ---
-This script can restart the simulation from the last save of the original
+With `use_checkpoints` on in the switchboard, the solver state is written to
+the checkpoints directory periodically (and at the end of the run), keeping
+the newest few. A killed run can be resumed from the newest complete
+checkpoint, if the switchboard and physics parameters are unchanged, dropping
+the snapshots written after that checkpoint:
+    $ sh run.sh -n my_new_exp -c 2 -v 2 -r 1
+Without `-r 1`, run.sh removes the checkpoints and starts over. A finished run
+can be extended by N periods from its final checkpoint, appending new
+snapshot sets:
+    $ sh run.sh -n my_new_exp -c 2 -v 2 -e N
+
+This script can also restart the simulation from the last save of the original
 output to extend the integration.  This requires that the output files from
 the original simulation are merged, and the last is symlinked or copied to
-`restart.h5`.
+`restart.h5`. The snapshots must then hold the whole state, with
+`snap_tasks = None` in the switchboard.
 
 To run the original example and the restart, you could use:
     $ mpiexec -n 4 python3 rayleigh_benard.py
@@ -30,6 +44,7 @@ The simulations should take a few process-minutes to run.
 
 """
 
+import h5py
 import numpy as np
 from mpi4py import MPI
 comm = MPI.COMM_WORLD
@@ -47,243 +62,505 @@ logger = logging.getLogger(__name__)
 ###############################################################################
 # Checking command line arguments
 import sys
-# Arguments must be passed in the correct order
-arg_array = sys.argv
-filename = str(arg_array[0])
-switchboard = str(arg_array[1])
 
-if rank==0:
+def parse_arguments(arg_array):
+    """
+    Returns the switchboard and the number of periods to extend a finished
+    run by, from its last checkpoint (0 for a normal run). Only read when the
+    core code is run, not when it is imported by the benchmarks
+
+    arg_array   = command line arguments, in the order:
+                  core code, switchboard, [periods to extend by]
+    """
     # Check number of arguments passed in
-    if (len(arg_array) != 2):
-        print("Wrong number of arguments passed to core code")
-        print("")
-    #print('Core code filename:', filename)
-    #print('Using switchboard:', switchboard)
-    #print("")
+    if (len(arg_array) not in [2, 3]):
+        raise ValueError("Wrong number of arguments passed to core code: {}".format(arg_array[1:]))
+    switchboard = str(arg_array[1])
+    extend_n_periods = float(arg_array[2]) if len(arg_array) == 3 else 0.0
+    return switchboard, extend_n_periods
 
 ###############################################################################
 # Import SwitchBoard Parameters (sbp)
 #   This also runs the switchboard file, which will move files around
 import switchboard as sbp
 
-# Call parameters by sbp.some_param. For example:
-nx = sbp.n_x #256
-nz = sbp.n_z #64
+# Helper modules for the core code
+sys.path.insert(0, './_modules_other/')
+import sweep
+import matrix_cache
+import forcing
+from noise import local_noise
+import checkpoints
+import wall_budget
+import step_profiler
+import diagnostics
+import profiles
+import snapshot_index
+from file_handler_mod import FileHandlerMod, parallel_available, truncate_sets
+from region_handler import RegionFileHandler
 
 ###############################################################################
 # Create bases and domain
-x_basis = de.Fourier('x',   nx, interval=(sbp.x_sim_0, sbp.x_sim_f), dealias=sbp.dealias)
-z_basis = de.Chebyshev('z', nz, interval=(sbp.z_sim_f, sbp.z_sim_0), dealias=sbp.dealias)
-domain = de.Domain([x_basis, z_basis], grid_dtype=np.float64)
-# Get x and z grids into variables. Used for BP and initial conditions
-x = domain.grid(0)
-z = domain.grid(1)
+def build_domain(sbp):
+    # Call parameters by sbp.some_param. For example:
+    nx = sbp.n_x #256
+    nz = sbp.n_z #64
+    x_basis = de.Fourier('x',   nx, interval=(sbp.x_sim_0, sbp.x_sim_f), dealias=sbp.dealias)
+    z_basis = de.Chebyshev('z', nz, interval=(sbp.z_sim_f, sbp.z_sim_0), dealias=sbp.dealias)
+    domain = de.Domain([x_basis, z_basis], grid_dtype=np.float64, mesh=sbp.process_mesh)
+    return domain
 
 ###############################################################################
 # 2D Boussinesq hydrodynamics
-problem = de.IVP(domain, variables=['p','b','u','w','bz','uz','wz'])
-# From Nico: all variables are dirchlet by default, so only need to
-#   specify those that are not dirchlet (variables w/o top & bottom bc's)
-problem.meta['p','bz','uz','wz']['z']['dirichlet'] = False
-# Parameters for the equations of motion
-problem.parameters['NU'] = sbp.nu
-problem.parameters['KA'] = sbp.kappa
-problem.parameters['N0'] = sbp.N_0
-
-###############################################################################
-# Forcing from the boundary
-
-# Polarization relation from boundary forcing file
-PolRel = sbp.PolRel
-# Creating forcing amplitudes
-for fld in ['u', 'w', 'b']:#, 'p']:
-    BF = domain.new_field()
-    BF.meta['x']['constant'] = True  # means the NCC is constant along x
-    BF['g'] = PolRel[fld]
-    problem.parameters['BF' + fld] = BF  # pass function in as a parameter.
-    del BF
-# Parameters for boundary forcing
-problem.parameters['kx']        = sbp.k_x
-problem.parameters['kz']        = sbp.k_z
-problem.parameters['omega']     = sbp.omega
-problem.parameters['grav']      = sbp.g # can't use 'g': Dedalus uses that for grid
-problem.parameters['T']         = sbp.T # [s] period of oscillation
-problem.parameters['nT']        = sbp.nT # number of periods for the ramp
-# Spatial window and temporal ramp for boundary forcing
-problem.parameters['slope']     = sbp.bf_slope
-problem.parameters['left_edge'] = sbp.bfl_edge
-problem.parameters['right_edge']= sbp.bfr_edge
-problem.substitutions['window'] = sbp.window
-problem.substitutions['ramp']   = sbp.ramp
-# Substitutions for boundary forcing (see C-R & B eq 13.7)
-problem.substitutions['fu']     = sbp.fu
-problem.substitutions['fw']     = sbp.fw
-problem.substitutions['fb']     = sbp.fb
-#problem.substitutions['fp']     = sbp.fp
-
-###############################################################################
-# Sponge Layer (SL) as an NCC
-SL = domain.new_field()
-SL.meta['x']['constant'] = True  # means the NCC is constant along x
-SL_array = sbp.build_sl_array(z)
-SL['g'] = SL_array
-problem.parameters['SL'] = SL
-
-###############################################################################
-# Background Profile (BP) as an NCC
-BP = domain.new_field()
-BP.meta['x']['constant'] = True  # means the NCC is constant along x
-BP_array = sbp.build_bp_array(z)
-BP['g'] = BP_array
-problem.parameters['BP'] = BP
-
-###############################################################################
-# Equations of motion (non-linear terms on RHS)
-#   Mass conservation equation
-problem.add_equation("dx(u) + wz = 0")
-#   Equation of state (in terms of buoyancy)
-problem.add_equation("dt(b) - KA*(dx(dx(b)) + dz(bz))"
-                    + "= -((N0*BP)**2)*w - (u*dx(b) + w*bz)")
-#   Horizontal momentum equation
-problem.add_equation("dt(u) - NU*dx(dx(u)) - NU*dz(uz) + dx(p) + (SL-1)*u"
-                    + "= - (u*dx(u) + w*uz)")
-#   Vertical momentum equation
-problem.add_equation("dt(w) - NU*dx(dx(w)) - NU*dz(wz) + dz(p) - b + (SL-1)*w"
-                    + "= - (u*dx(w) + w*wz)")
-# Required for solving differential equations in Chebyshev dimension
-problem.add_equation("bz - dz(b) = 0")
-problem.add_equation("uz - dz(u) = 0")
-problem.add_equation("wz - dz(w) = 0")
-
-###############################################################################
-# Boundary contitions
-#	Using Fourier basis for x automatically enforces periodic bc's
-#   Left is bottom, right is top
-# Solid top/bottom boundaries
-problem.add_bc("left(u) = 0")
-problem.add_bc("right(u) = right(fu)")
-# Free top/bottom boundaries
-#problem.add_bc("left(uz) = 0")
-#problem.add_bc("right(uz) = 0")
-# No-slip top/bottom boundaries?
-problem.add_bc("left(w) = 0", condition="(nx != 0)") # redunant in constant mode (nx==0)
-problem.add_bc("right(w) = right(fw)")
-# Buoyancy = zero at top/bottom
-problem.add_bc("left(b) = 0")
-problem.add_bc("right(b) = right(fb)")
-# Sets gauge pressure to zero in the constant mode
-problem.add_bc("left(p) = 0", condition="(nx == 0)") # required because of above redundancy
+def build_problem(domain, sbp):
+    # Get x and z grids into variables. Used for BP and initial conditions
+    x = domain.grid(0)
+    z = domain.grid(1)
+
+    problem = de.IVP(domain, variables=['p','b','u','w','bz','uz','wz'])
+    # From Nico: all variables are dirchlet by default, so only need to
+    #   specify those that are not dirchlet (variables w/o top & bottom bc's)
+    problem.meta['p','bz','uz','wz']['z']['dirichlet'] = False
+    # Parameters for the equations of motion
+    problem.parameters['NU'] = sbp.nu
+    problem.parameters['KA'] = sbp.kappa
+    problem.parameters['N0'] = sbp.N_0
+
+    ###########################################################################
+    # Forcing from the boundary
+
+    # Polarization relation from boundary forcing file
+    PolRel = sbp.PolRel
+    # Creating forcing amplitudes
+    for fld in ['u', 'w', 'b']:#, 'p']:
+        BF = domain.new_field()
+        BF.meta['x']['constant'] = True  # means the NCC is constant along x
+        BF['g'] = PolRel[fld]
+        problem.parameters['BF' + fld] = BF  # pass function in as a parameter.
+        del BF
+    # Parameters for boundary forcing
+    problem.parameters['kx']        = sbp.k_x
+    problem.parameters['kz']        = sbp.k_z
+    problem.parameters['omega']     = sbp.omega
+    problem.parameters['grav']      = sbp.g # can't use 'g': Dedalus uses that for grid
+    problem.parameters['T']         = sbp.T # [s] period of oscillation
+    problem.parameters['nT']        = sbp.nT # number of periods for the ramp
+    # Spatial window and temporal ramp for boundary forcing
+    problem.parameters['slope']     = sbp.bf_slope
+    problem.parameters['left_edge'] = sbp.bfl_edge
+    problem.parameters['right_edge']= sbp.bfr_edge
+    problem.substitutions['window'] = sbp.window
+    problem.substitutions['ramp']   = sbp.ramp
+    if sbp.use_separable_forcing:
+        # Precomputed spatial part, only the time dependence is evaluated
+        forcing.add_separable_forcing(domain, problem, sbp)
+    else:
+        # Substitutions for boundary forcing (see C-R & B eq 13.7)
+        problem.substitutions['fu']     = sbp.fu
+        problem.substitutions['fw']     = sbp.fw
+        problem.substitutions['fb']     = sbp.fb
+        #problem.substitutions['fp']     = sbp.fp
+
+    ###########################################################################
+    # Sponge Layer (SL) as an NCC
+    SL = domain.new_field()
+    SL.meta['x']['constant'] = True  # means the NCC is constant along x
+    SL_array = sbp.build_sl_array(z)
+    SL['g'] = SL_array
+    problem.parameters['SL'] = SL
+
+    ###########################################################################
+    # Background Profile (BP) as an NCC
+    BP = domain.new_field()
+    BP.meta['x']['constant'] = True  # means the NCC is constant along x
+    BP_array = sbp.build_bp_array(z)
+    BP['g'] = BP_array
+    problem.parameters['BP'] = BP
+
+    ###########################################################################
+    # Equations of motion (non-linear terms on RHS)
+    #   Mass conservation equation
+    problem.add_equation("dx(u) + wz = 0")
+    #   Equation of state (in terms of buoyancy)
+    problem.add_equation("dt(b) - KA*(dx(dx(b)) + dz(bz))"
+                        + "= -((N0*BP)**2)*w - (u*dx(b) + w*bz)")
+    #   Horizontal momentum equation
+    problem.add_equation("dt(u) - NU*dx(dx(u)) - NU*dz(uz) + dx(p) + (SL-1)*u"
+                        + "= - (u*dx(u) + w*uz)")
+    #   Vertical momentum equation
+    problem.add_equation("dt(w) - NU*dx(dx(w)) - NU*dz(wz) + dz(p) - b + (SL-1)*w"
+                        + "= - (u*dx(w) + w*wz)")
+    # Required for solving differential equations in Chebyshev dimension
+    problem.add_equation("bz - dz(b) = 0")
+    problem.add_equation("uz - dz(u) = 0")
+    problem.add_equation("wz - dz(w) = 0")
+
+    ###########################################################################
+    # Boundary contitions
+    #	Using Fourier basis for x automatically enforces periodic bc's
+    #   Left is bottom, right is top
+    # Solid top/bottom boundaries
+    problem.add_bc("left(u) = 0")
+    problem.add_bc("right(u) = right(fu)")
+    # Free top/bottom boundaries
+    #problem.add_bc("left(uz) = 0")
+    #problem.add_bc("right(uz) = 0")
+    # No-slip top/bottom boundaries?
+    problem.add_bc("left(w) = 0", condition="(nx != 0)") # redunant in constant mode (nx==0)
+    problem.add_bc("right(w) = right(fw)")
+    # Buoyancy = zero at top/bottom
+    problem.add_bc("left(b) = 0")
+    problem.add_bc("right(b) = right(fb)")
+    # Sets gauge pressure to zero in the constant mode
+    problem.add_bc("left(p) = 0", condition="(nx == 0)") # required because of above redundancy
+    return problem
 
 ###############################################################################
 # Build solver
-solver = problem.build_solver(de.timesteppers.RK222)
-logger.info('Solver built')
+# Parameters which enter the LHS matrices, used to key the matrix cache
+lhs_parameters = ['NU', 'KA', 'N0', 'BP', 'SL']
+
+def get_timestepper(sbp):
+    # Timestepper class named in the switchboard
+    timestepper = getattr(de.timesteppers, sbp.timestepper, None)
+    if timestepper is None:
+        raise ValueError("Unknown timestepper '{}'".format(sbp.timestepper))
+    return timestepper
+
+def build_solver(problem, sbp):
+    timestepper = get_timestepper(sbp)
+    if sbp.use_matrix_cache:
+        solver = matrix_cache.build_solver(problem, timestepper, sbp.matrix_cache_dir,
+                                           lhs_parameters, keep=sbp.matrix_cache_keep)
+    else:
+        solver = problem.build_solver(timestepper)
+    logger.info('Solver built')
+    return solver
 
 ###############################################################################
-# Initial conditions or restart
-if not pathlib.Path(sbp.restart_file).exists():
-
-    # Initial conditions
-    #x = domain.grid(0)
-    #z = domain.grid(1)
-    b = solver.state['b']
-    bz = solver.state['bz']
-
-    # Random perturbations, initialized globally for same results in parallel
-    gshape = domain.dist.grid_layout.global_shape(scales=1)
-    slices = domain.dist.grid_layout.slices(scales=1)
-    rand = np.random.RandomState(seed=42)
-    noise = rand.standard_normal(gshape)[slices]
-
-    # Linear background + perturbations damped at walls
-    zb, zt = z_basis.interval
-    pert =  1e-3 * noise * (zt - z) * (z - zb)
-    b['g'] = pert * 0.0 # F * pert
-    b.differentiate('z', out=bz)
-
-    # Timestepping and output
-    dt = sbp.dt
-    stop_sim_time = sbp.stop_sim_time
-    fh_mode = 'overwrite'
-
-else:
-    # Restart
-    write, last_dt = solver.load_state(restart_file, -1)
-
-    # Timestepping and output
-    dt = last_dt
-    stop_sim_time = sbp.stop_sim_time + sbp.restart_add_time
-    fh_mode = 'append'
+# Hash of the switchboard and physics parameters, to only resume checkpoints
+#   and reuse solvers under the same physics
+def physics_hash(domain, sbp):
+    # Profiles on the global z grid, so all processes agree on the hash
+    z_global = domain.bases[1].grid(1)
+    bg_profiles = [sbp.build_bp_array(z_global), sbp.build_sl_array(z_global)]
+    return sweep.physics_key(sbp, bg_profiles)
+
+def truncate_snapshots(sbp, sim_time, comm):
+    # Drop the snapshots written after a checkpoint, before the run stopped
+    if comm.rank == 0:
+        for snapshot_directory in [sbp.snapshots_dir, sbp.snapshots_dir + '/' + sbp.bp_snap_dir,
+                                   sbp.snapshots_dir + '/' + sbp.sl_snap_dir]:
+            dropped = truncate_sets(snapshot_directory, sim_time)
+            if dropped:
+                logger.info('Dropped %i writes of %s after the checkpoint' %(dropped, snapshot_directory))
+    comm.Barrier()
 
 ###############################################################################
-# Integration parameters
-solver.stop_sim_time  = stop_sim_time # deliberately not sbp
-solver.stop_wall_time = sbp.stop_wall_time * 60.0 # to get minutes
-solver.stop_iteration = sbp.stop_iteration
+# Initial conditions, resuming from a checkpoint, or restart
+def set_initial_conditions(solver, sbp, extend_n_periods=0.0, physics=None):
+    domain = solver.domain
+    comm = domain.dist.comm_cart
+    z_basis = domain.bases[1]
+    # Find the newest checkpoint of an unfinished run to resume from, or of
+    #   any run to extend
+    checkpoint, meta = None, None
+    if extend_n_periods > 0 and not sbp.use_checkpoints:
+        raise ValueError('Extending a run needs use_checkpoints = True')
+    if sbp.use_checkpoints:
+        checkpoint, meta = checkpoints.find_latest(sbp.checkpoint_dir, comm)
+        if extend_n_periods > 0:
+            if checkpoint is None:
+                raise NameError('No checkpoint found in {} to extend the run from'.format(sbp.checkpoint_dir))
+        elif checkpoint is not None and meta['sim_time'] >= sbp.stop_sim_time:
+            logger.info('Newest checkpoint is from a finished run, starting over')
+            checkpoint = None
+
+    if checkpoint is not None:
+        # Resume, under the same physics, without repeating snapshot writes
+        dt = checkpoints.load_state(solver, checkpoint, meta, physics)
+        truncate_snapshots(sbp, meta['sim_time'], comm)
+
+        # Timestepping and output
+        stop_sim_time = sbp.stop_sim_time
+        if extend_n_periods > 0:
+            # Continue from the end of the previous run
+            stop_sim_time = meta['sim_time'] + extend_n_periods * sbp.T
+            logger.info('Extending the run by %f periods' %extend_n_periods)
+        fh_mode = 'append'
+
+    elif pathlib.Path(sbp.restart_file).exists():
+        # Restart, which needs every variable of the state
+        with h5py.File(sbp.restart_file, mode='r') as file:
+            missing = [field.name for field in solver.state.fields if field.name not in file['tasks']]
+        if missing:
+            raise ValueError("%s lacks the state variables %s, save snapshots with snap_tasks = None to restart from them" %(sbp.restart_file, missing))
+        write, last_dt = solver.load_state(sbp.restart_file, -1)
+
+        # Timestepping and output
+        dt = last_dt
+        stop_sim_time = sbp.stop_sim_time + sbp.restart_add_time
+        fh_mode = 'append'
+
+    else:
+        # Checkpoints of a previous run would be picked up by a later resume
+        if sbp.use_checkpoints:
+            checkpoints.clear(sbp.checkpoint_dir, comm)
+
+        # Initial conditions
+        #x = domain.grid(0)
+        z = domain.grid(1)
+        b = solver.state['b']
+        bz = solver.state['bz']
+
+        # Random perturbations, generated from each point's global position
+        #   so each process only builds its own part, with the same results
+        #   in parallel
+        gshape = domain.dist.grid_layout.global_shape(scales=1)
+        slices = domain.dist.grid_layout.slices(scales=1)
+        noise = local_noise(42, gshape, slices)
+
+        # Linear background + perturbations damped at walls
+        zb, zt = z_basis.interval
+        pert =  1e-3 * noise * (zt - z) * (z - zb)
+        b['g'] = pert * 0.0 # F * pert
+        b.differentiate('z', out=bz)
+
+        # Timestepping and output
+        dt = sbp.dt
+        stop_sim_time = sbp.stop_sim_time
+        fh_mode = 'overwrite'
+    return dt, stop_sim_time, fh_mode
 
 ###############################################################################
 # Analysis
-def add_new_file_handler(snapshot_directory):
-    return solver.evaluator.add_file_handler(snapshot_directory, sim_dt=sbp.snap_dt, max_writes=sbp.snap_max_writes, mode=fh_mode)
-# Add file handler for snapshots and output state of variables
-snapshots = add_new_file_handler(sbp.snapshots_dir)
-snapshots.add_system(solver.state)
-# Add file handler for bp snaps and add corresponding task
-if sbp.take_bp_snaps:
-    bp_snapshots = add_new_file_handler(sbp.snapshots_dir + '/' + sbp.bp_snap_dir)
-    bp_snapshots.add_task(sbp.bp_task, layout='g', name=sbp.bp_task_name)
-# Add file handler for sl snaps and add corresponding task
-if sbp.take_sl_snaps:
-    sl_snapshots = add_new_file_handler(sbp.snapshots_dir + '/'  + sbp.sl_snap_dir)
-    sl_snapshots.add_task(sbp.sl_task, layout='g', name=sbp.sl_task_name)
-
-###############################################################################
-# CFL
-CFL = flow_tools.CFL(solver, initial_dt=dt, cadence=sbp.CFL_cadence,
-                     safety=sbp.CFL_safety, max_change=sbp.CFL_max_change,
-                     min_change=sbp.CFL_min_change, max_dt=sbp.CFL_max_dt,
-                     threshold=sbp.CFL_threshold)
-CFL.add_velocities(('u', 'w'))
+def add_file_handlers(solver, sbp, fh_mode):
+    # One file per set written by all processes, if parallel HDF5 is available
+    parallel = sbp.snap_parallel and parallel_available()
+    if sbp.snap_parallel and not parallel:
+        logger.info('h5py was built without MPI, writing one file per process')
+    def add_new_file_handler(snapshot_directory):
+        # Chunking and compression of the datasets set in the switchboard
+        handler = FileHandlerMod(snapshot_directory, solver.domain, solver.evaluator.vars,
+                                 sim_dt=sbp.snap_dt, max_writes=sbp.snap_max_writes, mode=fh_mode, parallel=parallel,
+                                 chunk_writes=sbp.snap_chunk_writes, compression=sbp.snap_compression,
+                                 compression_opts=sbp.snap_compression_opts, shuffle=sbp.snap_shuffle,
+                                 precision=sbp.snap_precision)
+        solver.evaluator.add_handler(handler)
+        return handler
+    # Add file handler for snapshots and output state of variables
+    if sbp.snap_use_region:
+        # Only the region of interest, gathered and written by the root process
+        if sbp.snap_layout != 'g':
+            raise ValueError("snap_use_region only saves grid data, set snap_layout = 'g'")
+        if sbp.snap_parallel:
+            raise ValueError("snap_use_region writes from the root process, set snap_parallel = False")
+        snapshots = RegionFileHandler(sbp.snapshots_dir, solver.domain, solver.evaluator.vars,
+                                      ranges=(sbp.snap_region_x, sbp.snap_region_z), decimate=sbp.snap_decimate,
+                                      sim_dt=sbp.snap_dt, max_writes=sbp.snap_max_writes, mode=fh_mode,
+                                      chunk_writes=sbp.snap_chunk_writes,
+                                      compression=sbp.snap_compression, compression_opts=sbp.snap_compression_opts,
+                                      shuffle=sbp.snap_shuffle, precision=sbp.snap_precision)
+        solver.evaluator.add_handler(snapshots)
+    else:
+        snapshots = add_new_file_handler(sbp.snapshots_dir)
+    if sbp.snap_tasks is None:
+        # The whole state, which restart.h5 can be made from
+        snapshots.add_system(solver.state, layout=sbp.snap_layout)
+    else:
+        # Only the variables and derived expressions chosen in the switchboard
+        for name, task in sbp.snap_tasks.items():
+            snapshots.add_task(task, layout=sbp.snap_layout, name=name)
+    # BP and SL never change, so write them once as 1D profiles instead
+    if sbp.static_profiles:
+        write_static_profiles(solver, sbp)
+        return snapshots
+    # Add file handler for bp snaps and add corresponding task
+    if sbp.take_bp_snaps:
+        bp_snapshots = add_new_file_handler(sbp.snapshots_dir + '/' + sbp.bp_snap_dir)
+        bp_snapshots.add_task(sbp.bp_task, layout='g', name=sbp.bp_task_name)
+    # Add file handler for sl snaps and add corresponding task
+    if sbp.take_sl_snaps:
+        sl_snapshots = add_new_file_handler(sbp.snapshots_dir + '/'  + sbp.sl_snap_dir)
+        sl_snapshots.add_task(sbp.sl_task, layout='g', name=sbp.sl_task_name)
+    return snapshots
+
+def write_static_profiles(solver, sbp):
+    # Evaluates the BP and SL tasks once and writes their vertical profiles
+    from dedalus.core.future import FutureField
+    domain = solver.domain
+    comm = domain.dist.comm_cart
+    z_slice = domain.dist.grid_layout.slices(scales=1)[1]
+    tasks = []
+    if sbp.take_bp_snaps:
+        tasks.append((sbp.bp_task_name, sbp.bp_task))
+    if sbp.take_sl_snaps:
+        tasks.append((sbp.sl_task_name, sbp.sl_task))
+    local = {}
+    for name, task in tasks:
+        field = FutureField.parse(task, solver.evaluator.vars, domain)
+        if isinstance(field, FutureField):
+            field = field.evaluate()
+        field.set_scales(1)
+        # Constant in x, so any row holds the local part of the profile
+        local[name] = np.copy(field['g'][0])
+    # Assemble the profiles on the global z grid on the root process
+    pieces = comm.gather((z_slice.start, local), root=0)
+    if comm.rank == 0:
+        z = domain.bases[1].grid(1)
+        full = {name: (task, np.zeros(z.size)) for name, task in tasks}
+        for start, part in pieces:
+            for name, profile in part.items():
+                full[name][1][start:start+profile.size] = profile
+        profiles.write_profiles(sbp.snapshots_dir + '/' + profiles.profiles_name, z, full,
+                                attrs={'N_0': sbp.N_0, 'bp_module': sbp.bp_module})
 
 ###############################################################################
-# Flow properties
-flow = flow_tools.GlobalFlowProperty(solver, cadence=sbp.flow_cadence)
-flow.add_property(sbp.flow_property, name=sbp.flow_name)
+# Run one experiment on a built solver
+def run_experiment(solver, sbp, extend_n_periods=0.0):
+    domain = solver.domain
+    physics = physics_hash(domain, sbp)
+    dt, stop_sim_time, fh_mode = set_initial_conditions(solver, sbp, extend_n_periods, physics)
+
+    ###########################################################################
+    # Integration parameters
+    solver.stop_sim_time  = stop_sim_time # deliberately not sbp
+    solver.stop_wall_time = sbp.stop_wall_time * 60.0 # to get minutes
+    solver.stop_iteration = sbp.stop_iteration
+
+    add_file_handlers(solver, sbp, fh_mode)
+    # Forcing period for the snapshot index, which does not import the switchboard
+    if domain.dist.comm_cart.rank == 0:
+        snapshot_index.write_period(sbp.snapshots_dir, sbp.T)
+
+    ###########################################################################
+    # CFL
+    CFL = flow_tools.CFL(solver, initial_dt=dt, cadence=sbp.CFL_cadence,
+                         safety=sbp.CFL_safety, max_change=sbp.CFL_max_change,
+                         min_change=sbp.CFL_min_change, max_dt=sbp.CFL_max_dt,
+                         threshold=sbp.CFL_threshold)
+    CFL.add_velocities(('u', 'w'))
+
+    ###########################################################################
+    # Flow properties, reduced across processes without blocking, so the
+    #   values logged are from one cadence earlier
+    flow = diagnostics.Diagnostics(solver, cadence=sbp.flow_cadence)
+    flow.add_property(sbp.flow_property, name=sbp.flow_name)
+
+    ###########################################################################
+    # Checkpoints
+    checkpointer = None
+    if sbp.use_checkpoints:
+        checkpointer = checkpoints.Checkpointer(solver, sbp.checkpoint_dir,
+                         iter=sbp.checkpoint_iter, wall_dt=sbp.checkpoint_wall_dt,
+                         keep=sbp.checkpoint_keep, physics=physics)
+
+    ###########################################################################
+    # Wall time budget, to stop in time to write a final checkpoint
+    budget = None
+    if sbp.use_wall_budget:
+        budget = wall_budget.WallBudget(solver, sbp.stop_wall_time, end_env=sbp.wall_end_env,
+                         safety_factor=sbp.wall_safety_factor, margin=sbp.wall_margin)
+        budget.watch_file_handlers(solver.evaluator.handlers)
+        if checkpointer:
+            budget.watch_checkpointer(checkpointer)
+
+    ###########################################################################
+    # Per-phase timing of the main loop
+    profiler = step_profiler.StepProfiler(domain.dist.comm_cart, enabled=sbp.profile_steps)
+    profiler.instrument_solver(solver)
+
+    ###########################################################################
+    # Set logger parameters if using stop_time or stop_oscillations
+    use_sst = sbp.use_stop_sim_time
+    if use_sst:
+        endtime_str   = 'Sim end time: %f'
+        iteration_str = 'Iteration: %i, Time: %e, dt: %e'
+        time_factor   = 1.0
+    else:
+        endtime_str   = 'Sim end period: %f'
+        iteration_str = 'Iteration: %i, t/T: %e, dt/T: %e'
+        time_factor   = sbp.T
+
+    ###########################################################################
+    # Main loop
+    try:
+        logger.info(endtime_str %(solver.stop_sim_time/time_factor))
+        logger.info('Starting loop')
+        start_time = time.time()
+        while solver.ok:
+            # Adaptive time stepping controlled from switchboard
+            if (sbp.adapt_dt):
+                with profiler.phase('cfl'):
+                    dt = CFL.compute_dt()
+            step_start = time.time()
+            with profiler.phase('step'):
+                dt = solver.step(dt)
+            if budget:
+                budget.record_step(time.time() - step_start)
+            with profiler.phase('flow'):
+                new_flow = flow.update()
+            if new_flow:
+                logger.info(iteration_str %(solver.iteration, solver.sim_time/time_factor, dt/time_factor))
+                logger.info(sbp.flow_log_message.format(flow.max(sbp.flow_name)))
+                if flow.blew_up():
+                    raise NameError('Code blew up it seems')
+            if checkpointer:
+                with profiler.phase('checkpoint'):
+                    checkpointer.check(dt)
+            if budget and budget.should_stop():
+                logger.info('Stopping before the wall time limit')
+                break
+        # Final state, to extend the run from later
+        if checkpointer:
+            checkpointer.write(dt)
+        # Collective, so only after a normal end of the loop
+        profiler.report(sbp.snapshots_dir + '/' + sbp.profile_report, solver.iteration - solver.initial_iteration)
+    except:
+        logger.error('Exception raised, triggering end of main loop.')
+        raise
+    finally:
+        # Also on the exception path, so no reduction is left outstanding
+        flow.finish()
+        end_time = time.time()
+        logger.info('Iterations: %i' %solver.iteration)
+        logger.info(endtime_str %(solver.sim_time/time_factor))
+        logger.info('Run time: %.2f sec' %(end_time-start_time))
+        logger.info('Run time: %f cpu-hr' %((end_time-start_time)/60/60*domain.dist.comm_cart.size))
 
 ###############################################################################
-# Set logger parameters if using stop_time or stop_oscillations
-use_sst = sbp.use_stop_sim_time
-if use_sst:
-    endtime_str   = 'Sim end time: %f'
-    iteration_str = 'Iteration: %i, Time: %e, dt: %e'
-    time_factor   = 1.0
-else:
-    endtime_str   = 'Sim end period: %f'
-    iteration_str = 'Iteration: %i, t/T: %e, dt/T: %e'
-    time_factor   = sbp.T
+# Parameter sweep
+def run_sweep(domain, sbp):
+    solver = None
+    last_key = None
+    last_params = sbp
+    for index, overrides in enumerate(sbp.sweep_overrides):
+        params = sweep.apply_overrides(sbp, overrides, index)
+        logger.info('Sweep point %i of %i: %s' %(index+1, len(sbp.sweep_overrides), overrides))
+        if rank == 0:
+            sweep.write_sweep_point(params, overrides, index)
+        # Only rebuild the domain if the grid itself has changed
+        if sweep.domain_key(params) != sweep.domain_key(last_params):
+            logger.info('Sweep point changes the grid, rebuilding domain')
+            domain = build_domain(params)
+        last_params = params
+        key = physics_hash(domain, params)
+        if key == last_key:
+            # Same physics as the previous point, reuse the solver
+            logger.info('Reusing solver from previous sweep point')
+            sweep.reset_solver(solver, get_timestepper(params))
+        else:
+            solver = build_solver(build_problem(domain, params), params)
+            last_key = key
+        run_experiment(solver, params)
 
 ###############################################################################
-# Main loop
-try:
-    logger.info(endtime_str %(solver.stop_sim_time/time_factor))
-    logger.info('Starting loop')
-    start_time = time.time()
-    while solver.ok:
-        # Adaptive time stepping controlled from switchboard
-        if (sbp.adapt_dt):
-            dt = CFL.compute_dt()
-        dt = solver.step(dt)
-        if (solver.iteration-1) % 10 == 0:
-            logger.info(iteration_str %(solver.iteration, solver.sim_time/time_factor, dt/time_factor))
-            logger.info(sbp.flow_log_message.format(flow.max(sbp.flow_name)))
-            if np.isnan(flow.max(sbp.flow_name)):
-                raise NameError('Code blew up it seems')
-except:
-    logger.error('Exception raised, triggering end of main loop.')
-    raise
-finally:
-    end_time = time.time()
-    logger.info('Iterations: %i' %solver.iteration)
-    logger.info(endtime_str %(solver.sim_time/time_factor))
-    logger.info('Run time: %.2f sec' %(end_time-start_time))
-    logger.info('Run time: %f cpu-hr' %((end_time-start_time)/60/60*domain.dist.comm_cart.size))
+if __name__ == "__main__":
+    switchboard, extend_n_periods = parse_arguments(sys.argv)
+    logger.info('Using switchboard: %s' %switchboard)
+    domain = build_domain(sbp)
+    if len(sbp.sweep_overrides) > 0:
+        run_sweep(domain, sbp)
+    else:
+        solver = build_solver(build_problem(domain, sbp), sbp)
+        run_experiment(solver, sbp, extend_n_periods)
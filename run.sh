@@ -2,9 +2,12 @@
 # A bash script to run the Dedalus python code for a certain experiment
 # Takes in arguments:
 #	$ sh run.sh -n <name of experiment> <- not optional
-#				-c <cores>
+#				-c <cores, or auto to choose from the resolution>
 #				-l <local(1) or Niagara(0)>
 #				-v <version: what scripts to run>
+#				-e <periods to extend a finished run by, from its last checkpoint>
+#				-r <1 to resume a killed run from its newest checkpoint>
+#				-p <1 to encode the gif and mp4 while plotting, 0 to write pngs first>
 
 # if:
 # VER = 0 (Full)
@@ -18,7 +21,7 @@
 # VER = 4
 #	-> create mp4 from frames
 
-while getopts n:c:l:v: option
+while getopts n:c:l:v:e:r:p: option
 do
 	case "${option}"
 		in
@@ -26,6 +29,9 @@ do
 		c) CORES=${OPTARG};;
 		l) LOC=${OPTARG};;
 		v) VER=${OPTARG};;
+		e) EXTEND=${OPTARG};;
+		r) RESUME=${OPTARG};;
+		p) STREAM=${OPTARG};;
 	esac
 done
 
@@ -76,7 +82,20 @@ if [ -e _experiments/$NAME/run_${NAME}.sh ]
 then
 	echo "Executing experiment run file: run_${NAME}.sh"
 	echo ''
-	bash _experiments/$NAME/run_${NAME}.sh -n $NAME -c $CORES -l $LOC -v $VER
+	RUN_ARGS="-n $NAME -c $CORES -l $LOC -v $VER"
+	if [ ! -z "$EXTEND" ]
+	then
+		RUN_ARGS="$RUN_ARGS -e $EXTEND"
+	fi
+	if [ ! -z "$RESUME" ]
+	then
+		RUN_ARGS="$RUN_ARGS -r $RESUME"
+	fi
+	if [ ! -z "$STREAM" ]
+	then
+		RUN_ARGS="$RUN_ARGS -p $STREAM"
+	fi
+	bash _experiments/$NAME/run_${NAME}.sh $RUN_ARGS
 else
 	echo 'Experiment run file does not exist. Aborting script'
 	exit 1
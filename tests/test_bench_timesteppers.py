@@ -0,0 +1,45 @@
+"""
+The search for the stability limit of a timestepper in bench_timesteppers.py
+
+Run from the repository root:
+    $ python3 -m pytest tests
+
+"""
+
+import sys
+import pathlib
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath('_modules_other')))
+from bench_timesteppers import largest_stable
+
+###############################################################################
+
+def threshold(n_limit, calls):
+    # Stable for at least n_limit steps per period, recording each run
+    def stable(n):
+        calls.append(n)
+        return ('wall', n) if n >= n_limit else None
+    return stable
+
+@pytest.mark.parametrize('n_limit', [1, 3, 7, 8, 9, 25, 63, 64])
+@pytest.mark.parametrize('n_start', [1, 8, 64])
+def test_finds_limit(n_limit, n_start):
+    calls = []
+    n, result = largest_stable(threshold(n_limit, calls), n_start, 64, n_bisect=10)
+    assert n == n_limit
+    assert result == ('wall', n_limit)
+    # Each number of steps is only run once
+    assert len(calls) == len(set(calls))
+
+def test_bisection_limit():
+    # With too few bisection steps, the stable end of the bracket is returned
+    calls = []
+    n, result = largest_stable(threshold(37, calls), 8, 64, n_bisect=1)
+    assert n in calls and n >= 37
+
+def test_never_stable():
+    calls = []
+    assert largest_stable(threshold(100, calls), 8, 64, n_bisect=10) is None
+    assert calls[-1] == 64
@@ -0,0 +1,53 @@
+"""
+Frames must be scheduled in time order, whatever the order of the set files
+
+Run from the repository root:
+    $ python3 -m pytest tests
+
+"""
+
+import sys
+import pathlib
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath('_modules_other')))
+import frame_scheduler
+
+###############################################################################
+
+n_sets = 12
+writes_per_set = 3
+
+def make_sets(base_path):
+    # Set files of a handler, with the sim time of each write
+    paths = []
+    for set_num in range(1, n_sets+1):
+        path = base_path.joinpath('snapshots_s{:d}.h5'.format(set_num))
+        with h5py.File(str(path), mode='w') as file:
+            start = (set_num - 1) * writes_per_set
+            file['scales/sim_time'] = 0.25 * np.arange(start, start + writes_per_set)
+            file.attrs['writes'] = writes_per_set
+        paths.append(str(path))
+    return paths
+
+def sim_times(writes):
+    times = []
+    for path, index in writes:
+        with h5py.File(path, mode='r') as file:
+            times.append(file['scales/sim_time'][index])
+    return times
+
+def test_writes_in_set_order(tmp_path):
+    # In the order of a shell glob, snapshots_s10.h5 comes before snapshots_s2.h5
+    paths = sorted(make_sets(tmp_path))
+    assert pathlib.Path(paths[1]).name == 'snapshots_s10.h5'
+    writes = frame_scheduler.list_writes(paths)
+    assert len(writes) == n_sets * writes_per_set
+    times = sim_times(writes)
+    assert np.all(np.diff(times) > 0)
+
+def test_set_number():
+    assert frame_scheduler.set_number('snapshots/snapshots_s12.h5') == 12
+    assert frame_scheduler.set_number(pathlib.Path('bp_snaps_s3.h5')) == 3
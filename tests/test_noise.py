@@ -0,0 +1,49 @@
+"""
+The initial noise must not depend on how the grid is split between processes
+
+Run from the repository root:
+    $ python3 -m pytest tests
+
+"""
+
+import sys
+import pathlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath('_modules_other')))
+from noise import local_noise
+
+###############################################################################
+
+gshape = (64, 96)
+seed = 42
+
+def split(n, parts):
+    # Contiguous blocks, as in the Dedalus distributor
+    block = -(-n // parts)
+    return [slice(min(i*block, n), min((i+1)*block, n)) for i in range(parts)]
+
+def assemble(mesh):
+    # Global field built from the local noise of each simulated process
+    field = np.zeros(gshape)
+    for sx in split(gshape[0], mesh[0]):
+        for sz in split(gshape[1], mesh[1]):
+            field[sx, sz] = local_noise(seed, gshape, (sx, sz))
+    return field
+
+@pytest.mark.parametrize('mesh', [(1, 2), (1, 3), (4, 1), (2, 5), (3, 7), (1, 96)])
+def test_independent_of_decomposition(mesh):
+    # Bitwise equal to the noise generated on one process
+    reference = assemble((1, 1))
+    assert np.array_equal(assemble(mesh), reference)
+
+def test_statistics():
+    field = assemble((1, 1))
+    assert abs(field.mean()) < 0.05
+    assert abs(field.std() - 1.0) < 0.05
+
+def test_seed():
+    full = (slice(None), slice(None))
+    assert not np.array_equal(local_noise(seed, gshape, full), local_noise(seed + 1, gshape, full))